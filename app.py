@@ -1,12 +1,40 @@
 import os
 import psycopg2
-from openai import OpenAI
-from flask import Flask, request, jsonify
+from flask import Flask, Response, g, request, jsonify, stream_with_context
 from flask_cors import CORS # Add this import
 from dotenv import load_dotenv
 import re
+import base64
+import csv
+from contextlib import contextmanager
 from datetime import datetime, timedelta
 import json
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from db_pool import ConnectionPool, ObservedCursor
+from embedding_cache import EmbeddingCache
+from bulk_import import BulkImporter, read_tickets
+from job_queue import JobQueue, StageStats, WorkerPool, enqueue_enrichment, hold_claim
+from pipeline import Stage, StagePipeline
+from vector_index import VectorSearch, index_settings_from_env
+from memory_index import MemoryVectorIndex, memory_index_settings_from_env
+from hybrid_search import HybridSearch, hybrid_settings_from_env
+from resolutions import RESPONSE_TYPES, refresh_resolution, resolution_settings_from_env
+from response_cache import MemoryBackend, RedisBackend, ResponseCache
+from events import EventBroadcaster
+from dedup import DuplicateDetector, dedup_settings_from_env
+from local_classifier import LocalClassifier, local_classifier_settings_from_env
+from semantic_cache import SemanticResponseCache, semantic_cache_settings_from_env
+from prompts import PromptBuilder, count_tokens, prompt_settings_from_env
+from providers import LocalProvider, ModelClient, OpenAIProvider, parse_rate_limits
+from migrations import MIGRATIONS
+from metrics import Registry
+from tracing import JsonlExporter, MemoryExporter
+import tracing
+import random
+import queue
+import io
 
 # Load environment variables
 load_dotenv('ai_env.env')
@@ -15,124 +43,281 @@ load_dotenv('ai_env.env')
 app = Flask(__name__)
 CORS(app) # NEW LINE: This enables CORS for all routes
 
-# Initialize OpenAI client
-client = OpenAI(api_key=os.getenv('OPENAI_API_KEY'))
+# Metrics (GET /metrics) and optional span tracing
+metrics = Registry()
+HTTP_SECONDS = metrics.histogram('http_request_duration_seconds', 'Time to produce a response, by route',
+                                 ['method', 'route', 'status'])
+STAGE_SECONDS = metrics.histogram('ticket_stage_duration_seconds', 'Enrichment and write stage latency',
+                                  ['stage'])
+STAGE_EVENTS = metrics.counter('ticket_stage_events', 'Enrichment stage timeouts and fallbacks',
+                               ['stage', 'event'])
+DB_SECONDS = metrics.histogram('db_query_duration_seconds', 'Statement execution time', ['statement'])
+DB_ERRORS = metrics.counter('db_query_errors', 'Statements that raised', ['statement'])
+
+def configure_tracing():
+    exporter = os.getenv('TRACING_EXPORTER', '')
+    if exporter == 'memory':
+        tracing.configure(MemoryExporter(), float(os.getenv('TRACING_SAMPLE_RATE', 1.0)))
+    elif exporter == 'jsonl':
+        tracing.configure(JsonlExporter(os.getenv('TRACING_EXPORT_PATH', 'traces.jsonl')),
+                          float(os.getenv('TRACING_SAMPLE_RATE', 1.0)))
+
+configure_tracing()
+
+# "SELECT support_tickets", "INSERT ticket_responses", ... (bounded label values)
+QUERY_TABLE_PATTERN = re.compile(r'\b(?:FROM|INTO|UPDATE)\s+([a-z_]+)', re.IGNORECASE)
+
+def query_label(query):
+    if isinstance(query, bytes):
+        query = query[:500].decode('utf-8', 'replace')
+    else:
+        query = str(query)[:500]
+    words = query.split(None, 1)
+    verb = words[0].upper() if words else ''
+    table = QUERY_TABLE_PATTERN.search(query)
+    return f"{verb} {table.group(1).lower()}" if table else verb
+
+@contextmanager
+def observe_query(query):
+    statement = query_label(query)
+    started = time.perf_counter()
+    try:
+        with tracing.span('db.query', statement=statement):
+            yield
+    except Exception:
+        DB_ERRORS.inc(statement=statement)
+        raise
+    finally:
+        DB_SECONDS.observe(time.perf_counter() - started, statement=statement)
+
+ObservedCursor.observe = observe_query
+
+# Model provider: 'openai', or 'local' for the deterministic offline models.
+# Every model call goes through model_client for rate limiting, retries and
+# circuit breaking.
+CHAT_MODEL = os.getenv('CHAT_MODEL', 'gpt-3.5-turbo')
+
+def build_model_client():
+    if os.getenv('MODEL_PROVIDER', 'openai') == 'local':
+        provider = LocalProvider()
+    else:
+        provider = OpenAIProvider(os.getenv('OPENAI_API_KEY'), timeout=float(os.getenv('OPENAI_TIMEOUT', 60)))
+    return ModelClient(
+        provider,
+        rate_limits=parse_rate_limits(os.getenv('MODEL_RATE_LIMITS', '')),
+        max_retries=int(os.getenv('MODEL_MAX_RETRIES', 3)),
+        base_delay=float(os.getenv('MODEL_RETRY_BASE_DELAY', 0.5)),
+        max_delay=float(os.getenv('MODEL_RETRY_MAX_DELAY', 20)),
+        rate_limit_timeout=float(os.getenv('MODEL_RATE_LIMIT_TIMEOUT', 30)),
+        breaker_threshold=int(os.getenv('MODEL_BREAKER_THRESHOLD', 5)),
+        breaker_reset=float(os.getenv('MODEL_BREAKER_RESET', 30)),
+        embed_batch_size=int(os.getenv('EMBEDDING_BATCH_SIZE', 64)),
+        embed_batch_wait=float(os.getenv('EMBEDDING_BATCH_WAIT_MS', 5)) / 1000
+    )
+
+model_client = build_model_client()
 
 # Database connection
+def get_db_settings():
+    return {
+        'host': os.getenv('DB_HOST', 'localhost'),
+        'database': os.getenv('DB_NAME', 'support_ai_db'),
+        'user': os.getenv('DB_USER', 'postgres'),
+        'password': os.getenv('DB_PASSWORD', 'password'),
+        'port': os.getenv('DB_PORT', '5432')
+    }
+
+# Connection pool (created lazily so each process builds its own)
+db_pool = None
+db_pool_lock = threading.Lock()
+
+def get_db_pool():
+    global db_pool
+    if db_pool is None:
+        with db_pool_lock:
+            if db_pool is None:
+                db_pool = ConnectionPool(
+                    dict(get_db_settings(), cursor_factory=ObservedCursor),
+                    min_size=int(os.getenv('DB_POOL_MIN_SIZE', 1)),
+                    max_size=int(os.getenv('DB_POOL_MAX_SIZE', 10)),
+                    checkout_timeout=float(os.getenv('DB_POOL_TIMEOUT', 10)),
+                    idle_timeout=float(os.getenv('DB_POOL_IDLE_TIMEOUT', 300)),
+                    health_check_interval=float(os.getenv('DB_POOL_HEALTH_CHECK_INTERVAL', 30))
+                )
+    return db_pool
+
 def get_db_connection():
-    return psycopg2.connect(
-        host=os.getenv('DB_HOST', 'localhost'),
-        database=os.getenv('DB_NAME', 'support_ai_db'),
-        user=os.getenv('DB_USER', 'postgres'),
-        password=os.getenv('DB_PASSWORD', 'password'),
-        port=os.getenv('DB_PORT', '5432')
+    return get_db_pool().getconn()
+
+def release_db_connection(conn, discard=False):
+    get_db_pool().putconn(conn, discard=discard)
+
+@contextmanager
+def db_connection():
+    # Uncommitted work is rolled back when the connection goes back to the pool
+    conn = get_db_connection()
+    try:
+        yield conn
+    finally:
+        release_db_connection(conn)
+
+# Response cache for the read endpoints
+def build_response_cache():
+    if os.getenv('RESPONSE_CACHE_BACKEND', 'memory') == 'redis':
+        backend = RedisBackend(os.getenv('REDIS_URL', 'redis://localhost:6379/0'))
+    else:
+        backend = MemoryBackend(max_entries=int(os.getenv('RESPONSE_CACHE_SIZE', 1024)))
+    return ResponseCache(
+        backend,
+        ttl=float(os.getenv('RESPONSE_CACHE_TTL', 5)),
+        enabled=os.getenv('RESPONSE_CACHE_ENABLED', 'true').lower() == 'true'
     )
 
+response_cache = build_response_cache()
+
+# Drop cached reads affected by a ticket being created or changed
+def invalidate_ticket_caches(*ticket_ids):
+    groups = ['analytics', 'tickets']
+    groups.extend(f'ticket:{ticket_id}' for ticket_id in ticket_ids if ticket_id is not None)
+    response_cache.invalidate(*groups)
+
+# Live dashboard events (Postgres LISTEN/NOTIFY fanned out over SSE)
+EVENTS_HEARTBEAT_INTERVAL = float(os.getenv('EVENTS_HEARTBEAT_INTERVAL', 15))
+
+event_broadcaster = EventBroadcaster(
+    get_db_settings(),
+    queue_size=int(os.getenv('EVENTS_QUEUE_SIZE', 256))
+)
+
+# Enrichment mode: 'sync' runs the model calls inside POST /tickets, 'async'
+# stores the ticket and leaves enrichment to the background workers
+ENRICHMENT_MODE = os.getenv('ENRICHMENT_MODE', 'sync')
+
+stage_stats = StageStats(
+    on_record=lambda stage, seconds: STAGE_SECONDS.observe(seconds, stage=stage),
+    on_mark=lambda stage, event: STAGE_EVENTS.inc(stage=stage, event=event)
+)
+enrichment_queue = JobQueue(
+    db_connection,
+    max_attempts=int(os.getenv('ENRICHMENT_MAX_ATTEMPTS', 5)),
+    visibility_timeout=float(os.getenv('ENRICHMENT_VISIBILITY_TIMEOUT', 600))
+)
+enrichment_workers = None
+
+def start_enrichment_workers(num_workers=None):
+    global enrichment_workers
+    num_workers = int(os.getenv('ENRICHMENT_WORKERS', 2)) if num_workers is None else num_workers
+    if enrichment_workers is None and num_workers > 0:
+        enrichment_workers = WorkerPool(enrichment_queue, process_enrichment_job, num_workers=num_workers)
+        enrichment_workers.start()
+    return enrichment_workers
+
+# Embedding cache (in-memory LRU backed by the embedding_cache table)
+EMBEDDING_MODEL = os.getenv('EMBEDDING_MODEL', 'text-embedding-3-small')
+
+embedding_cache = EmbeddingCache(
+    db_connection if os.getenv('EMBEDDING_CACHE_PERSIST', 'true').lower() == 'true' else None,
+    max_entries=int(os.getenv('EMBEDDING_CACHE_SIZE', 10000)),
+    ttl=int(os.getenv('EMBEDDING_CACHE_TTL', 7 * 24 * 3600)),
+    db_max_rows=int(os.getenv('EMBEDDING_CACHE_DB_MAX_ROWS', 1000000))
+)
+
 # Generate embeddings
+def fetch_embedding(text):
+    # Concurrent single-text calls are micro-batched into one API request
+    return model_client.embed_one(text, EMBEDDING_MODEL)
+
 def generate_embedding(text):
-    response = client.embeddings.create(
-        model="text-embedding-3-small",
-        input=text
-    )
-    return response.data[0].embedding
+    return embedding_cache.get_or_compute(text, EMBEDDING_MODEL, fetch_embedding)
 
-# Classify ticket using AI
-def classify_ticket(subject, message):
-    prompt = f"""
-    Analyze this support ticket and classify it. Return a JSON response with:
-    - category: one of [Technical Issue, Billing, Account Access, Feature Request, General Inquiry, Bug Report, Refund Request]
-    - priority: one of [Low, Medium, High, Critical]
-    - sentiment: one of [Positive, Neutral, Negative, Frustrated]
-    - urgency_keywords: list of words that indicate urgency
-    
-    Subject: {subject}
-    Message: {message}
-    
-    Consider:
-    - Keywords that indicate category
-    - Tone and language that suggests priority
-    - Emotional indicators for sentiment
-    - Urgency indicators like "urgent", "immediately", "broken", "not working"
+# Generate embeddings for many texts with one API call per batch
+def generate_embeddings(texts, batch_size=100):
+    embeddings = embedding_cache.get_many(texts, EMBEDDING_MODEL)
+    missing = list(dict.fromkeys(text for text, emb in zip(texts, embeddings) if emb is None))
     
-    Return only valid JSON.
-    """
+    fetched = {}
+    for start in range(0, len(missing), batch_size):
+        batch = missing[start:start + batch_size]
+        batch_vectors = model_client.embed(batch, EMBEDDING_MODEL)
+        fetched.update(zip(batch, batch_vectors))
+        embedding_cache.put_many(batch, EMBEDDING_MODEL, batch_vectors)
     
+    return [emb if emb is not None else fetched[text] for text, emb in zip(texts, embeddings)]
+
+# Fallbacks used when a model call fails or times out
+DEFAULT_CLASSIFICATION = {
+    "category": "General Inquiry",
+    "priority": "Medium",
+    "sentiment": "Neutral",
+    "urgency_keywords": []
+}
+DEFAULT_RESPONSE = "Thank you for contacting our support team. We have received your request and will respond shortly."
+
+# Prompts: static instructions first (a stable prefix, though too short for
+# provider prompt caching), then the ticket, trimmed to the PROMPT_* budgets
+prompt_builder = PromptBuilder(prompt_settings_from_env(), CHAT_MODEL)
+
+# Classify ticket using AI (request_classification raises on failure so the
+# enrichment pipeline can tell a fallback from a real answer)
+def request_classification(subject, message):
+    system, prompt = prompt_builder.classification(subject, message)
+    result = json.loads(model_client.chat(prompt, CHAT_MODEL, temperature=0.3, system=system,
+                                          purpose='classification'))
+    return dict(result, source='model')
+
+def classify_ticket(subject, message):
     try:
-        response = client.chat.completions.create(
-            model="gpt-3.5-turbo",
-            messages=[{"role": "user", "content": prompt}],
-            temperature=0.3
-        )
-        
-        result = json.loads(response.choices[0].message.content)
-        return result
+        return request_classification(subject, message)
     except Exception as e:
         print(f"Error classifying ticket: {e}")
-        return {
-            "category": "General Inquiry",
-            "priority": "Medium",
-            "sentiment": "Neutral",
-            "urgency_keywords": []
-        }
+        return dict(DEFAULT_CLASSIFICATION)
+
+# Build the response generation prompt: (system, prompt)
+def build_response_prompt(ticket_data, similar_tickets=None):
+    return prompt_builder.response(ticket_data, similar_tickets)
 
 # Generate AI response
-def generate_response(ticket_data, similar_tickets=None):
-    context = ""
-    if similar_tickets:
-        context = "\n\nSimilar resolved tickets:\n"
-        for ticket in similar_tickets[:2]:
-            context += f"- {ticket['subject']}: {ticket['resolution']}\n"
-    
-    prompt = f"""
-    Generate a professional, helpful response to this support ticket:
-    
-    Subject: {ticket_data['subject']}
-    Message: {ticket_data['message']}
-    Category: {ticket_data['category']}
-    Priority: {ticket_data['priority']}
-    Sentiment: {ticket_data['sentiment']}
-    {context}
-    
-    Guidelines:
-    - Be professional and empathetic
-    - Acknowledge the issue clearly
-    - Provide specific steps or solutions when possible
-    - If it's a technical issue, ask for relevant details
-    - Match the tone to the customer's sentiment
-    - Keep response concise but complete
-    - Include next steps or timeline when appropriate
-    """
-    
+def request_response(ticket_data, similar_tickets=None, prompt=None):
+    system, prompt = prompt or build_response_prompt(ticket_data, similar_tickets)
+    return model_client.chat(prompt, CHAT_MODEL, temperature=0.7, system=system, purpose='response')
+
+def generate_response(ticket_data, similar_tickets=None, prompt=None):
     try:
-        response = client.chat.completions.create(
-            model="gpt-3.5-turbo",
-            messages=[{"role": "user", "content": prompt}],
-            temperature=0.7
-        )
-        
-        return response.choices[0].message.content
+        return request_response(ticket_data, similar_tickets, prompt)
     except Exception as e:
         print(f"Error generating response: {e}")
-        return "Thank you for contacting our support team. We have received your request and will respond shortly."
+        return DEFAULT_RESPONSE
+
+# Stream an AI response token by token
+def stream_response(ticket_data, similar_tickets=None):
+    system, prompt = build_response_prompt(ticket_data, similar_tickets)
+    
+    for text in model_client.stream(prompt, CHAT_MODEL, temperature=0.7, system=system, purpose='response'):
+        yield text
 
-# Find similar tickets
-def find_similar_tickets(embedding, category, limit=3):
+# Find similar tickets: pgvector by default, SIMILARITY_BACKEND=memory for an
+# exact in-process scan (pgvector answers until its snapshot is loaded), or
+# SIMILARITY_MODE=hybrid to fuse full-text and vector rankings when the
+# ticket text is available
+vector_search = VectorSearch(index_settings_from_env())
+memory_index = MemoryVectorIndex(memory_index_settings_from_env(), db_connection, events=event_broadcaster)
+hybrid_search = HybridSearch(hybrid_settings_from_env(), vector_search)
+
+def find_similar_tickets(embedding, category, limit=3, ef_search=None, probes=None, text=None):
     try:
-        conn = get_db_connection()
-        cur = conn.cursor()
-        
-        cur.execute("""
-            SELECT id, subject, message, category, 
-                   embedding <=> %s as similarity
-            FROM support_tickets
-            WHERE category = %s AND status = 'resolved'
-            ORDER BY embedding <=> %s
-            LIMIT %s
-        """, (embedding, category, embedding, limit))
-        
-        results = cur.fetchall()
-        cur.close()
-        conn.close()
+        results = None
+        if hybrid_search.enabled and text:
+            with db_connection() as conn:
+                # Lexical matches without an embedding would have no distance
+                results = hybrid_search.search(conn, text, embedding,
+                                               ["category = %s", "status = 'resolved'", "embedding IS NOT NULL"],
+                                               [category], limit)
+        elif memory_index.enabled:
+            results = memory_index.search(embedding, category, limit)
+        if results is None:
+            with db_connection() as conn:
+                results = vector_search.search(conn, embedding, category, limit,
+                                               ef_search=ef_search, probes=probes)
         
         return [
             {
@@ -141,7 +326,7 @@ def find_similar_tickets(embedding, category, limit=3):
                 'message': row[2],
                 'category': row[3],
                 'similarity': float(row[4]),
-                'resolution': 'Sample resolution...'  # In real system, you'd store actual resolutions
+                'resolution': row[5]
             }
             for row in results
         ]
@@ -149,70 +334,529 @@ def find_similar_tickets(embedding, category, limit=3):
         print(f"Error finding similar tickets: {e}")
         return []
 
+# Local kNN classifier over stored embeddings; the model is only asked when
+# the local prediction is not confident enough
+local_classifier = LocalClassifier(local_classifier_settings_from_env(), db_connection)
+
+def learn_classification(embedding, classification):
+    if classification.get('source') == 'model':
+        local_classifier.add(embedding, classification)
+
+def shadow_classify(subject, message, embedding, local):
+    # Model check on a sample of accepted local predictions, off the request path
+    try:
+        classification = classify_ticket(subject, message)
+        if classification.get('source') == 'model':
+            local_classifier.record_agreement(local, classification, accepted=True)
+            local_classifier.add(embedding, classification)
+    except Exception as e:
+        print(f"Error in shadow classification: {e}")
+
+def classify_locally(subject, message, embedding):
+    result = local_classifier.predict(embedding)
+    if result is not None and local_classifier.confident(result[1]):
+        local_classifier.record_decision(used_local=True)
+        if random.random() < local_classifier.settings['shadow_rate']:
+            enrichment_executor.submit(shadow_classify, subject, message, embedding, result[0])
+        return dict(result[0], source='local')
+    
+    local_classifier.record_decision(used_local=False)
+    classification = request_classification(subject, message)
+    if result is not None:
+        local_classifier.record_agreement(result[0], classification, accepted=False)
+    learn_classification(embedding, classification)
+    return classification
+
+# Semantic cache of generated responses
+semantic_cache = SemanticResponseCache(semantic_cache_settings_from_env(), db_connection)
+
+# Near-duplicate detection against recent open tickets
+duplicate_detector = DuplicateDetector(dedup_settings_from_env())
+
+def find_duplicate_ticket(embedding, exclude_id=None):
+    if not duplicate_detector.enabled or embedding is None:
+        return None
+    with db_connection() as conn:
+        return duplicate_detector.find(conn, embedding, exclude_id=exclude_id)
+
+# Enrichment stages as a dependency graph: embedding and classification run
+# concurrently, similarity search waits for both, generation waits for the
+# similar tickets. Each stage has a timeout and a fallback so on the request
+# path one slow model call degrades the result instead of failing the ticket;
+# background jobs run the pipeline strictly and are retried instead. With
+# duplicate detection enabled, classification waits for the duplicate check
+# so a duplicate reuses its cluster's labels instead of calling the model;
+# otherwise the local classifier makes it wait for the embedding, since a
+# confident local prediction skips the call, and with neither it runs
+# alongside the embedding.
+# The semantic cache lookup runs alongside the similarity search and a hit
+# replaces the generation call.
+# Pipeline runs come from the request threads and the enrichment workers, and
+# each has at most two stages in flight (embedding with classification, then
+# similarity search with the cache lookup). The default pool covers that
+# twice over, leaving room for timed-out stages that are still running.
+PIPELINE_RUNS = int(os.getenv('GUNICORN_THREADS', 8)) + int(os.getenv('ENRICHMENT_WORKERS', 2))
+enrichment_executor = ThreadPoolExecutor(
+    max_workers=int(os.getenv('ENRICHMENT_THREADS', 2 * 2 * PIPELINE_RUNS)),
+    thread_name_prefix='enrichment'
+)
+
+def ticket_data_for(ctx):
+    classification = ctx['classification']
+    return {
+        'subject': ctx['subject'],
+        'message': ctx['message'],
+        'category': classification['category'],
+        'priority': classification['priority'],
+        'sentiment': classification['sentiment']
+    }
+
+def classify_stage(ctx):
+    if ctx.get('duplicate'):
+        return dict(ctx['duplicate']['classification'], source='cluster')
+    if local_classifier.enabled and ctx.get('embedding') is not None:
+        return classify_locally(ctx['subject'], ctx['message'], ctx['embedding'])
+    return request_classification(ctx['subject'], ctx['message'])
+
+def similarity_stage(ctx):
+    if ctx['embedding'] is None or ctx['duplicate']:
+        return []
+    return find_similar_tickets(ctx['embedding'], ctx['classification']['category'],
+                                text=f"{ctx['subject']} {ctx['message']}")
+
+def cached_response_stage(ctx):
+    if not semantic_cache.enabled or ctx['embedding'] is None or ctx['duplicate']:
+        return None
+    classification = ctx['classification']
+    return semantic_cache.lookup(ctx['embedding'], classification['category'], classification['sentiment'])
+
+def generation_stage(ctx):
+    if ctx['duplicate'] and ctx['duplicate']['response_text']:
+        return ctx['duplicate']['response_text']
+    if ctx['cached_response']:
+        return ctx['cached_response']['response_text']
+    
+    ticket_data = ticket_data_for(ctx)
+    prompt = build_response_prompt(ticket_data, ctx['similarity_search'])
+    response_text = request_response(ticket_data, prompt=prompt)
+    if semantic_cache.enabled and ctx['embedding'] is not None:
+        tokens = sum(count_tokens(text, CHAT_MODEL) for text in prompt + (response_text,))
+        semantic_cache.store(ctx['embedding'], ticket_data['category'], ticket_data['sentiment'],
+                             response_text, tokens)
+    return response_text
+
+enrichment_pipeline = StagePipeline([
+    Stage('embedding',
+          lambda ctx: generate_embedding(f"{ctx['subject']} {ctx['message']}"),
+          timeout=float(os.getenv('EMBEDDING_TIMEOUT', 10)),
+          fallback=lambda ctx, e: None),
+    Stage('duplicate',
+          lambda ctx: find_duplicate_ticket(ctx['embedding'], exclude_id=ctx['ticket_id']),
+          deps=('embedding',),
+          timeout=float(os.getenv('DEDUP_TIMEOUT', 2)),
+          fallback=lambda ctx, e: None),
+    Stage('classification',
+          classify_stage,
+          deps=('duplicate',) if duplicate_detector.enabled else ('embedding',) if local_classifier.enabled else (),
+          timeout=float(os.getenv('CLASSIFICATION_TIMEOUT', 15)),
+          fallback=lambda ctx, e: dict(DEFAULT_CLASSIFICATION, source='default')),
+    Stage('similarity_search',
+          similarity_stage,
+          deps=('embedding', 'duplicate', 'classification'),
+          timeout=float(os.getenv('SIMILARITY_TIMEOUT', 5)),
+          fallback=lambda ctx, e: []),
+    Stage('cached_response',
+          cached_response_stage,
+          deps=('embedding', 'duplicate', 'classification'),
+          timeout=float(os.getenv('SEMANTIC_CACHE_TIMEOUT', 2)),
+          fallback=lambda ctx, e: None),
+    Stage('generation',
+          generation_stage,
+          deps=('duplicate', 'classification', 'similarity_search', 'cached_response'),
+          timeout=float(os.getenv('GENERATION_TIMEOUT', 30)),
+          fallback=lambda ctx, e: DEFAULT_RESPONSE),
+], enrichment_executor, stats=stage_stats)
+
+# Run the AI enrichment stages for a ticket (ticket_id is set when enriching
+# an already-stored ticket, so it is not matched as its own duplicate). With
+# strict=True a failed or timed-out stage raises StageFailed instead of
+# using its fallback.
+def enrich_ticket(subject, message, ticket_id=None, strict=False):
+    results = enrichment_pipeline.run(strict=strict, subject=subject, message=message, ticket_id=ticket_id)
+    return {
+        'embedding': results['embedding'],
+        'duplicate': results['duplicate'],
+        'classification': results['classification'],
+        'similar_tickets': results['similarity_search'],
+        'cached_response': results['cached_response'],
+        'ai_response': results['generation']
+    }
+
+# Response rows record whether the text was generated, reused from a cluster
+# or served from the semantic response cache
+def response_type_for(enrichment):
+    duplicate = enrichment['duplicate']
+    if duplicate and duplicate['response_text'] == enrichment['ai_response']:
+        return 'ai_cluster'
+    cached = enrichment['cached_response']
+    if cached and cached['response_text'] == enrichment['ai_response']:
+        return 'ai_cached'
+    return 'ai_suggested'
+
 # Create new support ticket
 def create_ticket(customer_email, subject, message):
     try:
-        # Generate embedding
-        full_text = f"{subject} {message}"
-        embedding = generate_embedding(full_text)
+        enrichment = enrich_ticket(subject, message)
+        classification = enrichment['classification']
         
-        # Classify ticket
-        classification = classify_ticket(subject, message)
+        # Insert ticket and AI response in one transaction. The connection is
+        # only borrowed once all model calls are done so slow API calls never
+        # hold a pooled connection.
+        with stage_stats.time('db_write'), db_connection() as conn:
+            cur = conn.cursor()
+            
+            cur.execute("""
+                INSERT INTO support_tickets (customer_email, subject, message, category, 
+                                           priority, sentiment, classification_source, embedding)
+                VALUES (%s, %s, %s, %s, %s, %s, %s, %s)
+                RETURNING id
+            """, (customer_email, subject, message, classification['category'],
+                  classification['priority'], classification['sentiment'],
+                  classification.get('source', 'default'), enrichment['embedding']))
+            
+            ticket_id = cur.fetchone()[0]
+            
+            # Store AI response
+            cur.execute("""
+                INSERT INTO ticket_responses (ticket_id, response_text, response_type, confidence_score)
+                VALUES (%s, %s, %s, %s)
+            """, (ticket_id, enrichment['ai_response'], response_type_for(enrichment), 0.85))
+            
+            cluster_id = None
+            if enrichment['duplicate']:
+                cluster_id = duplicate_detector.attach(cur, ticket_id, enrichment['duplicate'])
+            
+            with stage_stats.time('db_commit'):
+                conn.commit()
+            cur.close()
         
-        # Insert ticket
-        conn = get_db_connection()
-        cur = conn.cursor()
+        # A newly formed cluster also changes the matched ticket
+        invalidate_ticket_caches(ticket_id, enrichment['duplicate']['ticket_id'] if enrichment['duplicate'] else None)
         
-        cur.execute("""
-            INSERT INTO support_tickets (customer_email, subject, message, category, 
-                                       priority, sentiment, embedding)
-            VALUES (%s, %s, %s, %s, %s, %s, %s)
-            RETURNING id
-        """, (customer_email, subject, message, classification['category'],
-              classification['priority'], classification['sentiment'], embedding))
+        return {
+            'ticket_id': ticket_id,
+            'classification': classification,
+            'ai_response': enrichment['ai_response'],
+            'similar_tickets': enrichment['similar_tickets'],
+            'cluster_id': cluster_id,
+            'duplicate_of': enrichment['duplicate']['ticket_id'] if enrichment['duplicate'] else None
+        }
+        
+    except Exception as e:
+        print(f"Error creating ticket: {e}")
+        return None
+
+# Store a raw ticket and queue its enrichment for the background workers
+def queue_ticket(customer_email, subject, message):
+    try:
+        with db_connection() as conn:
+            cur = conn.cursor()
+            
+            cur.execute("""
+                INSERT INTO support_tickets (customer_email, subject, message, enrichment_status)
+                VALUES (%s, %s, %s, 'pending')
+                RETURNING id
+            """, (customer_email, subject, message))
+            
+            ticket_id = cur.fetchone()[0]
+            enqueue_enrichment(cur, ticket_id)
+            
+            conn.commit()
+            cur.close()
         
-        ticket_id = cur.fetchone()[0]
+        invalidate_ticket_caches(ticket_id)
         
-        # Find similar tickets
-        similar_tickets = find_similar_tickets(embedding, classification['category'])
+        return ticket_id
         
-        # Generate AI response
-        ticket_data = {
-            'subject': subject,
-            'message': message,
-            'category': classification['category'],
-            'priority': classification['priority'],
-            'sentiment': classification['sentiment']
-        }
+    except Exception as e:
+        print(f"Error queueing ticket: {e}")
+        return None
+
+# Worker handler: enrich a queued ticket and store the results
+def process_enrichment_job(job):
+    with db_connection() as conn:
+        cur = conn.cursor()
+        cur.execute("""
+            SELECT subject, message, enrichment_status FROM support_tickets WHERE id = %s
+        """, (job['ticket_id'],))
+        ticket = cur.fetchone()
+        cur.close()
+    
+    if not ticket or ticket[2] == 'complete':
+        return
+    
+    # Background jobs are retried (JobQueue.fail), so a model outage leaves
+    # the ticket pending instead of storing fallback labels and the default
+    # response
+    enrichment = enrich_ticket(ticket[0], ticket[1], ticket_id=job['ticket_id'], strict=True)
+    classification = enrichment['classification']
+    
+    with stage_stats.time('db_write'), db_connection() as conn:
+        cur = conn.cursor()
+        # Raises JobOwnershipLost (and nothing is written) if the job ran past
+        # the visibility timeout and another worker has reclaimed it
+        hold_claim(cur, job)
         
-        ai_response = generate_response(ticket_data, similar_tickets)
+        cur.execute("""
+            UPDATE support_tickets
+            SET category = %s, priority = %s, sentiment = %s, classification_source = %s,
+                embedding = %s, enrichment_status = 'complete'
+            WHERE id = %s
+        """, (classification['category'], classification['priority'], classification['sentiment'],
+              classification.get('source', 'default'), enrichment['embedding'], job['ticket_id']))
         
-        # Store AI response
         cur.execute("""
             INSERT INTO ticket_responses (ticket_id, response_text, response_type, confidence_score)
             VALUES (%s, %s, %s, %s)
-        """, (ticket_id, ai_response, 'ai_suggested', 0.85))
-        
-        conn.commit()
-        cur.close()
-        conn.close()
+        """, (job['ticket_id'], enrichment['ai_response'], response_type_for(enrichment), 0.85))
         
-        return {
-            'ticket_id': ticket_id,
-            'classification': classification,
-            'ai_response': ai_response,
-            'similar_tickets': similar_tickets
-        }
+        if enrichment['duplicate']:
+            duplicate_detector.attach(cur, job['ticket_id'], enrichment['duplicate'])
         
+        with stage_stats.time('db_commit'):
+            conn.commit()
+        cur.close()
+    
+    invalidate_ticket_caches(job['ticket_id'], enrichment['duplicate']['ticket_id'] if enrichment['duplicate'] else None)
+
+# Process lifecycle for multi-worker servers (see gunicorn.conf.py)
+draining = threading.Event()
+
+def init_worker():
+    # Runs in each worker after fork: connections, sockets and threads
+    # inherited from the preloading parent are not usable in the child, so
+    # drop the parent's pool (without closing its sockets) and open our own
+    global db_pool, db_pool_lock
+    db_pool = None
+    db_pool_lock = threading.Lock()
+    try:
+        get_db_pool()
     except Exception as e:
-        print(f"Error creating ticket: {e}")
-        return None
+        # /ready reports the failure; the pool is retried on first use
+        print(f"Error opening database pool in worker {os.getpid()}: {e}")
+    
+    if ENRICHMENT_MODE == 'async':
+        start_enrichment_workers()
+    if local_classifier.enabled:
+        local_classifier.load_async()
+    if memory_index.enabled:
+        memory_index.start()
+
+def shutdown(timeout=30.0):
+    # Stop taking work, let in-flight enrichment finish, then close connections
+    draining.set()
+    deadline = time.monotonic() + timeout
+    if enrichment_workers is not None:
+        if not enrichment_workers.stop(timeout=timeout):
+            print("Enrichment workers did not finish before the shutdown timeout")
+    enrichment_executor.shutdown(wait=True)
+    memory_index.stop(timeout=max(0.0, deadline - time.monotonic()))
+    event_broadcaster.stop(timeout=max(0.0, deadline - time.monotonic()))
+    if db_pool is not None:
+        db_pool.closeall()
+
+# Request metrics and the per-request root span
+@app.before_request
+def start_request_metrics():
+    g.request_started = time.perf_counter()
+    g.request_span = None
+    if tracing.tracer.enabled:
+        route = request.url_rule.rule if request.url_rule else 'unmatched'
+        g.request_span = tracing.tracer.start(f"{request.method} {route}", path=request.path)
+
+@app.after_request
+def record_request_metrics(response):
+    route = request.url_rule.rule if request.url_rule else 'unmatched'
+    HTTP_SECONDS.observe(time.perf_counter() - g.request_started,
+                         method=request.method, route=route, status=response.status_code)
+    if g.request_span:
+        g.request_span[0].set_attribute('status', response.status_code)
+    return response
+
+@app.teardown_request
+def finish_request_span(error=None):
+    request_span = g.pop('request_span', None)
+    if request_span:
+        try:
+            tracing.tracer.finish(*request_span, error=error)
+        except ValueError:
+            # Streamed responses finish in a different context than they started
+            pass
+
+# Values that already live in component stats are read at scrape time
+def pool_metrics():
+    if db_pool is None:
+        return []
+    stats = db_pool.stats()
+    return [({'state': 'idle'}, stats['idle']), ({'state': 'in_use'}, stats['in_use'])]
+
+def model_metric(field):
+    def collect():
+        return [({'model': model}, stats[field]) for model, stats in model_client.stats()['models'].items()]
+    return collect
+
+def model_token_metrics():
+    samples = []
+    for model, stats in model_client.stats()['models'].items():
+        samples.append(({'model': model, 'kind': 'prompt'}, stats['prompt_tokens']))
+        samples.append(({'model': model, 'kind': 'completion'}, stats['completion_tokens']))
+    return samples
+
+def purpose_token_metrics():
+    samples = []
+    for purpose, stats in model_client.stats()['purposes'].items():
+        samples.append(({'purpose': purpose, 'kind': 'prompt'}, stats['prompt_tokens']))
+        samples.append(({'purpose': purpose, 'kind': 'completion'}, stats['completion_tokens']))
+    return samples
+
+def cache_metrics():
+    embedding = embedding_cache.stats()
+    responses = response_cache.stats()
+    semantic = semantic_cache.stats()
+    return [
+        ({'cache': 'embedding', 'result': 'hit'}, embedding['memory_hits'] + embedding['db_hits']),
+        ({'cache': 'embedding', 'result': 'miss'}, embedding['misses']),
+        ({'cache': 'response', 'result': 'hit'}, responses['hits']),
+        ({'cache': 'response', 'result': 'miss'}, responses['misses']),
+        ({'cache': 'semantic', 'result': 'hit'}, semantic['hits']),
+        ({'cache': 'semantic', 'result': 'miss'}, semantic['misses']),
+    ]
+
+metrics.callback('db_pool_connections', 'gauge', 'Pooled connections by state', pool_metrics)
+metrics.callback('db_pool_checkout_timeouts', 'counter', 'Checkouts that gave up waiting',
+                 lambda: [({}, db_pool.stats()['checkout_timeouts'])] if db_pool else [])
+metrics.callback('db_pool_wait_seconds', 'counter', 'Time spent waiting for a pooled connection',
+                 lambda: [({}, db_pool.stats()['wait_time_total'])] if db_pool else [])
+metrics.callback('model_calls', 'counter', 'Successful model calls', model_metric('calls'))
+metrics.callback('model_failures', 'counter', 'Model calls that failed after retries', model_metric('failures'))
+metrics.callback('model_retries', 'counter', 'Model call retries', model_metric('retries'))
+metrics.callback('model_rejected', 'counter', 'Calls rejected by an open circuit', model_metric('rejected'))
+metrics.callback('model_tokens', 'counter', 'Tokens used by model calls', model_token_metrics)
+metrics.callback('prompt_tokens', 'counter', 'Tokens used by chat calls by purpose', purpose_token_metrics)
+metrics.callback('prompt_truncations', 'counter', 'Prompts cut to fit their token budget',
+                 lambda: [({'prompt': kind}, stats['truncated'])
+                          for kind, stats in prompt_builder.stats()['prompts'].items()])
+metrics.callback('cache_requests', 'counter', 'Cache lookups by result', cache_metrics)
+metrics.callback('classifier_decisions', 'counter', 'Tickets labeled locally vs by the model',
+                 lambda: [({'decision': 'local'}, local_classifier.stats()['local']),
+                          ({'decision': 'model'}, local_classifier.stats()['fallbacks'])])
+metrics.callback('duplicate_tickets', 'counter', 'Tickets attached to a duplicate cluster',
+                 lambda: [({}, duplicate_detector.stats()['duplicates'])])
+metrics.callback('event_subscribers', 'gauge', 'Open /events streams',
+                 lambda: [({}, event_broadcaster.stats()['subscribers'])])
 
 # Flask routes
+@app.route('/metrics', methods=['GET'])
+def prometheus_metrics():
+    return Response(metrics.render(), mimetype='text/plain; version=0.0.4')
+
+@app.route('/traces', methods=['GET'])
+def recent_traces():
+    if not isinstance(tracing.tracer.exporter, MemoryExporter):
+        return jsonify({'error': 'Tracing is disabled (set TRACING_EXPORTER=memory or jsonl)'}), 404
+    try:
+        limit = min(int_arg('limit', 20), 200)
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+    return jsonify({'traces': tracing.tracer.exporter.traces(limit)})
+
 @app.route('/health', methods=['GET'])
 def health_check():
     return jsonify({'status': 'healthy', 'service': 'AI Support System'})
 
+# Readiness (unlike /health) checks that this process can actually serve:
+# not draining, the pool can hand out a working connection, and the schema
+# has every migration this code expects
+@app.route('/ready', methods=['GET'])
+def readiness_check():
+    checks = {'draining': draining.is_set()}
+    ready = not checks['draining']
+    
+    try:
+        with db_connection() as conn:
+            cur = conn.cursor()
+            cur.execute("SELECT 1")
+            cur.execute("SELECT name FROM schema_migrations")
+            applied = {row[0] for row in cur.fetchall()}
+            cur.close()
+            conn.rollback()
+        checks['database'] = 'ok'
+        missing = [name for name, _ in MIGRATIONS if name not in applied]
+        checks['pending_migrations'] = missing
+        ready = ready and not missing
+        
+        pool = get_db_pool().stats()
+        checks['pool'] = {'in_use': pool['in_use'], 'idle': pool['idle'], 'max_size': pool['max_size']}
+    except Exception as e:
+        checks['database'] = str(e)
+        ready = False
+    
+    return jsonify({'ready': ready, 'checks': checks}), 200 if ready else 503
+
+@app.route('/health/pool', methods=['GET'])
+def pool_stats():
+    return jsonify(get_db_pool().stats())
+
+@app.route('/health/queue', methods=['GET'])
+def queue_stats():
+    try:
+        depth = enrichment_queue.depth()
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+    
+    return jsonify({
+        'mode': ENRICHMENT_MODE,
+        'queue': depth,
+        'workers': enrichment_workers.stats() if enrichment_workers else None,
+        'stage_latency': stage_stats.snapshot()
+    })
+
+@app.route('/health/response-cache', methods=['GET'])
+def response_cache_stats():
+    return jsonify(response_cache.stats())
+
+@app.route('/health/embedding-cache', methods=['GET'])
+def embedding_cache_stats():
+    return jsonify(embedding_cache.stats())
+
+@app.route('/health/events', methods=['GET'])
+def event_stats():
+    return jsonify(dict(event_broadcaster.stats(), max_streams=SSE_MAX_STREAMS, streams_rejected=sse_rejected))
+
+@app.route('/health/memory-index', methods=['GET'])
+def memory_index_stats():
+    return jsonify(memory_index.stats())
+
+@app.route('/health/dedup', methods=['GET'])
+def dedup_stats():
+    return jsonify(duplicate_detector.stats())
+
+@app.route('/health/classifier', methods=['GET'])
+def classifier_stats():
+    return jsonify(local_classifier.stats())
+
+@app.route('/health/models', methods=['GET'])
+def model_stats():
+    return jsonify(model_client.stats())
+
+@app.route('/health/prompts', methods=['GET'])
+def prompt_stats():
+    return jsonify(prompt_builder.stats())
+
+@app.route('/health/semantic-cache', methods=['GET'])
+def semantic_cache_stats():
+    return jsonify(semantic_cache.stats())
+
 @app.route('/tickets', methods=['POST'])
 def submit_ticket():
     data = request.json
@@ -223,47 +867,106 @@ def submit_ticket():
     if not all([customer_email, subject, message]):
         return jsonify({'error': 'Customer email, subject, and message are required'}), 400
     
+    run_async = request.args.get('async', str(ENRICHMENT_MODE == 'async')).lower() in ('1', 'true')
+    if run_async:
+        ticket_id = queue_ticket(customer_email, subject, message)
+        if ticket_id is None:
+            return jsonify({'error': 'Failed to create ticket'}), 500
+        return jsonify({
+            'success': True,
+            'ticket_id': ticket_id,
+            'enrichment_status': 'pending'
+        }), 202
+    
     result = create_ticket(customer_email, subject, message)
     
     if result:
         return jsonify({
             'success': True,
             'ticket_id': result['ticket_id'],
+            'enrichment_status': 'complete',
             'classification': result['classification'],
             'suggested_response': result['ai_response'],
-            'similar_tickets_found': len(result['similar_tickets'])
+            'similar_tickets_found': len(result['similar_tickets']),
+            'cluster_id': result['cluster_id'],
+            'duplicate_of': result['duplicate_of']
         })
     else:
         return jsonify({'error': 'Failed to create ticket'}), 500
 
+# Integer query parameter between minimum and maximum (inclusive); raises
+# ValueError with a message fit for a 400 response
+def int_arg(name, default, minimum=1, maximum=None):
+    value = request.args.get(name)
+    if value is None:
+        return default
+    try:
+        number = int(value)
+    except ValueError:
+        raise ValueError(f"{name} must be an integer")
+    if number < minimum or (maximum is not None and number > maximum):
+        bounds = f"between {minimum} and {maximum}" if maximum is not None else f"at least {minimum}"
+        raise ValueError(f"{name} must be {bounds}")
+    return number
+
+MAX_IMPORT_BATCH_SIZE = 1000
+MAX_IMPORT_CONCURRENCY = 32
+
+@app.route('/tickets/bulk', methods=['POST'])
+def bulk_import_tickets():
+    # Body is streamed line by line: JSONL by default, CSV with Content-Type text/csv
+    fmt = 'csv' if request.mimetype == 'text/csv' else 'jsonl'
+    try:
+        batch_size = int_arg('batch_size', 100, maximum=MAX_IMPORT_BATCH_SIZE)
+        concurrency = int_arg('concurrency', 8, maximum=MAX_IMPORT_CONCURRENCY)
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+    
+    importer = BulkImporter(db_connection, generate_embeddings, classify_ticket,
+                            batch_size=batch_size, concurrency=concurrency,
+                            resolution_settings=RESOLUTION_SETTINGS)
+    try:
+        stream = io.TextIOWrapper(request.stream, encoding='utf-8', newline='')
+        summary = importer.run(read_tickets(stream, fmt))
+    except (ValueError, KeyError) as e:
+        return jsonify({'error': f'Invalid import data: {e}'}), 400
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+    finally:
+        # Batches committed before a failure are visible too
+        invalidate_ticket_caches()
+    
+    return jsonify({'success': True, **summary})
+
 @app.route('/tickets/<int:ticket_id>', methods=['GET'])
+@response_cache.cached(lambda ticket_id: [f'ticket:{ticket_id}'])
 def get_ticket(ticket_id):
     try:
-        conn = get_db_connection()
-        cur = conn.cursor()
+        with db_connection() as conn:
+            cur = conn.cursor()
         
-        # Get ticket details
-        cur.execute("""
-            SELECT id, customer_email, subject, message, category, priority, 
-                   sentiment, status, created_at
-            FROM support_tickets WHERE id = %s
-        """, (ticket_id,))
+            # Get ticket details
+            cur.execute("""
+                SELECT id, customer_email, subject, message, category, priority, 
+                       sentiment, status, created_at, enrichment_status, cluster_id,
+                       resolution_summary
+                FROM support_tickets WHERE id = %s
+            """, (ticket_id,))
         
-        ticket = cur.fetchone()
-        if not ticket:
-            return jsonify({'error': 'Ticket not found'}), 404
+            ticket = cur.fetchone()
+            if not ticket:
+                return jsonify({'error': 'Ticket not found'}), 404
         
-        # Get responses
-        cur.execute("""
-            SELECT response_text, response_type, confidence_score, created_at
-            FROM ticket_responses WHERE ticket_id = %s
-            ORDER BY created_at DESC
-        """, (ticket_id,))
+            # Get responses
+            cur.execute("""
+                SELECT response_text, response_type, confidence_score, created_at
+                FROM ticket_responses WHERE ticket_id = %s
+                ORDER BY created_at DESC
+            """, (ticket_id,))
         
-        responses = cur.fetchall()
+            responses = cur.fetchall()
         
-        cur.close()
-        conn.close()
+            cur.close()
         
         return jsonify({
             'ticket': {
@@ -275,7 +978,10 @@ def get_ticket(ticket_id):
                 'priority': ticket[5],
                 'sentiment': ticket[6],
                 'status': ticket[7],
-                'created_at': ticket[8].isoformat()
+                'created_at': ticket[8].isoformat(),
+                'enrichment_status': ticket[9],
+                'cluster_id': ticket[10],
+                'resolution_summary': ticket[11]
             },
             'responses': [
                 {
@@ -291,107 +997,353 @@ def get_ticket(ticket_id):
     except Exception as e:
         return jsonify({'error': str(e)}), 500
 
-@app.route('/analytics', methods=['GET'])
-def get_analytics():
-    try:
-        conn = get_db_connection()
+# Change a ticket's status (analytics rollups follow via the table trigger)
+TICKET_STATUSES = ('open', 'in_progress', 'resolved', 'closed')
+
+# Resolution notes and agent responses are stored with an embedding, and the
+# ticket's resolution_summary (what similar-ticket lookups return) is
+# recomputed in the same transaction
+RESOLUTION_SETTINGS = resolution_settings_from_env()
+
+def add_ticket_response(cur, ticket_id, text, response_type, embedding):
+    cur.execute("""
+        INSERT INTO ticket_responses (ticket_id, response_text, response_type, embedding)
+        VALUES (%s, %s, %s, %s)
+        RETURNING id
+    """, (ticket_id, text, response_type, embedding))
+    return cur.fetchone()[0]
+
+def update_ticket_status(ticket_id, status, resolution=None):
+    embedding = generate_embedding(resolution) if resolution else None
+    
+    with db_connection() as conn:
         cur = conn.cursor()
-        
-        # Category distribution
         cur.execute("""
-            SELECT category, COUNT(*) as count
-            FROM support_tickets
-            GROUP BY category
-            ORDER BY count DESC
-        """)
-        category_stats = cur.fetchall()
+            UPDATE support_tickets
+            SET status = %s,
+                resolved_at = CASE WHEN %s = 'resolved' THEN COALESCE(resolved_at, CURRENT_TIMESTAMP) END
+            WHERE id = %s
+            RETURNING id
+        """, (status, status, ticket_id))
+        updated = cur.fetchone() is not None
+        if updated and resolution:
+            add_ticket_response(cur, ticket_id, resolution, 'resolution', embedding)
+        if updated and (resolution or status == 'resolved'):
+            refresh_resolution(cur, ticket_id, RESOLUTION_SETTINGS)
+        conn.commit()
+        cur.close()
+    
+    if updated:
+        invalidate_ticket_caches(ticket_id)
+    return updated
+
+@app.route('/tickets/<int:ticket_id>', methods=['PATCH'])
+def patch_ticket(ticket_id):
+    data = request.json or {}
+    status = data.get('status')
+    resolution = (data.get('resolution') or '').strip() or None
+    
+    if status not in TICKET_STATUSES:
+        return jsonify({'error': f"Status must be one of {', '.join(TICKET_STATUSES)}"}), 400
+    
+    try:
+        if not update_ticket_status(ticket_id, status, resolution):
+            return jsonify({'error': 'Ticket not found'}), 404
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+    
+    return jsonify({'success': True, 'ticket_id': ticket_id, 'status': status})
+
+@app.route('/tickets/<int:ticket_id>/responses', methods=['POST'])
+def create_ticket_response(ticket_id):
+    data = request.json or {}
+    text = (data.get('response_text') or '').strip()
+    response_type = data.get('response_type', 'agent')
+    
+    if not text:
+        return jsonify({'error': 'response_text is required'}), 400
+    if response_type not in RESPONSE_TYPES:
+        return jsonify({'error': f"response_type must be one of {', '.join(RESPONSE_TYPES)}"}), 400
+    
+    try:
+        embedding = generate_embedding(text)
+        with db_connection() as conn:
+            cur = conn.cursor()
+            cur.execute("SELECT id FROM support_tickets WHERE id = %s FOR UPDATE", (ticket_id,))
+            if cur.fetchone() is None:
+                cur.close()
+                conn.rollback()
+                return jsonify({'error': 'Ticket not found'}), 404
+            response_id = add_ticket_response(cur, ticket_id, text, response_type, embedding)
+            summary = refresh_resolution(cur, ticket_id, RESOLUTION_SETTINGS)
+            conn.commit()
+            cur.close()
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+    
+    invalidate_ticket_caches(ticket_id)
+    return jsonify({
+        'success': True,
+        'ticket_id': ticket_id,
+        'response_id': response_id,
+        'resolution_summary': summary
+    }), 201
+
+def sse_event(event, data):
+    return f"event: {event}\ndata: {json.dumps(data)}\n\n"
+
+# Every open SSE stream holds a server thread until the client disconnects,
+# so streams are capped per worker to leave threads for ordinary requests
+SSE_MAX_STREAMS = int(os.getenv('SSE_MAX_STREAMS', max(1, int(os.getenv('GUNICORN_THREADS', 8)) // 2)))
+sse_slots = threading.BoundedSemaphore(SSE_MAX_STREAMS)
+sse_stats_lock = threading.Lock()
+sse_rejected = 0
+
+def sse_response(stream):
+    # stream is a function returning the event generator; it is only called
+    # once a slot is taken, and the slot is returned when the server closes
+    # the response (client gone or stream finished)
+    global sse_rejected
+    if not sse_slots.acquire(blocking=False):
+        with sse_stats_lock:
+            sse_rejected += 1
+        response = jsonify({'error': 'Too many open streams, retry later'})
+        response.status_code = 503
+        response.headers['Retry-After'] = '5'
+        return response
+    try:
+        response = Response(stream(), mimetype='text/event-stream',
+                            headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'})
+    except Exception:
+        sse_slots.release()
+        raise
+    response.call_on_close(sse_slots.release)
+    return response
+
+@app.route('/tickets/<int:ticket_id>/suggested-response/stream', methods=['GET'])
+def stream_suggested_response(ticket_id):
+    try:
+        with db_connection() as conn:
+            cur = conn.cursor()
+            cur.execute("""
+                SELECT subject, message, category, priority, sentiment, embedding
+                FROM support_tickets WHERE id = %s
+            """, (ticket_id,))
+            ticket = cur.fetchone()
+            cur.close()
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+    
+    if not ticket:
+        return jsonify({'error': 'Ticket not found'}), 404
+    
+    subject, message, category, priority, sentiment, embedding = ticket
+    
+    def generate():
+        # Tickets still waiting for async enrichment are classified inline
+        if category is None:
+            classification = classify_ticket(subject, message)
+        else:
+            classification = {'category': category, 'priority': priority, 'sentiment': sentiment}
         
-        # Priority distribution
-        cur.execute("""
-            SELECT priority, COUNT(*) as count
-            FROM support_tickets
-            GROUP BY priority
-            ORDER BY count DESC
-        """)
-        priority_stats = cur.fetchall()
+        ticket_data = {
+            'subject': subject,
+            'message': message,
+            'category': classification['category'],
+            'priority': classification['priority'],
+            'sentiment': classification['sentiment']
+        }
+        similar_tickets = find_similar_tickets(embedding, classification['category'],
+                                               text=f"{subject} {message}") if embedding else []
         
-        # Sentiment analysis
-        cur.execute("""
-            SELECT sentiment, COUNT(*) as count
-            FROM support_tickets
-            GROUP BY sentiment
-            ORDER BY count DESC
-        """)
-        sentiment_stats = cur.fetchall()
+        # Tell the client where the context came from before the first token
+        yield sse_event('context', {
+            'classification': {
+                'category': classification['category'],
+                'priority': classification['priority'],
+                'sentiment': classification['sentiment']
+            },
+            'similar_tickets_found': len(similar_tickets)
+        })
         
-        # Recent tickets
-        cur.execute("""
-            SELECT COUNT(*) as total_tickets,
-                   COUNT(CASE WHEN status = 'open' THEN 1 END) as open_tickets,
-                   COUNT(CASE WHEN status = 'resolved' THEN 1 END) as resolved_tickets
-            FROM support_tickets
-            WHERE created_at >= NOW() - INTERVAL '7 days'
-        """)
-        recent_stats = cur.fetchone()
+        parts = []
+        try:
+            for token in stream_response(ticket_data, similar_tickets):
+                parts.append(token)
+                yield sse_event('token', {'text': token})
+        except Exception as e:
+            print(f"Error streaming response: {e}")
+            yield sse_event('error', {'error': 'Response generation failed'})
+            return
         
-        cur.close()
-        conn.close()
+        # Persist the completed response once the stream has finished
+        response_text = ''.join(parts)
+        try:
+            with db_connection() as conn:
+                cur = conn.cursor()
+                cur.execute("""
+                    INSERT INTO ticket_responses (ticket_id, response_text, response_type, confidence_score)
+                    VALUES (%s, %s, %s, %s)
+                    RETURNING id
+                """, (ticket_id, response_text, 'ai_suggested', 0.85))
+                response_id = cur.fetchone()[0]
+                conn.commit()
+                cur.close()
+            response_cache.invalidate(f'ticket:{ticket_id}')
+        except Exception as e:
+            print(f"Error saving streamed response: {e}")
+            yield sse_event('error', {'error': 'Failed to save response'})
+            return
+        
+        yield sse_event('done', {'response_id': response_id, 'text': response_text})
+    
+    return sse_response(lambda: stream_with_context(generate()))
+
+@app.route('/events', methods=['GET'])
+def stream_events():
+    # Pushes ticket_created / ticket_updated / analytics_delta as tickets
+    # change; 'resync' means events were missed and the client should refetch
+    def generate():
+        subscriber = event_broadcaster.subscribe()
+        try:
+            yield sse_event('ready', {})
+            while True:
+                try:
+                    event, data = subscriber.get(timeout=EVENTS_HEARTBEAT_INTERVAL)
+                except queue.Empty:
+                    # Keeps proxies from closing the stream and surfaces
+                    # disconnected clients on the next write
+                    yield ": keepalive\n\n"
+                    continue
+                yield sse_event(event, data)
+        finally:
+            event_broadcaster.unsubscribe(subscriber)
+    
+    return sse_response(generate)
+
+@app.route('/analytics', methods=['GET'])
+@response_cache.cached(['analytics'])
+def get_analytics():
+    # Reads the ticket_totals / ticket_rollups tables kept current by the
+    # support_tickets trigger, so the cost does not grow with the ticket count
+    try:
+        with db_connection() as conn:
+            cur = conn.cursor()
+            
+            # Category, priority and sentiment distributions
+            cur.execute("""
+                SELECT dimension, value, SUM(ticket_count) AS ticket_count
+                FROM ticket_totals
+                WHERE dimension IN ('category', 'priority', 'sentiment')
+                GROUP BY dimension, value
+                HAVING SUM(ticket_count) > 0
+                ORDER BY dimension, ticket_count DESC
+            """)
+            totals = {'category': [], 'priority': [], 'sentiment': []}
+            for dimension, value, count in cur.fetchall():
+                totals[dimension].append({'name': value or None, 'count': count})
+            
+            # Recent tickets (whole days, including today)
+            cur.execute("""
+                SELECT day,
+                       SUM(ticket_count) as total_tickets,
+                       SUM(CASE WHEN status = 'open' THEN ticket_count ELSE 0 END) as open_tickets,
+                       SUM(CASE WHEN status = 'resolved' THEN ticket_count ELSE 0 END) as resolved_tickets
+                FROM ticket_rollups
+                WHERE day > CURRENT_DATE - 7
+                GROUP BY day
+                ORDER BY day
+            """)
+            daily_stats = cur.fetchall()
+            
+            cur.close()
         
         return jsonify({
-            'categories': [{'name': cat[0], 'count': cat[1]} for cat in category_stats],
-            'priorities': [{'name': pri[0], 'count': pri[1]} for pri in priority_stats],
-            'sentiments': [{'name': sent[0], 'count': sent[1]} for sent in sentiment_stats],
+            'categories': totals['category'],
+            'priorities': totals['priority'],
+            'sentiments': totals['sentiment'],
             'recent_week': {
-                'total': recent_stats[0],
-                'open': recent_stats[1],
-                'resolved': recent_stats[2]
-            }
+                'total': sum(int(day[1]) for day in daily_stats),
+                'open': sum(int(day[2]) for day in daily_stats),
+                'resolved': sum(int(day[3]) for day in daily_stats)
+            },
+            'daily': [{'date': day[0].isoformat(), 'count': int(day[1])} for day in daily_stats]
         })
         
     except Exception as e:
         return jsonify({'error': str(e)}), 500
 
+# Shared filter handling for listing and exporting tickets
+def ticket_filters(args):
+    clauses = []
+    params = []
+    
+    for field in ('category', 'priority', 'status', 'cluster_id', 'customer_email'):
+        value = args.get(field)
+        if value:
+            clauses.append(f"{field} = %s")
+            params.append(value)
+    
+    # ISO dates or timestamps; created_before is exclusive
+    for field, operator in (('created_after', '>='), ('created_before', '<')):
+        value = args.get(field)
+        if value:
+            clauses.append(f"created_at {operator} %s")
+            params.append(datetime.fromisoformat(value))
+    
+    return clauses, params
+
+# Opaque keyset cursor: the (created_at, id) of the last ticket on a page
+def encode_cursor(created_at, ticket_id):
+    raw = json.dumps([created_at.isoformat(), ticket_id]).encode('utf-8')
+    return base64.urlsafe_b64encode(raw).decode('ascii')
+
+def decode_cursor(cursor):
+    created_at, ticket_id = json.loads(base64.urlsafe_b64decode(cursor.encode('ascii')))
+    return datetime.fromisoformat(created_at), int(ticket_id)
+
+MAX_PAGE_SIZE = 1000
+
 @app.route('/tickets', methods=['GET'])
+@response_cache.cached(['tickets'])
 def list_tickets():
     try:
-        conn = get_db_connection()
-        cur = conn.cursor()
-        
         # Get query parameters
-        category = request.args.get('category')
-        priority = request.args.get('priority')
-        status = request.args.get('status')
-        limit = int(request.args.get('limit', 10))
+        limit = min(int(request.args.get('limit', 10)), MAX_PAGE_SIZE)
+        cursor = request.args.get('cursor')
         
         # Build query
+        clauses, params = ticket_filters(request.args)
+        if cursor:
+            try:
+                cursor_created_at, cursor_id = decode_cursor(cursor)
+            except (ValueError, TypeError):
+                return jsonify({'error': 'Invalid cursor'}), 400
+            clauses.append("(created_at, id) < (%s, %s)")
+            params.extend([cursor_created_at, cursor_id])
+        
         query = """
             SELECT id, customer_email, subject, category, priority, 
                    sentiment, status, created_at
             FROM support_tickets
-            WHERE 1=1
         """
-        params = []
-        
-        if category:
-            query += " AND category = %s"
-            params.append(category)
+        if clauses:
+            query += " WHERE " + " AND ".join(clauses)
         
-        if priority:
-            query += " AND priority = %s"
-            params.append(priority)
-            
-        if status:
-            query += " AND status = %s"
-            params.append(status)
-        
-        query += " ORDER BY created_at DESC LIMIT %s"
-        params.append(limit)
+        # Fetch one extra row to know whether another page exists
+        query += " ORDER BY created_at DESC, id DESC LIMIT %s"
+        params.append(limit + 1)
         
-        cur.execute(query, params)
-        tickets = cur.fetchall()
+        with db_connection() as conn:
+            cur = conn.cursor()
+            cur.execute(query, params)
+            tickets = cur.fetchall()
+            cur.close()
         
-        cur.close()
-        conn.close()
+        next_cursor = None
+        if len(tickets) > limit:
+            tickets = tickets[:limit]
+            next_cursor = encode_cursor(tickets[-1][7], tickets[-1][0])
         
         return jsonify({
             'tickets': [
@@ -406,21 +1358,248 @@ def list_tickets():
                     'created_at': ticket[7].isoformat()
                 }
                 for ticket in tickets
+            ],
+            'next_cursor': next_cursor
+        })
+        
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+
+# Clusters of near-duplicate tickets that received a ticket recently
+@app.route('/clusters', methods=['GET'])
+@response_cache.cached(['tickets'])
+def list_clusters():
+    try:
+        hours = float(request.args.get('hours', 24))
+        min_size = int(request.args.get('min_size', 2))
+        limit = min(int(request.args.get('limit', 50)), MAX_PAGE_SIZE)
+        
+        with db_connection() as conn:
+            cur = conn.cursor()
+            cur.execute("""
+                SELECT c.id, c.canonical_ticket_id, t.subject, c.category, c.priority, c.sentiment,
+                       c.ticket_count, c.first_seen_at, c.last_seen_at,
+                       (SELECT COUNT(*) FROM support_tickets m
+                        WHERE m.cluster_id = c.id AND m.status = 'open') as open_count
+                FROM ticket_clusters c
+                LEFT JOIN support_tickets t ON t.id = c.canonical_ticket_id
+                WHERE c.last_seen_at > NOW() - make_interval(secs => %s) AND c.ticket_count >= %s
+                ORDER BY c.last_seen_at DESC
+                LIMIT %s
+            """, (hours * 3600, min_size, limit))
+            clusters = cur.fetchall()
+            cur.close()
+        
+        return jsonify({
+            'clusters': [
+                {
+                    'id': cluster[0],
+                    'canonical_ticket_id': cluster[1],
+                    'subject': cluster[2],
+                    'category': cluster[3],
+                    'priority': cluster[4],
+                    'sentiment': cluster[5],
+                    'ticket_count': cluster[6],
+                    'open_count': cluster[9],
+                    'first_seen_at': cluster[7].isoformat(),
+                    'last_seen_at': cluster[8].isoformat()
+                }
+                for cluster in clusters
             ]
         })
         
     except Exception as e:
         return jsonify({'error': str(e)}), 500
 
+# Ticket search: full-text and vector rankings fused (mode=hybrid, default),
+# or either one alone (mode=lexical skips the embedding call). A query is free
+# text (q) or an existing ticket (ticket_id), which searches with that
+# ticket's text and stored embedding and leaves the ticket itself out. A batch
+# ({"queries": [...]}) is embedded with one API call and answered by one SQL
+# statement.
+SEARCH_MODES = ('hybrid', 'vector', 'lexical')
+MAX_SEARCH_BATCH = int(os.getenv('SEARCH_MAX_BATCH', 50))
+
+def resolve_search_queries(queries):
+    ticket_ids = [int(query['ticket_id']) for query in queries if query.get('ticket_id') is not None]
+    tickets = {}
+    if ticket_ids:
+        with db_connection() as conn:
+            cur = conn.cursor()
+            cur.execute("""
+                SELECT id, subject, message, embedding
+                FROM support_tickets WHERE id = ANY(%s)
+            """, (ticket_ids,))
+            tickets = {row[0]: row for row in cur.fetchall()}
+            cur.close()
+    
+    resolved = []
+    for query in queries:
+        if query.get('ticket_id') is not None:
+            ticket = tickets.get(int(query['ticket_id']))
+            resolved.append(ticket and {'text': f"{ticket[1]} {ticket[2]}", 'embedding': ticket[3],
+                                        'exclude_id': ticket[0]})
+        else:
+            resolved.append({'text': query['q'], 'embedding': None, 'exclude_id': None})
+    return resolved
+
+def search_result(row):
+    return {
+        'id': row[0],
+        'subject': row[1],
+        'category': row[3],
+        'priority': row[4],
+        'status': row[5],
+        'customer_email': row[6],
+        'created_at': row[7].isoformat() if row[7] else None,
+        'similarity': 1 - float(row[8]) if row[8] is not None else None,
+        'score': float(row[9]),
+        'lexical_rank': row[10],
+        'semantic_rank': row[11],
+        'resolution': row[12]
+    }
+
+def run_search(queries, filters, mode, limit):
+    clauses, params = ticket_filters(filters)
+    resolved = resolve_search_queries(queries)
+    found = [query for query in resolved if query is not None]
+    
+    if mode != 'lexical':
+        missing = [query for query in found if query['embedding'] is None]
+        try:
+            if missing:
+                for query, embedding in zip(missing, generate_embeddings([query['text'] for query in missing])):
+                    query['embedding'] = embedding
+        except Exception as e:
+            # Still answer from the full-text index
+            print(f"Error embedding search queries: {e}")
+            mode = 'lexical'
+    
+    with db_connection() as conn:
+        rows = iter(hybrid_search.search_many(conn, found, clauses, params, limit, mode=mode))
+    return mode, [next(rows) if query is not None else None for query in resolved]
+
+def parse_search_query(query):
+    if isinstance(query, str):
+        query = {'q': query}
+    if query.get('ticket_id') is not None:
+        return {'ticket_id': int(query['ticket_id'])}
+    text = query.get('q')
+    if isinstance(text, str) and text.strip():
+        return {'q': text.strip()}
+    raise ValueError('Each query needs q or ticket_id')
+
+@app.route('/search', methods=['GET', 'POST'])
+def search_tickets():
+    data = request.args if request.method == 'GET' else (request.get_json(silent=True) or {})
+    mode = data.get('mode', 'hybrid')
+    if mode not in SEARCH_MODES:
+        return jsonify({'error': f"mode must be one of {', '.join(SEARCH_MODES)}"}), 400
+    
+    batch = request.method == 'POST' and 'queries' in data
+    try:
+        limit = min(int(data.get('limit', 10)), 100)
+        if batch:
+            if not isinstance(data['queries'], list) or not data['queries']:
+                return jsonify({'error': 'queries must be a non-empty list'}), 400
+            if len(data['queries']) > MAX_SEARCH_BATCH:
+                return jsonify({'error': f"At most {MAX_SEARCH_BATCH} queries per request"}), 400
+            queries = [parse_search_query(query) for query in data['queries']]
+        else:
+            queries = [parse_search_query(data)]
+        ticket_filters(data)
+    except (ValueError, TypeError, AttributeError) as e:
+        return jsonify({'error': str(e)}), 400
+    
+    try:
+        mode, results = run_search(queries, data, mode, limit)
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+    
+    if not batch:
+        if results[0] is None:
+            return jsonify({'error': 'Ticket not found'}), 404
+        return jsonify({'query': queries[0], 'mode': mode, 'results': [search_result(row) for row in results[0]]})
+    
+    return jsonify({
+        'mode': mode,
+        'results': [
+            {'query': query, 'error': 'Ticket not found'} if rows is None
+            else {'query': query, 'results': [search_result(row) for row in rows]}
+            for query, rows in zip(queries, results)
+        ]
+    })
+
+EXPORT_COLUMNS = ['id', 'customer_email', 'subject', 'message', 'category', 'priority',
+                  'sentiment', 'status', 'created_at', 'resolved_at']
+
+@app.route('/tickets/export', methods=['GET'])
+def export_tickets():
+    export_format = request.args.get('format', 'ndjson')
+    if export_format not in ('ndjson', 'csv'):
+        return jsonify({'error': 'Format must be ndjson or csv'}), 400
+    
+    clauses, params = ticket_filters(request.args)
+    query = f"SELECT {', '.join(EXPORT_COLUMNS)} FROM support_tickets"
+    if clauses:
+        query += " WHERE " + " AND ".join(clauses)
+    query += " ORDER BY created_at DESC, id DESC"
+    
+    def serialize(value):
+        return value.isoformat() if isinstance(value, datetime) else value
+    
+    def generate():
+        # A named (server-side) cursor streams rows in batches of itersize,
+        # so memory stays flat however many tickets are exported
+        conn = get_db_connection()
+        try:
+            cur = conn.cursor(name='ticket_export')
+            cur.itersize = 2000
+            cur.execute(query, params)
+            
+            if export_format == 'csv':
+                buffer = io.StringIO()
+                writer = csv.writer(buffer)
+                writer.writerow(EXPORT_COLUMNS)
+                for row in cur:
+                    writer.writerow([serialize(value) for value in row])
+                    if buffer.tell() > 65536:
+                        yield buffer.getvalue()
+                        buffer.seek(0)
+                        buffer.truncate()
+                yield buffer.getvalue()
+            else:
+                lines = []
+                for row in cur:
+                    lines.append(json.dumps(dict(zip(EXPORT_COLUMNS, map(serialize, row)))) + '\n')
+                    if len(lines) >= 500:
+                        yield ''.join(lines)
+                        lines = []
+                yield ''.join(lines)
+            
+            cur.close()
+        finally:
+            release_db_connection(conn)
+    
+    extension = 'csv' if export_format == 'csv' else 'ndjson'
+    mimetype = 'text/csv' if export_format == 'csv' else 'application/x-ndjson'
+    filename = f"tickets_{datetime.now().strftime('%Y-%m-%d')}.{extension}"
+    return Response(generate(), mimetype=mimetype,
+                    headers={'Content-Disposition': f'attachment; filename="{filename}"'})
+
 if __name__ == '__main__':
     # Test database connection
     try:
-        conn = get_db_connection()
-        conn.close()
+        with db_connection() as conn:
+            pass
         print("Database connection successful!")
     except Exception as e:
         print(f"Database connection failed: {e}")
         exit(1)
     
+    # With the debug reloader only the child process serves requests
+    if ENRICHMENT_MODE == 'async' and os.environ.get('WERKZEUG_RUN_MAIN') == 'true':
+        start_enrichment_workers()
+    
     print("Starting AI Support Ticket System...")
     app.run(debug=True, host='0.0.0.0', port=5001)
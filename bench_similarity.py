@@ -0,0 +1,193 @@
+import argparse
+import json
+import sys
+import time
+
+import numpy as np
+import psycopg2
+from psycopg2.extras import execute_values
+
+from embedding_cache import vector_literal
+from fake_models import FakeEmbedder, synthetic_ticket
+from migrations import apply_migrations
+from vector_index import VectorSearch, apply_indexes, index_settings_from_env
+
+
+def percentile(values, pct):
+    return float(np.percentile(values, pct)) if values else 0.0
+
+
+# Seed the benchmark database with synthetic tickets embedded offline
+def seed_tickets(conn, count, embedder, rng, resolved_ratio=0.8, batch_size=1000):
+    cur = conn.cursor()
+    cur.execute("TRUNCATE support_tickets RESTART IDENTITY CASCADE")
+    for start in range(0, count, batch_size):
+        rows = []
+        for _ in range(min(batch_size, count - start)):
+            ticket = synthetic_ticket(rng)
+            status = 'resolved' if rng.random() < resolved_ratio else 'open'
+            embedding = embedder.embed(f"{ticket['subject']} {ticket['message']}")
+            rows.append(('bench@example.com', ticket['subject'], ticket['message'],
+                         ticket['category'], 'Medium', 'Neutral', status, vector_literal(embedding)))
+        execute_values(cur, """
+            INSERT INTO support_tickets (customer_email, subject, message, category,
+                                         priority, sentiment, status, embedding)
+            VALUES %s
+        """, rows, template="(%s, %s, %s, %s, %s, %s, %s, %s::vector)", page_size=batch_size)
+        conn.commit()
+    cur.execute("ANALYZE support_tickets")
+    conn.commit()
+    cur.close()
+
+
+def build_queries(count, embedder, rng):
+    queries = []
+    for _ in range(count):
+        ticket = synthetic_ticket(rng)
+        queries.append({
+            'category': ticket['category'],
+            'embedding': vector_literal(embedder.embed(f"{ticket['subject']} {ticket['message']}")),
+        })
+    return queries
+
+
+# Ground truth: the same filtered query with index scans disabled
+def exact_neighbours(conn, queries, k):
+    cur = conn.cursor()
+    truth = []
+    latencies = []
+    for query in queries:
+        started = time.perf_counter()
+        cur.execute("SET LOCAL enable_indexscan = off")
+        cur.execute("SET LOCAL enable_bitmapscan = off")
+        cur.execute("""
+            SELECT id FROM support_tickets
+            WHERE category = %s AND status = 'resolved'
+            ORDER BY embedding <=> %s::vector
+            LIMIT %s
+        """, (query['category'], query['embedding'], k))
+        truth.append([row[0] for row in cur.fetchall()])
+        conn.rollback()
+        latencies.append(time.perf_counter() - started)
+    cur.close()
+    return truth, latencies
+
+
+def summarize(config, latencies, recalls, wall_seconds):
+    latencies_ms = [l * 1000 for l in latencies]
+    return {
+        **config,
+        'queries': len(latencies),
+        'p50_ms': round(percentile(latencies_ms, 50), 3),
+        'p95_ms': round(percentile(latencies_ms, 95), 3),
+        'p99_ms': round(percentile(latencies_ms, 99), 3),
+        'qps': round(len(latencies) / wall_seconds, 2) if wall_seconds else 0.0,
+        'recall_at_k': round(float(np.mean(recalls)), 4) if recalls else 1.0,
+    }
+
+
+def run_ann(conn, queries, truth, k, settings, param_name, param_value):
+    search = VectorSearch(settings)
+    latencies = []
+    recalls = []
+    wall_started = time.perf_counter()
+    for query, expected in zip(queries, truth):
+        started = time.perf_counter()
+        rows = search.search(conn, query['embedding'], query['category'], k,
+                             **{param_name: param_value})
+        latencies.append(time.perf_counter() - started)
+        if expected:
+            found = {row[0] for row in rows}
+            recalls.append(len(found & set(expected)) / len(expected))
+    return latencies, recalls, time.perf_counter() - wall_started
+
+
+def parse_ints(value):
+    return [int(v) for v in value.split(',') if v.strip()]
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(
+        description='Benchmark exact vs. ANN similarity search on synthetic tickets (no network calls).'
+    )
+    parser.add_argument('--database', default='support_ai_bench',
+                        help='Scratch database to seed; its support_tickets table is truncated')
+    parser.add_argument('--tickets', type=int, default=20000)
+    parser.add_argument('--queries', type=int, default=200)
+    parser.add_argument('--k', type=int, default=3)
+    parser.add_argument('--index-types', default='hnsw,ivfflat')
+    parser.add_argument('--ef-search', default='10,20,40,100,200')
+    parser.add_argument('--probes', default='1,5,10,20,50')
+    parser.add_argument('--storages', default='full',
+                        help='Comma-separated vector storages to compare (full,halfvec,binary)')
+    parser.add_argument('--dimensions', type=int,
+                        help='Dimensions kept in compact storage (defaults to VECTOR_COMPACT_DIMENSIONS)')
+    parser.add_argument('--adaptive', action='store_true',
+                        help='Keep the over-fetch/widening retries on (measures end-to-end behaviour)')
+    parser.add_argument('--skip-seed', action='store_true', help='Reuse the tickets from a previous run')
+    parser.add_argument('--seed', type=int, default=42)
+    parser.add_argument('--output', help='Write JSON results here instead of stdout')
+    args = parser.parse_args()
+
+    from app import get_db_settings
+
+    db_settings = get_db_settings()
+    if args.database == db_settings['database']:
+        print("Refusing to benchmark against the application database; pass a scratch --database.")
+        sys.exit(1)
+    db_settings['database'] = args.database
+
+    rng = np.random.default_rng(args.seed)
+    embedder = FakeEmbedder()
+    conn = psycopg2.connect(**db_settings)
+    apply_migrations(conn, verbose=False)
+
+    if not args.skip_seed:
+        print(f"Seeding {args.tickets} synthetic tickets...", file=sys.stderr)
+        started = time.perf_counter()
+        seed_tickets(conn, args.tickets, embedder, rng)
+        print(f"  done in {time.perf_counter() - started:.1f}s", file=sys.stderr)
+
+    queries = build_queries(args.queries, embedder, rng)
+    truth, exact_latencies = exact_neighbours(conn, queries, args.k)
+    results = [summarize({'method': 'exact', 'tickets': args.tickets, 'k': args.k},
+                         exact_latencies, [], sum(exact_latencies))]
+
+    for index_type, storage in [(t.strip(), s.strip())
+                                for t in args.index_types.split(',') if t.strip()
+                                for s in args.storages.split(',') if s.strip()]:
+        settings = index_settings_from_env()
+        settings.update({'index_type': index_type, 'storage': storage, 'partial_index_categories': [],
+                         'index_all_tickets': False})
+        if args.dimensions:
+            settings['compact_dimensions'] = args.dimensions
+        if not args.adaptive:
+            settings.update({'overfetch_factor': 1, 'max_search_rounds': 1})
+
+        print(f"Building {index_type} index over {storage} vectors...", file=sys.stderr)
+        started = time.perf_counter()
+        apply_indexes(conn, settings, rebuild=True, verbose=False)
+        build_seconds = round(time.perf_counter() - started, 2)
+
+        param_name = 'ef_search' if index_type == 'hnsw' else 'probes'
+        for value in parse_ints(args.ef_search if index_type == 'hnsw' else args.probes):
+            latencies, recalls, wall = run_ann(conn, queries, truth, args.k, settings, param_name, value)
+            results.append(summarize({
+                'method': index_type,
+                'storage': storage,
+                'compact_dimensions': settings['compact_dimensions'] if storage != 'full' else None,
+                'tickets': args.tickets,
+                'k': args.k,
+                param_name: value,
+                'adaptive': args.adaptive,
+                'index_build_seconds': build_seconds,
+            }, latencies, recalls, wall))
+
+    conn.close()
+
+    output = json.dumps({'benchmark': 'similarity_search', 'results': results}, indent=2)
+    if args.output:
+        with open(args.output, 'w') as f:
+            f.write(output + '\n')
+    else:
+        print(output)
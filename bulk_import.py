@@ -0,0 +1,174 @@
+import argparse
+import csv
+import io
+import json
+import sys
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from psycopg2.extras import execute_values
+
+from embedding_cache import vector_literal
+from resolutions import refresh_resolutions, resolution_settings_from_env
+
+REQUIRED_FIELDS = ('customer_email', 'subject', 'message')
+LABEL_FIELDS = ('category', 'priority', 'sentiment')
+
+
+# Stream ticket dicts from a JSONL or CSV text stream without loading it all
+def read_tickets(stream, fmt='jsonl'):
+    if fmt == 'csv':
+        for row in csv.DictReader(stream):
+            yield row
+    elif fmt == 'jsonl':
+        for line in stream:
+            line = line.strip()
+            if line:
+                yield json.loads(line)
+    else:
+        raise ValueError(f"Unsupported import format: {fmt}")
+
+
+def batched(iterable, size):
+    batch = []
+    for item in iterable:
+        batch.append(item)
+        if len(batch) >= size:
+            yield batch
+            batch = []
+    if batch:
+        yield batch
+
+
+# Bulk ticket importer
+#
+# Tickets are embedded with one embeddings call per batch, classified with a
+# bounded thread pool (rows that already carry category/priority/sentiment
+# skip classification), and written with multi-row INSERTs: one statement for
+# the tickets and one for any historical responses in the batch. Historical
+# responses are embedded in the same embeddings call as their tickets, and
+# resolved tickets get their resolution summary in the batch's transaction,
+# as they would had the response been posted through the API.
+class BulkImporter:
+    def __init__(self, connection_factory, embed_batch, classify,
+                 batch_size=100, concurrency=8, on_batch=None, resolution_settings=None):
+        self.connection_factory = connection_factory
+        self.embed_batch = embed_batch
+        self.classify = classify
+        self.resolution_settings = resolution_settings or resolution_settings_from_env()
+        self.batch_size = batch_size
+        self.concurrency = concurrency
+        self.on_batch = on_batch
+
+    def _classify_missing(self, executor, tickets):
+        pending = [t for t in tickets if not all(t.get(f) for f in LABEL_FIELDS)]
+        results = executor.map(lambda t: self.classify(t['subject'], t['message']), pending)
+        for ticket in tickets:
+            ticket['classification_source'] = 'import'
+        for ticket, classification in zip(pending, results):
+            for field in LABEL_FIELDS:
+                if not ticket.get(field):
+                    ticket[field] = classification[field]
+            ticket['classification_source'] = classification.get('source', 'default')
+
+    def _write_batch(self, tickets, embeddings, response_embeddings):
+        with self.connection_factory() as conn:
+            cur = conn.cursor()
+            ids = execute_values(cur, """
+                INSERT INTO support_tickets (customer_email, subject, message, category, priority,
+                                             sentiment, classification_source, status, embedding, created_at)
+                VALUES %s
+                RETURNING id
+            """, [
+                (t['customer_email'], t['subject'], t['message'], t['category'],
+                 t['priority'], t['sentiment'], t['classification_source'], t.get('status') or 'open',
+                 vector_literal(emb), t.get('created_at') or None)
+                for t, emb in zip(tickets, embeddings)
+            ], template="(%s, %s, %s, %s, %s, %s, %s, %s, %s::vector, COALESCE(%s::timestamp, CURRENT_TIMESTAMP))",
+               page_size=len(tickets), fetch=True)
+
+            responded = [(row[0], t) for row, t in zip(ids, tickets) if t.get('response_text')]
+            responses = [
+                (ticket_id, t['response_text'], t.get('response_type') or 'human', vector_literal(emb))
+                for (ticket_id, t), emb in zip(responded, response_embeddings)
+            ]
+            if responses:
+                execute_values(cur, """
+                    INSERT INTO ticket_responses (ticket_id, response_text, response_type, embedding)
+                    VALUES %s
+                """, responses, template="(%s, %s, %s, %s::vector)", page_size=len(responses))
+
+            resolved = [ticket_id for ticket_id, t in responded if (t.get('status') or 'open') == 'resolved']
+            if resolved:
+                refresh_resolutions(cur, resolved, self.resolution_settings)
+
+            conn.commit()
+            cur.close()
+        return [row[0] for row in ids], len(responses)
+
+    def run(self, tickets):
+        summary = {'imported': 0, 'skipped': 0, 'responses': 0, 'batches': 0}
+        started = time.monotonic()
+
+        with ThreadPoolExecutor(max_workers=self.concurrency) as executor:
+            for batch in batched(tickets, self.batch_size):
+                valid = [t for t in batch if all(t.get(f) for f in REQUIRED_FIELDS)]
+                summary['skipped'] += len(batch) - len(valid)
+                if not valid:
+                    continue
+
+                # Embeddings and classification are independent, so the batch
+                # embedding call overlaps with the classification workers.
+                texts = [f"{t['subject']} {t['message']}" for t in valid]
+                texts += [t['response_text'] for t in valid if t.get('response_text')]
+                embeddings_future = executor.submit(self.embed_batch, texts)
+                self._classify_missing(executor, valid)
+                embeddings = embeddings_future.result()
+
+                ticket_ids, response_count = self._write_batch(valid, embeddings[:len(valid)],
+                                                               embeddings[len(valid):])
+                summary['imported'] += len(ticket_ids)
+                summary['responses'] += response_count
+                summary['batches'] += 1
+
+                if self.on_batch:
+                    elapsed = time.monotonic() - started
+                    self.on_batch(summary, elapsed)
+
+        summary['elapsed_seconds'] = round(time.monotonic() - started, 3)
+        summary['tickets_per_second'] = round(
+            summary['imported'] / summary['elapsed_seconds'], 2
+        ) if summary['elapsed_seconds'] else 0.0
+        return summary
+
+
+def print_progress(summary, elapsed):
+    rate = summary['imported'] / elapsed if elapsed else 0.0
+    print(f"  {summary['imported']} tickets imported ({rate:.1f} tickets/sec)", file=sys.stderr)
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Bulk import support tickets from JSONL or CSV.')
+    parser.add_argument('path', help="Input file, or '-' for stdin")
+    parser.add_argument('--format', choices=['jsonl', 'csv'],
+                        help='Input format (defaults to the file extension)')
+    parser.add_argument('--batch-size', type=int, default=100)
+    parser.add_argument('--concurrency', type=int, default=8,
+                        help='Maximum parallel classification requests')
+    args = parser.parse_args()
+
+    from app import db_connection, generate_embeddings, classify_ticket
+
+    fmt = args.format or ('csv' if args.path.endswith('.csv') else 'jsonl')
+    stream = io.TextIOWrapper(sys.stdin.buffer, encoding='utf-8') if args.path == '-' \
+        else open(args.path, newline='', encoding='utf-8')
+
+    importer = BulkImporter(db_connection, generate_embeddings, classify_ticket,
+                            batch_size=args.batch_size, concurrency=args.concurrency,
+                            on_batch=print_progress)
+    try:
+        summary = importer.run(read_tickets(stream, fmt))
+    finally:
+        stream.close()
+
+    print(json.dumps(summary))
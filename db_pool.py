@@ -0,0 +1,244 @@
+import threading
+import time
+
+import psycopg2
+from psycopg2 import extensions
+
+
+class PoolTimeout(Exception):
+    pass
+
+
+# Cursor that runs every statement inside ObservedCursor.observe(query), a
+# context manager installed by the app for query timing and tracing. Pass it
+# as cursor_factory in the connection settings; with no observer installed it
+# behaves like a plain cursor.
+class ObservedCursor(extensions.cursor):
+    observe = None
+
+    def execute(self, query, vars=None):
+        observe = ObservedCursor.observe
+        if observe is None:
+            return super().execute(query, vars)
+        with observe(query):
+            return super().execute(query, vars)
+
+
+# Process-wide Postgres connection pool
+#
+# Connections are created lazily up to max_size, validated on checkout and
+# reaped back down to min_size once they have been idle for idle_timeout
+# seconds. Callers that find the pool exhausted wait up to checkout_timeout
+# seconds for a connection to be returned.
+class ConnectionPool:
+    def __init__(self, connect_kwargs, min_size=1, max_size=10,
+                 checkout_timeout=10.0, idle_timeout=300.0,
+                 health_check_interval=30.0, reap_interval=60.0):
+        if min_size < 0 or max_size < 1 or min_size > max_size:
+            raise ValueError("Invalid pool size: min=%s max=%s" % (min_size, max_size))
+
+        self.connect_kwargs = connect_kwargs
+        self.min_size = min_size
+        self.max_size = max_size
+        self.checkout_timeout = checkout_timeout
+        self.idle_timeout = idle_timeout
+        self.health_check_interval = health_check_interval
+        self.reap_interval = reap_interval
+
+        self._lock = threading.Condition()
+        self._idle = []  # list of (conn, returned_at) with the most recent last
+        self._in_use = set()
+        self._closed = False
+        self._last_reap = time.monotonic()
+        self._stats = {
+            'connections_created': 0,
+            'connections_closed': 0,
+            'checkouts': 0,
+            'checkout_timeouts': 0,
+            'health_check_failures': 0,
+            'waits': 0,
+            'wait_time_total': 0.0,
+            'wait_time_max': 0.0,
+        }
+
+        for _ in range(min_size):
+            self._idle.append((self._connect(), time.monotonic()))
+
+    def _connect(self):
+        conn = psycopg2.connect(**self.connect_kwargs)
+        self._stats['connections_created'] += 1
+        return conn
+
+    # Close connections that have already been taken out of the pool's
+    # bookkeeping; called without the lock held, since close() can block on
+    # a dead socket
+    def _close(self, conns):
+        for conn in conns:
+            try:
+                conn.close()
+            except Exception:
+                pass
+
+    def _is_healthy(self, conn, idle_for):
+        if conn.closed:
+            return False
+        if conn.get_transaction_status() != extensions.TRANSACTION_STATUS_IDLE:
+            return False
+        # Only round-trip to the server for connections that have been idle
+        # long enough for a firewall or server restart to have dropped them.
+        if idle_for < self.health_check_interval:
+            return True
+        try:
+            cur = conn.cursor()
+            cur.execute("SELECT 1")
+            cur.fetchone()
+            cur.close()
+            conn.rollback()
+            return True
+        except Exception:
+            return False
+
+    # The lock only guards the idle list, the in-use set and the stats. A
+    # checkout reserves its slot under the lock (an idle candidate, or a
+    # placeholder for a new connection), then validates, connects or closes
+    # with the lock released so a slow server cannot stall other threads.
+    def getconn(self):
+        started = time.monotonic()
+        deadline = started + self.checkout_timeout
+        waited = False
+
+        while True:
+            candidate = placeholder = None
+            with self._lock:
+                if self._closed:
+                    raise PoolTimeout("Connection pool is closed")
+
+                stale = self._maybe_reap()
+
+                if self._idle:
+                    candidate, returned_at = self._idle.pop()
+                    self._in_use.add(candidate)
+                elif len(self._in_use) < self.max_size:
+                    # Reserve the slot before connecting so concurrent callers
+                    # cannot overshoot max_size.
+                    placeholder = object()
+                    self._in_use.add(placeholder)
+                elif not stale:
+                    remaining = deadline - time.monotonic()
+                    if remaining <= 0:
+                        self._stats['checkout_timeouts'] += 1
+                        raise PoolTimeout(
+                            "Timed out after %.1fs waiting for a database connection" % self.checkout_timeout
+                        )
+                    waited = True
+                    self._lock.wait(remaining)
+                    continue
+
+            self._close(stale)
+
+            if candidate is not None:
+                if self._is_healthy(candidate, time.monotonic() - returned_at):
+                    conn = candidate
+                    break
+                self._close([candidate])
+                with self._lock:
+                    self._in_use.discard(candidate)
+                    self._stats['health_check_failures'] += 1
+                    self._stats['connections_closed'] += 1
+                    self._lock.notify()
+                continue
+
+            if placeholder is not None:
+                try:
+                    conn = psycopg2.connect(**self.connect_kwargs)
+                except Exception:
+                    with self._lock:
+                        self._in_use.discard(placeholder)
+                        self._lock.notify()
+                    raise
+                with self._lock:
+                    self._in_use.discard(placeholder)
+                    self._in_use.add(conn)
+                    self._stats['connections_created'] += 1
+                break
+
+        with self._lock:
+            self._stats['checkouts'] += 1
+            if waited:
+                wait_time = time.monotonic() - started
+                self._stats['waits'] += 1
+                self._stats['wait_time_total'] += wait_time
+                self._stats['wait_time_max'] = max(self._stats['wait_time_max'], wait_time)
+
+        return conn
+
+    def putconn(self, conn, discard=False):
+        if not discard and not conn.closed:
+            try:
+                # Never hand out a connection with a half-finished transaction
+                if conn.get_transaction_status() != extensions.TRANSACTION_STATUS_IDLE:
+                    conn.rollback()
+            except Exception:
+                discard = True
+        else:
+            discard = True
+
+        with self._lock:
+            self._in_use.discard(conn)
+            discard = discard or self._closed
+            if discard:
+                self._stats['connections_closed'] += 1
+            else:
+                self._idle.append((conn, time.monotonic()))
+            self._lock.notify()
+        if discard:
+            self._close([conn])
+
+    # Remove connections idle past idle_timeout (down to min_size) from the
+    # idle list and return them; the caller closes them outside the lock
+    def _maybe_reap(self):
+        now = time.monotonic()
+        if now - self._last_reap < self.reap_interval:
+            return []
+        self._last_reap = now
+
+        keep = []
+        stale = []
+        # Oldest connections are at the front of the idle list
+        for conn, returned_at in self._idle:
+            total = len(keep) + len(self._in_use)
+            if now - returned_at > self.idle_timeout and total >= self.min_size:
+                stale.append(conn)
+            else:
+                keep.append((conn, returned_at))
+        self._idle = keep
+        self._stats['connections_closed'] += len(stale)
+        return stale
+
+    def reap(self):
+        with self._lock:
+            self._last_reap = 0
+            stale = self._maybe_reap()
+        self._close(stale)
+        return len(stale)
+
+    def closeall(self):
+        with self._lock:
+            self._closed = True
+            idle = [conn for conn, _ in self._idle]
+            self._idle = []
+            self._stats['connections_closed'] += len(idle)
+            self._lock.notify_all()
+        self._close(idle)
+
+    def stats(self):
+        with self._lock:
+            stats = dict(self._stats)
+            stats.update({
+                'min_size': self.min_size,
+                'max_size': self.max_size,
+                'idle': len(self._idle),
+                'in_use': len(self._in_use),
+                'wait_time_avg': (stats['wait_time_total'] / stats['waits']) if stats['waits'] else 0.0,
+            })
+        return stats
@@ -0,0 +1,124 @@
+import os
+import threading
+
+from embedding_cache import vector_literal
+
+# Only generated responses are reused for a duplicate; an agent's reply or
+# resolution note was written to a different customer
+AI_RESPONSE_TYPES = ('ai_suggested', 'ai_cached', 'ai_cluster')
+
+
+def dedup_settings_from_env():
+    return {
+        'enabled': os.getenv('DEDUP_ENABLED', 'false').lower() == 'true',
+        'window_minutes': int(os.getenv('DEDUP_WINDOW_MINUTES', 120)),
+        'threshold': float(os.getenv('DEDUP_SIMILARITY_THRESHOLD', 0.92)),
+    }
+
+
+# Online near-duplicate detection
+#
+# A new ticket is compared against the open, already-enriched tickets created
+# within the window. The ANN indexes only cover resolved tickets, so this is an
+# exact scan, but the window keeps it to the tickets of the last couple of
+# hours (found through the open-ticket created_at index). A match above the
+# threshold puts the new ticket in the matched ticket's cluster (starting one
+# if needed) and its labels and suggested response are reused, so an outage
+# that produces hundreds of identical tickets pays for one set of model calls.
+class DuplicateDetector:
+    def __init__(self, settings):
+        self.settings = settings
+        self._lock = threading.Lock()
+        self._stats = {'checks': 0, 'duplicates': 0, 'clusters_created': 0}
+
+    @property
+    def enabled(self):
+        return self.settings['enabled']
+
+    def _count(self, name):
+        with self._lock:
+            self._stats[name] += 1
+
+    def find(self, conn, embedding, exclude_id=None):
+        if not isinstance(embedding, str):
+            embedding = vector_literal(embedding)
+
+        self._count('checks')
+        cur = conn.cursor()
+        try:
+            cur.execute("""
+                SELECT t.id, t.cluster_id, t.category, t.priority, t.sentiment,
+                       1 - (t.embedding <=> %s::vector) as similarity,
+                       (SELECT r.response_text FROM ticket_responses r
+                        WHERE r.ticket_id = t.id AND r.response_type = ANY(%s)
+                        ORDER BY r.created_at DESC, r.id DESC LIMIT 1)
+                FROM support_tickets t
+                WHERE t.status = 'open'
+                  AND t.enrichment_status = 'complete'
+                  AND t.embedding IS NOT NULL
+                  AND t.created_at > NOW() - make_interval(mins => %s)
+                  AND t.id <> %s
+                ORDER BY t.embedding <=> %s::vector
+                LIMIT 1
+            """, (embedding, list(AI_RESPONSE_TYPES), self.settings['window_minutes'], exclude_id or 0, embedding))
+            row = cur.fetchone()
+            conn.rollback()
+        finally:
+            cur.close()
+
+        if row is None or row[5] < self.settings['threshold']:
+            return None
+
+        self._count('duplicates')
+        return {
+            'ticket_id': row[0],
+            'cluster_id': row[1],
+            'classification': {
+                'category': row[2],
+                'priority': row[3],
+                'sentiment': row[4],
+                'urgency_keywords': []
+            },
+            'similarity': float(row[5]),
+            'response_text': row[6]
+        }
+
+    # Runs inside the caller's write transaction, after the new ticket row exists
+    def attach(self, cur, ticket_id, duplicate):
+        # Lock the matched ticket so concurrent duplicates agree on one cluster
+        cur.execute("""
+            SELECT cluster_id FROM support_tickets WHERE id = %s FOR UPDATE
+        """, (duplicate['ticket_id'],))
+        row = cur.fetchone()
+        cluster_id = row[0] if row else None
+
+        if cluster_id is None:
+            classification = duplicate['classification']
+            cur.execute("""
+                INSERT INTO ticket_clusters (canonical_ticket_id, category, priority, sentiment, response_text)
+                VALUES (%s, %s, %s, %s, %s)
+                RETURNING id
+            """, (duplicate['ticket_id'], classification['category'], classification['priority'],
+                  classification['sentiment'], duplicate['response_text']))
+            cluster_id = cur.fetchone()[0]
+            cur.execute("""
+                UPDATE support_tickets SET cluster_id = %s WHERE id = %s
+            """, (cluster_id, duplicate['ticket_id']))
+            self._count('clusters_created')
+
+        cur.execute("""
+            UPDATE support_tickets SET cluster_id = %s WHERE id = %s
+        """, (cluster_id, ticket_id))
+        cur.execute("""
+            UPDATE ticket_clusters
+            SET ticket_count = ticket_count + 1, last_seen_at = CURRENT_TIMESTAMP
+            WHERE id = %s
+        """, (cluster_id,))
+        return cluster_id
+
+    def stats(self):
+        with self._lock:
+            stats = dict(self._stats)
+        stats['duplicate_rate'] = stats['duplicates'] / stats['checks'] if stats['checks'] else 0.0
+        stats.update(self.settings)
+        return stats
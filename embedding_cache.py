@@ -0,0 +1,261 @@
+import hashlib
+import struct
+import threading
+import time
+from collections import OrderedDict
+
+from psycopg2.extras import execute_values
+
+
+def text_hash(text, model):
+    # Whitespace-only differences produce the same embedding request key
+    normalized = ' '.join(text.split())
+    return hashlib.sha256(f"{model}\x00{normalized}".encode('utf-8')).hexdigest()
+
+
+def pack_vector(vector):
+    return struct.pack(f'<{len(vector)}f', *vector)
+
+
+def unpack_vector(data):
+    return list(struct.unpack(f'<{len(data) // 4}f', data))
+
+
+def vector_literal(vector):
+    # pgvector text format, for use with an explicit ::vector cast
+    return '[' + ','.join(repr(float(x)) for x in vector) + ']'
+
+
+# Content-addressed embedding cache
+#
+# Lookups go to an in-memory LRU first and then to the embedding_cache table,
+# where vectors are stored as little-endian float32 bytes (4 bytes per
+# dimension instead of the ~10+ characters of a JSON/text vector). Entries
+# expire after ttl seconds in both tiers; the table is trimmed back to
+# db_max_rows by least-recent use every prune_every writes.
+class EmbeddingCache:
+    def __init__(self, connection_factory=None, max_entries=10000, ttl=7 * 24 * 3600,
+                 db_max_rows=1000000, prune_every=1000):
+        self.connection_factory = connection_factory
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.db_max_rows = db_max_rows
+        self.prune_every = prune_every
+
+        self._lock = threading.Lock()
+        self._entries = OrderedDict()  # key -> (vector, expires_at)
+        self._writes_since_prune = 0
+        self._stats = {
+            'memory_hits': 0,
+            'db_hits': 0,
+            'misses': 0,
+            'evictions': 0,
+            'db_errors': 0,
+        }
+
+    def _count(self, name, amount=1):
+        with self._lock:
+            self._stats[name] += amount
+
+    # Memory tier
+    def _memory_get(self, key):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return None
+            vector, expires_at = entry
+            if expires_at < time.monotonic():
+                del self._entries[key]
+                self._stats['evictions'] += 1
+                return None
+            self._entries.move_to_end(key)
+            return vector
+
+    def _memory_put(self, key, vector):
+        with self._lock:
+            self._entries[key] = (vector, time.monotonic() + self.ttl)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+                self._stats['evictions'] += 1
+
+    # Persistent tier
+    def _db_get(self, key, model):
+        if self.connection_factory is None:
+            return None
+        try:
+            with self.connection_factory() as conn:
+                cur = conn.cursor()
+                cur.execute("""
+                    UPDATE embedding_cache
+                    SET last_used_at = NOW()
+                    WHERE text_hash = %s AND model = %s
+                      AND created_at >= NOW() - make_interval(secs => %s)
+                    RETURNING embedding
+                """, (key, model, self.ttl))
+                row = cur.fetchone()
+                conn.commit()
+                cur.close()
+            return unpack_vector(bytes(row[0])) if row else None
+        except Exception as e:
+            self._count('db_errors')
+            print(f"Error reading embedding cache: {e}")
+            return None
+
+    def _db_put(self, key, model, vector):
+        if self.connection_factory is None:
+            return
+        try:
+            with self.connection_factory() as conn:
+                cur = conn.cursor()
+                cur.execute("""
+                    INSERT INTO embedding_cache (text_hash, model, dimensions, embedding)
+                    VALUES (%s, %s, %s, %s)
+                    ON CONFLICT (text_hash, model) DO UPDATE
+                    SET embedding = EXCLUDED.embedding,
+                        dimensions = EXCLUDED.dimensions,
+                        created_at = NOW(),
+                        last_used_at = NOW()
+                """, (key, model, len(vector), pack_vector(vector)))
+                conn.commit()
+                cur.close()
+        except Exception as e:
+            self._count('db_errors')
+            print(f"Error writing embedding cache: {e}")
+            return
+
+        with self._lock:
+            self._writes_since_prune += 1
+            should_prune = self._writes_since_prune >= self.prune_every
+            if should_prune:
+                self._writes_since_prune = 0
+        if should_prune:
+            self.prune()
+
+    def prune(self):
+        if self.connection_factory is None:
+            return 0
+        try:
+            with self.connection_factory() as conn:
+                cur = conn.cursor()
+                cur.execute("""
+                    DELETE FROM embedding_cache
+                    WHERE created_at < NOW() - make_interval(secs => %s)
+                """, (self.ttl,))
+                deleted = cur.rowcount
+                cur.execute("""
+                    DELETE FROM embedding_cache
+                    WHERE last_used_at < (
+                        SELECT last_used_at FROM embedding_cache
+                        ORDER BY last_used_at DESC
+                        OFFSET %s LIMIT 1
+                    )
+                """, (self.db_max_rows,))
+                deleted += cur.rowcount
+                conn.commit()
+                cur.close()
+            self._count('evictions', deleted)
+            return deleted
+        except Exception as e:
+            self._count('db_errors')
+            print(f"Error pruning embedding cache: {e}")
+            return 0
+
+    def get(self, text, model):
+        key = text_hash(text, model)
+        vector = self._memory_get(key)
+        if vector is not None:
+            self._count('memory_hits')
+            return vector
+
+        vector = self._db_get(key, model)
+        if vector is not None:
+            self._count('db_hits')
+            self._memory_put(key, vector)
+            return vector
+
+        self._count('misses')
+        return None
+
+    def put(self, text, model, vector):
+        key = text_hash(text, model)
+        self._memory_put(key, vector)
+        self._db_put(key, model, vector)
+
+    def get_many(self, texts, model):
+        keys = [text_hash(text, model) for text in texts]
+        vectors = [self._memory_get(key) for key in keys]
+        self._count('memory_hits', sum(1 for v in vectors if v is not None))
+
+        missing = list({key for key, v in zip(keys, vectors) if v is None})
+        found = {}
+        if missing and self.connection_factory is not None:
+            try:
+                with self.connection_factory() as conn:
+                    cur = conn.cursor()
+                    cur.execute("""
+                        UPDATE embedding_cache
+                        SET last_used_at = NOW()
+                        WHERE text_hash = ANY(%s) AND model = %s
+                          AND created_at >= NOW() - make_interval(secs => %s)
+                        RETURNING text_hash, embedding
+                    """, (missing, model, self.ttl))
+                    found = {row[0]: unpack_vector(bytes(row[1])) for row in cur.fetchall()}
+                    conn.commit()
+                    cur.close()
+            except Exception as e:
+                self._count('db_errors')
+                print(f"Error reading embedding cache: {e}")
+
+        for i, key in enumerate(keys):
+            if vectors[i] is not None:
+                continue
+            if key in found:
+                vectors[i] = found[key]
+                self._memory_put(key, found[key])
+                self._count('db_hits')
+            else:
+                self._count('misses')
+        return vectors
+
+    def put_many(self, texts, model, vectors):
+        rows = {}
+        for text, vector in zip(texts, vectors):
+            key = text_hash(text, model)
+            self._memory_put(key, vector)
+            rows[key] = (key, model, len(vector), pack_vector(vector))
+        if self.connection_factory is None or not rows:
+            return
+        try:
+            with self.connection_factory() as conn:
+                cur = conn.cursor()
+                execute_values(cur, """
+                    INSERT INTO embedding_cache (text_hash, model, dimensions, embedding)
+                    VALUES %s
+                    ON CONFLICT (text_hash, model) DO UPDATE
+                    SET embedding = EXCLUDED.embedding,
+                        dimensions = EXCLUDED.dimensions,
+                        created_at = NOW(),
+                        last_used_at = NOW()
+                """, list(rows.values()))
+                conn.commit()
+                cur.close()
+        except Exception as e:
+            self._count('db_errors')
+            print(f"Error writing embedding cache: {e}")
+
+    def get_or_compute(self, text, model, compute):
+        vector = self.get(text, model)
+        if vector is None:
+            vector = compute(text)
+            self.put(text, model, vector)
+        return vector
+
+    def stats(self):
+        with self._lock:
+            stats = dict(self._stats)
+            stats['memory_entries'] = len(self._entries)
+        hits = stats['memory_hits'] + stats['db_hits']
+        lookups = hits + stats['misses']
+        stats['hit_rate'] = (hits / lookups) if lookups else 0.0
+        return stats
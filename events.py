@@ -0,0 +1,190 @@
+import json
+import queue
+import select
+import threading
+from datetime import date, timedelta
+
+import psycopg2
+
+CHANNEL = 'ticket_events'
+
+# Analytics dimensions carried in each notification, keyed by the field name
+# the /analytics response uses for them
+DIMENSIONS = {'category': 'categories', 'priority': 'priorities', 'sentiment': 'sentiments'}
+
+
+# Turn one ticket_events notification into the events sent to dashboards:
+# the ticket itself plus the change it makes to the /analytics numbers, so a
+# client can apply it without refetching.
+def ticket_event_messages(payload, today=None):
+    ticket = payload['ticket']
+    old = payload.get('old')
+    today = today or date.today()
+
+    delta = {field: {} for field in DIMENSIONS.values()}
+    for dimension, field in DIMENSIONS.items():
+        new_value = ticket.get(dimension) or ''
+        old_value = (old.get(dimension) or '') if old else None
+        if old_value == new_value:
+            continue
+        delta[field][new_value] = delta[field].get(new_value, 0) + 1
+        if old is not None:
+            delta[field][old_value] = delta[field].get(old_value, 0) - 1
+
+    # recent_week / daily cover whole days, including today
+    recent_week = {'total': 0, 'open': 0, 'resolved': 0}
+    daily = {}
+    day = (ticket.get('created_at') or '')[:10]
+    if day and date.fromisoformat(day) > today - timedelta(days=7):
+        status = ticket.get('status')
+        old_status = old.get('status') if old else None
+        if old is None:
+            recent_week['total'] += 1
+            daily[day] = 1
+        if status != old_status:
+            for name in ('open', 'resolved'):
+                recent_week[name] += (status == name) - (old_status == name)
+
+    delta = {field: changes for field, changes in delta.items() if changes}
+    if any(recent_week.values()):
+        delta['recent_week'] = recent_week
+    if daily:
+        delta['daily'] = daily
+
+    event = 'ticket_created' if payload['op'] == 'INSERT' else 'ticket_updated'
+    messages = [(event, ticket)]
+    if delta:
+        messages.append(('analytics_delta', delta))
+    return messages
+
+
+# Fan-out of Postgres notifications to server-sent-event subscribers
+#
+# One background thread per process holds a dedicated connection (outside the
+# pool, since it is parked in LISTEN for its whole life) and hands every
+# notification to each subscriber's bounded queue. A subscriber that falls
+# behind has its queue replaced by a single 'resync' event instead of
+# blocking the listener, and every subscriber gets a 'resync' after the
+# listener reconnects, because notifications sent while it was away are lost.
+class EventBroadcaster:
+    def __init__(self, connect_kwargs, channel=CHANNEL, queue_size=256, translate=ticket_event_messages,
+                 reconnect_delay=1.0, max_reconnect_delay=30.0):
+        self.connect_kwargs = connect_kwargs
+        self.channel = channel
+        self.queue_size = queue_size
+        self.translate = translate
+        self.reconnect_delay = reconnect_delay
+        self.max_reconnect_delay = max_reconnect_delay
+        self._lock = threading.Lock()
+        self._subscribers = set()
+        self._thread = None
+        self._stop = threading.Event()
+        self._connected = False
+        self._stats = {'notifications': 0, 'events': 0, 'resyncs': 0, 'reconnects': 0, 'errors': 0}
+
+    def start(self):
+        with self._lock:
+            if self._thread is None or not self._thread.is_alive():
+                self._stop.clear()
+                self._thread = threading.Thread(target=self._run, name='ticket-events-listener', daemon=True)
+                self._thread.start()
+
+    def stop(self, timeout=None):
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join(timeout)
+
+    def subscribe(self):
+        subscriber = queue.Queue(maxsize=self.queue_size)
+        with self._lock:
+            self._subscribers.add(subscriber)
+        self.start()
+        return subscriber
+
+    def unsubscribe(self, subscriber):
+        with self._lock:
+            self._subscribers.discard(subscriber)
+
+    def publish(self, event, data):
+        with self._lock:
+            subscribers = list(self._subscribers)
+            self._stats['events'] += 1
+        for subscriber in subscribers:
+            try:
+                subscriber.put_nowait((event, data))
+            except queue.Full:
+                self._resync(subscriber)
+
+    def _resync(self, subscriber):
+        # Drop the backlog; the client refetches everything on 'resync'
+        with self._lock:
+            self._stats['resyncs'] += 1
+        try:
+            while True:
+                subscriber.get_nowait()
+        except queue.Empty:
+            pass
+        try:
+            subscriber.put_nowait(('resync', {}))
+        except queue.Full:
+            pass
+
+    def _count(self, name):
+        with self._lock:
+            self._stats[name] += 1
+
+    def _handle(self, notify):
+        self._count('notifications')
+        try:
+            messages = self.translate(json.loads(notify.payload))
+        except Exception as e:
+            self._count('errors')
+            print(f"Error decoding ticket event: {e}")
+            return
+        for event, data in messages:
+            self.publish(event, data)
+
+    def _run(self):
+        delay = self.reconnect_delay
+        first = True
+        while not self._stop.is_set():
+            conn = None
+            try:
+                conn = psycopg2.connect(**self.connect_kwargs)
+                conn.autocommit = True
+                conn.cursor().execute(f"LISTEN {self.channel}")
+                self._connected = True
+                delay = self.reconnect_delay
+                if not first:
+                    self._count('reconnects')
+                    with self._lock:
+                        subscribers = list(self._subscribers)
+                    for subscriber in subscribers:
+                        self._resync(subscriber)
+
+                while not self._stop.is_set():
+                    if select.select([conn], [], [], 1.0) == ([], [], []):
+                        continue
+                    conn.poll()
+                    while conn.notifies:
+                        self._handle(conn.notifies.pop(0))
+            except Exception as e:
+                self._count('errors')
+                print(f"Error listening for ticket events: {e}")
+            finally:
+                first = False
+                self._connected = False
+                if conn is not None:
+                    try:
+                        conn.close()
+                    except Exception:
+                        pass
+            self._stop.wait(delay)
+            delay = min(delay * 2, self.max_reconnect_delay)
+
+    def stats(self):
+        with self._lock:
+            stats = dict(self._stats)
+            stats['subscribers'] = len(self._subscribers)
+        stats['connected'] = self._connected
+        return stats
@@ -0,0 +1,113 @@
+import hashlib
+import re
+from functools import lru_cache
+
+import numpy as np
+
+EMBEDDING_DIMENSIONS = 1536
+
+TOKEN_PATTERN = re.compile(r"[a-z0-9_]+")
+
+
+@lru_cache(maxsize=65536)
+def _token_vector(token, dims):
+    seed = int.from_bytes(hashlib.sha256(token.encode('utf-8')).digest()[:8], 'little')
+    return np.random.default_rng(seed).standard_normal(dims).astype(np.float32)
+
+
+# Deterministic offline embedder
+#
+# Each token maps to a fixed pseudo-random direction and a text embeds to the
+# normalized sum of its token directions, so texts that share words land close
+# together in cosine space. No network, no model weights, same output on
+# every machine; good enough to exercise indexes and ranking, not to judge
+# retrieval quality.
+class FakeEmbedder:
+    def __init__(self, dims=EMBEDDING_DIMENSIONS):
+        self.dims = dims
+
+    def embed_array(self, text):
+        tokens = TOKEN_PATTERN.findall(text.lower()) or ['<empty>']
+        vector = np.zeros(self.dims, dtype=np.float32)
+        for token in tokens:
+            vector += _token_vector(token, self.dims)
+        norm = np.linalg.norm(vector)
+        return vector / norm if norm else vector
+
+    def embed(self, text):
+        return self.embed_array(text).tolist()
+
+    def embed_many(self, texts):
+        return [self.embed(text) for text in texts]
+
+
+# Synthetic ticket generator with per-category vocabularies, so category
+# filters and nearest neighbours behave like real clustered support data.
+CATEGORY_VOCABULARY = {
+    'Technical Issue': ['error', 'crash', 'timeout', 'server', 'slow', 'connection', 'install', 'update', 'sync', 'network'],
+    'Billing': ['invoice', 'charge', 'payment', 'card', 'subscription', 'plan', 'receipt', 'tax', 'billing', 'price'],
+    'Account Access': ['login', 'password', 'reset', 'locked', 'credentials', 'mfa', 'email', 'verify', 'session', 'sso'],
+    'Feature Request': ['feature', 'add', 'support', 'option', 'integration', 'api', 'export', 'dark', 'mode', 'custom'],
+    'General Inquiry': ['question', 'how', 'hours', 'contact', 'docs', 'pricing', 'trial', 'team', 'info', 'help'],
+    'Bug Report': ['bug', 'broken', 'exp_001', 'fails', 'wrong', 'display', 'download', 'dashboard', 'data', 'button'],
+    'Refund Request': ['refund', 'cancel', 'money', 'back', 'return', 'duplicate', 'overcharged', 'credit', 'dispute', 'order'],
+}
+COMMON_WORDS = ['please', 'urgent', 'today', 'account', 'issue', 'thanks', 'need', 'since', 'again', 'still']
+
+
+def synthetic_ticket(rng, category=None):
+    categories = list(CATEGORY_VOCABULARY)
+    if category is None:
+        category = categories[rng.integers(len(categories))]
+    vocabulary = CATEGORY_VOCABULARY[category]
+    topic_words = [vocabulary[i] for i in rng.choice(len(vocabulary), size=4, replace=False)]
+    filler = [COMMON_WORDS[i] for i in rng.choice(len(COMMON_WORDS), size=3, replace=False)]
+    # A unique token keeps every ticket distinct while staying near its topic
+    unique = f"ref{rng.integers(10 ** 9)}"
+    subject = ' '.join(topic_words[:2]).capitalize()
+    message = ' '.join(topic_words + filler + [unique])
+    return {'category': category, 'subject': subject, 'message': message}
+
+
+# The ticket part of a classification or response prompt, so the stand-ins
+# below only look at the customer's words and not the instructions
+def ticket_text(prompt):
+    fields = re.findall(r'^\s*(?:Subject|Message):\s*(.*)$', prompt, flags=re.MULTILINE)
+    return ' '.join(fields) if fields else prompt
+
+
+# Keyword-based stand-ins for the chat model
+PRIORITY_KEYWORDS = {
+    'Critical': ['urgent', 'immediately', 'broken', 'down', 'lost', 'critical', 'asap'],
+    'High': ['not working', 'fails', 'error', 'cannot', "can't", 'charged twice'],
+    'Low': ['feature', 'suggestion', 'thank', 'love', 'great'],
+}
+SENTIMENT_KEYWORDS = {
+    'Frustrated': ['unacceptable', 'frustrated', 'ridiculous', 'demand', '!!', 'completely broken'],
+    'Negative': ['broken', 'fails', 'wrong', 'problem', 'issue', 'not working'],
+    'Positive': ['thank', 'love', 'great', 'fantastic', 'appreciate'],
+}
+
+
+def fake_classification(text):
+    lowered = text.lower()
+    tokens = set(TOKEN_PATTERN.findall(lowered))
+    scores = {
+        category: len(tokens & set(words))
+        for category, words in CATEGORY_VOCABULARY.items()
+    }
+    category = max(scores, key=scores.get) if max(scores.values()) else 'General Inquiry'
+    priority = next((p for p, words in PRIORITY_KEYWORDS.items() if any(w in lowered for w in words)), 'Medium')
+    sentiment = next((s for s, words in SENTIMENT_KEYWORDS.items() if any(w in lowered for w in words)), 'Neutral')
+    urgency = [w for w in PRIORITY_KEYWORDS['Critical'] if w in lowered]
+    return {'category': category, 'priority': priority, 'sentiment': sentiment, 'urgency_keywords': urgency}
+
+
+def fake_response(text):
+    classification = fake_classification(text)
+    return (
+        "Thank you for reaching out. We understand this is about a "
+        f"{classification['category'].lower()} matter and have logged it with "
+        f"{classification['priority'].lower()} priority. A member of our team will follow "
+        "up with next steps shortly."
+    )
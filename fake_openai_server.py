@@ -0,0 +1,152 @@
+import argparse
+import json
+import random
+import time
+import uuid
+
+from flask import Flask, Response, jsonify, request
+
+from fake_models import FakeEmbedder, fake_classification, fake_response, ticket_text
+
+# Local stand-in for the OpenAI API
+#
+# Implements the two endpoints the app uses, /v1/embeddings and
+# /v1/chat/completions (including stream=true, with the final usage chunk when
+# stream_options.include_usage is set), with configurable latency and error
+# injection. Point the app at it with OPENAI_BASE_URL.
+app = Flask(__name__)
+embedder = FakeEmbedder()
+settings = {
+    'embedding_latency': 0.05,
+    'chat_latency': 0.8,
+    'jitter': 0.2,
+    'error_rate': 0.0,
+    'tokens_per_second': 50.0,
+}
+
+
+def simulate_latency(base):
+    time.sleep(max(0.0, random.gauss(base, base * settings['jitter'])))
+
+
+def maybe_rate_limit():
+    if random.random() < settings['error_rate']:
+        return jsonify({'error': {'message': 'Rate limit reached (simulated)', 'type': 'rate_limit_error'}}), 429
+    return None
+
+
+def count_tokens(text):
+    return max(1, len(text) // 4)
+
+
+@app.route('/v1/embeddings', methods=['POST'])
+def embeddings():
+    error = maybe_rate_limit()
+    if error:
+        return error
+
+    body = request.get_json()
+    inputs = body['input'] if isinstance(body['input'], list) else [body['input']]
+    simulate_latency(settings['embedding_latency'])
+
+    return jsonify({
+        'object': 'list',
+        'model': body.get('model', 'text-embedding-3-small'),
+        'data': [
+            {'object': 'embedding', 'index': i, 'embedding': embedder.embed(text)}
+            for i, text in enumerate(inputs)
+        ],
+        'usage': {
+            'prompt_tokens': sum(count_tokens(t) for t in inputs),
+            'total_tokens': sum(count_tokens(t) for t in inputs),
+        },
+    })
+
+
+@app.route('/v1/chat/completions', methods=['POST'])
+def chat_completions():
+    error = maybe_rate_limit()
+    if error:
+        return error
+
+    body = request.get_json()
+    prompt = '\n'.join(m.get('content') or '' for m in body['messages'])
+    if 'classify' in prompt.lower():
+        content = json.dumps(fake_classification(ticket_text(prompt)))
+    else:
+        content = fake_response(ticket_text(prompt))
+
+    completion_id = f"chatcmpl-{uuid.uuid4().hex}"
+    model = body.get('model', 'gpt-3.5-turbo')
+    usage = {
+        'prompt_tokens': count_tokens(prompt),
+        'completion_tokens': count_tokens(content),
+        'total_tokens': count_tokens(prompt) + count_tokens(content),
+    }
+
+    if body.get('stream'):
+        include_usage = (body.get('stream_options') or {}).get('include_usage', False)
+
+        def generate():
+            # Time to first token, then a steady token rate
+            simulate_latency(settings['chat_latency'] / 4)
+            words = content.split(' ')
+            for i, word in enumerate(words):
+                chunk = {
+                    'id': completion_id, 'object': 'chat.completion.chunk', 'created': int(time.time()),
+                    'model': model,
+                    'choices': [{'index': 0, 'delta': {'content': word + (' ' if i < len(words) - 1 else '')},
+                                 'finish_reason': None}],
+                }
+                if include_usage:
+                    chunk['usage'] = None
+                yield f"data: {json.dumps(chunk)}\n\n"
+                time.sleep(1.0 / settings['tokens_per_second'])
+            final = {
+                'id': completion_id, 'object': 'chat.completion.chunk', 'created': int(time.time()),
+                'model': model, 'choices': [{'index': 0, 'delta': {}, 'finish_reason': 'stop'}],
+            }
+            if include_usage:
+                final['usage'] = None
+            yield f"data: {json.dumps(final)}\n\n"
+            if include_usage:
+                usage_chunk = {
+                    'id': completion_id, 'object': 'chat.completion.chunk', 'created': int(time.time()),
+                    'model': model, 'choices': [], 'usage': usage,
+                }
+                yield f"data: {json.dumps(usage_chunk)}\n\n"
+            yield "data: [DONE]\n\n"
+        return Response(generate(), mimetype='text/event-stream')
+
+    simulate_latency(settings['chat_latency'])
+    return jsonify({
+        'id': completion_id,
+        'object': 'chat.completion',
+        'created': int(time.time()),
+        'model': model,
+        'choices': [{
+            'index': 0,
+            'message': {'role': 'assistant', 'content': content},
+            'finish_reason': 'stop',
+        }],
+        'usage': usage,
+    })
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Run a local fake OpenAI API for offline load tests.')
+    parser.add_argument('--port', type=int, default=8089)
+    parser.add_argument('--embedding-latency', type=float, default=0.05, help='Mean seconds per embeddings call')
+    parser.add_argument('--chat-latency', type=float, default=0.8, help='Mean seconds per chat completion')
+    parser.add_argument('--jitter', type=float, default=0.2, help='Latency standard deviation as a fraction of the mean')
+    parser.add_argument('--error-rate', type=float, default=0.0, help='Fraction of requests answered with 429')
+    args = parser.parse_args()
+
+    settings.update({
+        'embedding_latency': args.embedding_latency,
+        'chat_latency': args.chat_latency,
+        'jitter': args.jitter,
+        'error_rate': args.error_rate,
+    })
+    print(f"Fake OpenAI API listening on http://localhost:{args.port}/v1")
+    app.run(host='0.0.0.0', port=args.port, threaded=True)
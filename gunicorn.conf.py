@@ -0,0 +1,54 @@
+import multiprocessing
+import os
+
+from dotenv import load_dotenv
+
+load_dotenv('ai_env.env')
+
+# Gunicorn settings for running the ticket API in production
+# (python start_flask.py, or gunicorn -c gunicorn.conf.py wsgi:app)
+bind = os.getenv('BIND', f"0.0.0.0:{os.getenv('PORT', '5001')}")
+
+# Postgres connections every worker may hold between them (the server's
+# max_connections, 100 by default, less room for migrations, psql and other
+# clients). Each worker needs its pool plus one LISTEN connection for /events.
+db_max_connections = int(os.getenv('DB_MAX_CONNECTIONS', 90))
+min_pool_size = 2
+
+workers = int(os.getenv('WEB_CONCURRENCY',
+                        min(multiprocessing.cpu_count() * 2 + 1, max(1, db_max_connections // (min_pool_size + 1)))))
+
+# Each worker's pool is capped at its share of the connection budget (the
+# enrichment workers and the in-process index borrow from the same pool)
+pool_share = max(min_pool_size, db_max_connections // workers - 1)
+os.environ['DB_POOL_MAX_SIZE'] = str(min(int(os.getenv('DB_POOL_MAX_SIZE', pool_share)), pool_share))
+if workers * (pool_share + 1) > db_max_connections:
+    print(f"Warning: {workers} workers need up to {workers * (pool_share + 1)} database connections, "
+          f"more than DB_MAX_CONNECTIONS={db_max_connections}; lower WEB_CONCURRENCY")
+
+# Threaded workers: each open SSE stream (/events, suggested-response/stream)
+# holds a thread for as long as the client stays connected, so the app caps
+# streams per worker at SSE_MAX_STREAMS (half the threads unless set) and
+# answers 503 beyond that
+worker_class = 'gthread'
+threads = int(os.getenv('GUNICORN_THREADS', 8))
+
+# Import the app once in the master so workers fork with the code already
+# loaded; anything holding sockets or threads is recreated in post_fork
+preload_app = True
+
+timeout = int(os.getenv('GUNICORN_TIMEOUT', 120))
+graceful_timeout = int(os.getenv('GUNICORN_GRACEFUL_TIMEOUT', 60))
+keepalive = 5
+accesslog = '-'
+
+
+def post_fork(server, worker):
+    from app import init_worker
+    init_worker()
+
+
+def worker_exit(server, worker):
+    # In-flight requests have finished by now; drain background enrichment
+    from app import shutdown
+    shutdown(timeout=graceful_timeout)
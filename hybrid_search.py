@@ -0,0 +1,196 @@
+import os
+import re
+
+from embedding_cache import vector_literal
+
+TEXT_SEARCH_CONFIG = 'english'
+
+TOKEN_PATTERN = re.compile(r'[A-Za-z0-9_][A-Za-z0-9_.\-]*[A-Za-z0-9_]|[A-Za-z0-9]')
+
+
+def hybrid_settings_from_env():
+    return {
+        'mode': os.getenv('SIMILARITY_MODE', 'vector'),
+        'rrf_k': int(os.getenv('HYBRID_RRF_K', 60)),
+        'candidates': int(os.getenv('HYBRID_CANDIDATES', 40)),
+        'code_prefilter': os.getenv('HYBRID_CODE_PREFILTER', 'true').lower() == 'true',
+        'max_terms': int(os.getenv('HYBRID_MAX_TERMS', 32)),
+    }
+
+
+def is_code(token):
+    # EXP_001, ERR42, 0x80070005, 404: identifiers worth matching exactly
+    return '_' in token or (any(c.isdigit() for c in token) and len(token) >= 3)
+
+
+# Split free text into websearch_to_tsquery inputs: every distinct word OR'ed
+# together (a ticket-length AND would match nothing), and error codes as
+# quoted phrases, since the parser splits EXP_001 into 'exp' followed by '001'
+def lexical_terms(text, max_terms=32):
+    codes = []
+    words = []
+    seen = set()
+    for token in TOKEN_PATTERN.findall(text or ''):
+        key = token.lower()
+        if key in seen or key == 'or':
+            continue
+        seen.add(key)
+        if is_code(token):
+            codes.append(f'"{token}"')
+        elif len(token) >= 3 and not token.isdigit():
+            words.append(token)
+    codes = codes[:max_terms]
+    words = words[:max(0, max_terms - len(codes))]
+    return ' or '.join(codes + words), ' or '.join(codes)
+
+
+# Hybrid lexical + vector retrieval
+#
+# A full-text match (GIN index on support_tickets.search_vector) and the ANN
+# vector search each produce their top `candidates` tickets under the same
+# filters, and the two rankings are fused with reciprocal rank fusion:
+# score = sum of 1 / (rrf_k + rank) over the lists a ticket appears in.
+# Lexical ranking puts tickets that contain one of the query's error codes
+# first, so an exact EXP_001 match is never outvoted by merely similar text.
+#
+# search_many() runs any number of queries as one statement: the queries are
+# passed as parallel arrays, unnested, and each one is answered by a LATERAL
+# subquery that can still use the ANN and GIN indexes. search() answers a
+# single query the same way, except that with code_prefilter on and enough
+# tickets containing one of its codes, the candidate set is narrowed to those
+# tickets and ranked by exact vector distance instead.
+class HybridSearch:
+    def __init__(self, settings, vector_search):
+        self.settings = settings
+        self.vector_search = vector_search
+
+    @property
+    def enabled(self):
+        return self.settings['mode'] == 'hybrid'
+
+    def _lexical_arm(self, where):
+        return f"""
+            SELECT id, ROW_NUMBER() OVER (ORDER BY code_match DESC, text_rank DESC, id) AS rank,
+                   'lexical' AS source
+            FROM (
+                SELECT id,
+                       search_vector @@ websearch_to_tsquery('{TEXT_SEARCH_CONFIG}', q.query_codes) AS code_match,
+                       ts_rank_cd(search_vector,
+                                  websearch_to_tsquery('{TEXT_SEARCH_CONFIG}', q.query_terms)) AS text_rank
+                FROM support_tickets
+                WHERE {where} AND q.query_terms <> ''
+                  AND id IS DISTINCT FROM q.exclude_id
+                  AND search_vector @@ websearch_to_tsquery('{TEXT_SEARCH_CONFIG}', q.query_terms)
+                ORDER BY code_match DESC, text_rank DESC, id
+                LIMIT %s
+            ) matches"""
+
+    def _semantic_arm(self, where):
+        # Without the any-status index only resolved tickets are indexed, and
+        # anything else would be an exact scan of the whole table
+        if not self.vector_search.settings['index_all_tickets']:
+            where = f"{where} AND status = 'resolved'"
+        return f"""
+            SELECT id, ROW_NUMBER() OVER (ORDER BY distance, id) AS rank, 'semantic' AS source
+            FROM (
+                SELECT id, {self.vector_search.order_sql('q.query_vector::vector')} AS distance
+                FROM support_tickets
+                WHERE {where} AND q.query_vector IS NOT NULL AND embedding IS NOT NULL
+                  AND id IS DISTINCT FROM q.exclude_id
+                ORDER BY distance
+                LIMIT %s
+            ) nearest"""
+
+    # queries: [{'text': ..., 'embedding': ... or None, 'exclude_id': ... or None}]
+    # Returns one list of rows per query: (id, subject, message, category,
+    # priority, status, customer_email, created_at, distance, score,
+    # lexical_rank, semantic_rank, resolution_summary). distance is exact
+    # cosine distance, or None for queries without an embedding, which are
+    # answered lexically.
+    def search_many(self, conn, queries, clauses=None, params=None, limit=10, mode='hybrid'):
+        if not queries:
+            return []
+        where = ' AND '.join(clauses) if clauses else 'TRUE'
+        params = list(params or [])
+        vectors, terms, codes = [], [], []
+        for query in queries:
+            embedding = query.get('embedding') if mode != 'lexical' else None
+            if embedding is not None and not isinstance(embedding, str):
+                embedding = vector_literal(embedding)
+            query_terms, query_codes = lexical_terms(query.get('text'), self.settings['max_terms'])
+            vectors.append(embedding)
+            terms.append(query_terms if mode != 'vector' or embedding is None else '')
+            codes.append(query_codes)
+
+        arms = []
+        arm_params = []
+        if mode != 'vector' or None in vectors:
+            arms.append(self._lexical_arm(where))
+            arm_params += params + [self.settings['candidates']]
+        if mode != 'lexical':
+            arms.append(self._semantic_arm(where))
+            arm_params += params + [self.settings['candidates']]
+
+        cur = conn.cursor()
+        try:
+            if mode != 'lexical':
+                self.vector_search.set_search_width(
+                    cur, self.vector_search.search_width(self.settings['candidates']))
+            cur.execute(f"""
+                SELECT q.idx, t.id, t.subject, t.message, t.category, t.priority, t.status,
+                       t.customer_email, t.created_at, t.embedding <=> q.query_vector::vector AS distance,
+                       r.score, r.lexical_rank, r.semantic_rank, t.resolution_summary
+                FROM unnest(%s::int[], %s::text[], %s::text[], %s::text[], %s::int[])
+                     AS q(idx, query_vector, query_terms, query_codes, exclude_id)
+                CROSS JOIN LATERAL (
+                    SELECT ranked.id, SUM(1.0 / (%s + ranked.rank)) AS score,
+                           MIN(ranked.rank) FILTER (WHERE ranked.source = 'lexical') AS lexical_rank,
+                           MIN(ranked.rank) FILTER (WHERE ranked.source = 'semantic') AS semantic_rank
+                    FROM ({' UNION ALL '.join(arms)}) ranked
+                    GROUP BY ranked.id
+                    ORDER BY score DESC
+                    LIMIT %s
+                ) r
+                JOIN support_tickets t ON t.id = r.id
+                ORDER BY q.idx, r.score DESC, distance
+            """, [list(range(len(queries))), vectors, terms, codes,
+                  [query.get('exclude_id') for query in queries],
+                  self.settings['rrf_k']] + arm_params + [limit])
+            rows = cur.fetchall()
+        finally:
+            cur.close()
+            conn.rollback()
+
+        results = [[] for _ in queries]
+        for row in rows:
+            results[row[0]].append(row[1:])
+        return results
+
+    # Rows are (id, subject, message, category, distance, resolution_summary,
+    # score, lexical_rank, semantic_rank)
+    def search(self, conn, text, embedding=None, clauses=None, params=None, limit=3, mode='hybrid'):
+        if embedding is not None and not isinstance(embedding, str):
+            embedding = vector_literal(embedding)
+        _terms, codes = lexical_terms(text, self.settings['max_terms'])
+
+        if codes and embedding is not None and self.settings['code_prefilter'] and mode == 'hybrid':
+            where = ' AND '.join(clauses) if clauses else 'TRUE'
+            cur = conn.cursor()
+            try:
+                cur.execute(f"""
+                    SELECT id, subject, message, category, embedding <=> %s::vector AS distance,
+                           resolution_summary
+                    FROM support_tickets
+                    WHERE {where} AND search_vector @@ websearch_to_tsquery('{TEXT_SEARCH_CONFIG}', %s)
+                    ORDER BY distance
+                    LIMIT %s
+                """, [embedding] + list(params or []) + [codes, limit])
+                rows = cur.fetchall()
+            finally:
+                cur.close()
+                conn.rollback()
+            if len(rows) >= limit:
+                return [row + (None, rank, None) for rank, row in enumerate(rows, 1)]
+
+        rows = self.search_many(conn, [{'text': text, 'embedding': embedding}], clauses, params, limit, mode)[0]
+        return [row[:4] + (row[8], row[12]) + row[9:12] for row in rows]
@@ -0,0 +1,307 @@
+import argparse
+import random
+import signal
+import threading
+import time
+from contextlib import contextmanager
+
+
+# Per-stage latency statistics shared by the request path and the workers.
+# on_record(stage, seconds) and on_mark(stage, event) let metrics exporters
+# see every observation as well.
+class StageStats:
+    def __init__(self, on_record=None, on_mark=None):
+        self.on_record = on_record
+        self.on_mark = on_mark
+        self._lock = threading.Lock()
+        self._stages = {}
+
+    def _entry(self, stage):
+        return self._stages.setdefault(stage, {
+            'count': 0, 'total': 0.0, 'max': 0.0, 'timeouts': 0, 'fallbacks': 0, 'failures': 0
+        })
+
+    def record(self, stage, seconds):
+        with self._lock:
+            entry = self._entry(stage)
+            entry['count'] += 1
+            entry['total'] += seconds
+            entry['max'] = max(entry['max'], seconds)
+        if self.on_record:
+            self.on_record(stage, seconds)
+
+    def mark(self, stage, event):
+        with self._lock:
+            self._entry(stage)[event] += 1
+        if self.on_mark:
+            self.on_mark(stage, event)
+
+    @contextmanager
+    def time(self, stage):
+        started = time.monotonic()
+        try:
+            yield
+        finally:
+            self.record(stage, time.monotonic() - started)
+
+    def snapshot(self):
+        with self._lock:
+            return {
+                stage: {
+                    'count': entry['count'],
+                    'avg_seconds': round(entry['total'] / entry['count'], 4) if entry['count'] else 0.0,
+                    'max_seconds': round(entry['max'], 4),
+                    'timeouts': entry['timeouts'],
+                    'fallbacks': entry['fallbacks'],
+                    'failures': entry['failures'],
+                }
+                for stage, entry in self._stages.items()
+            }
+
+
+# Raised when a worker's claim on a job was taken over: the job ran past the
+# visibility timeout and was reclaimed, so its results belong to the new claim
+class JobOwnershipLost(Exception):
+    pass
+
+
+# Enqueue a ticket for enrichment inside the caller's transaction, so the job
+# only becomes visible to workers once the ticket insert commits.
+def enqueue_enrichment(cur, ticket_id):
+    cur.execute("""
+        INSERT INTO enrichment_jobs (ticket_id) VALUES (%s) RETURNING id
+    """, (ticket_id,))
+    return cur.fetchone()[0]
+
+
+# Lock a claimed job inside the caller's transaction and check the claim is
+# still this worker's (same attempt, still running). Handlers call it before
+# writing a job's results, so a worker whose job was reclaimed writes nothing.
+def hold_claim(cur, job):
+    cur.execute("""
+        SELECT 1 FROM enrichment_jobs
+        WHERE id = %s AND status = 'running' AND attempts = %s
+        FOR UPDATE
+    """, (job['id'], job['attempts']))
+    if cur.fetchone() is None:
+        raise JobOwnershipLost(f"Job {job['id']} attempt {job['attempts']} was reclaimed")
+
+
+# Postgres-backed job queue
+#
+# Workers claim jobs with FOR UPDATE SKIP LOCKED so concurrent workers (in any
+# number of processes) never block on or double-claim the same row. A claimed
+# job is committed as 'running' straight away so no row lock is held during
+# the slow model calls; jobs whose worker died are reclaimed once they have
+# been running longer than visibility_timeout. A stale job that has already
+# used max_attempts (one that keeps crashing its worker) is marked failed
+# instead of being reclaimed. complete() and fail() only update the claim
+# they were given (same attempt, still running) and raise JobOwnershipLost
+# when a newer claim has taken over.
+class JobQueue:
+    def __init__(self, connection_factory, max_attempts=5, retry_base_delay=5.0,
+                 retry_max_delay=600.0, visibility_timeout=600.0):
+        self.connection_factory = connection_factory
+        self.max_attempts = max_attempts
+        self.retry_base_delay = retry_base_delay
+        self.retry_max_delay = retry_max_delay
+        self.visibility_timeout = visibility_timeout
+
+    def claim(self):
+        with self.connection_factory() as conn:
+            cur = conn.cursor()
+            cur.execute("""
+                WITH exhausted AS (
+                    UPDATE enrichment_jobs
+                    SET status = 'failed', locked_at = NULL, finished_at = NOW(),
+                        last_error = COALESCE(last_error || E'\n', '')
+                                     || 'Worker did not finish the job within the visibility timeout'
+                    WHERE id IN (
+                        SELECT id FROM enrichment_jobs
+                        WHERE status = 'running' AND attempts >= %s
+                          AND locked_at < NOW() - make_interval(secs => %s)
+                        FOR UPDATE SKIP LOCKED
+                    )
+                    RETURNING ticket_id
+                )
+                UPDATE support_tickets SET enrichment_status = 'failed'
+                WHERE id IN (SELECT ticket_id FROM exhausted)
+            """, (self.max_attempts, self.visibility_timeout))
+            cur.execute("""
+                UPDATE enrichment_jobs
+                SET status = 'running', attempts = attempts + 1, locked_at = NOW()
+                WHERE id = (
+                    SELECT id FROM enrichment_jobs
+                    WHERE (status = 'queued' AND run_after <= NOW())
+                       OR (status = 'running' AND attempts < %s
+                           AND locked_at < NOW() - make_interval(secs => %s))
+                    ORDER BY id
+                    FOR UPDATE SKIP LOCKED
+                    LIMIT 1
+                )
+                RETURNING id, ticket_id, attempts
+            """, (self.max_attempts, self.visibility_timeout))
+            row = cur.fetchone()
+            conn.commit()
+            cur.close()
+        if not row:
+            return None
+        return {'id': row[0], 'ticket_id': row[1], 'attempts': row[2]}
+
+    def complete(self, job):
+        with self.connection_factory() as conn:
+            cur = conn.cursor()
+            cur.execute("""
+                UPDATE enrichment_jobs
+                SET status = 'done', finished_at = NOW(), last_error = NULL
+                WHERE id = %s AND status = 'running' AND attempts = %s
+            """, (job['id'], job['attempts']))
+            owned = cur.rowcount > 0
+            conn.commit()
+            cur.close()
+        if not owned:
+            raise JobOwnershipLost(f"Job {job['id']} attempt {job['attempts']} was reclaimed")
+
+    def fail(self, job, error):
+        # Exponential backoff with full jitter between attempts
+        delay = min(self.retry_max_delay, self.retry_base_delay * (2 ** (job['attempts'] - 1)))
+        delay = random.uniform(0, delay)
+        give_up = job['attempts'] >= self.max_attempts
+
+        with self.connection_factory() as conn:
+            cur = conn.cursor()
+            cur.execute("""
+                UPDATE enrichment_jobs
+                SET status = %s, last_error = %s, locked_at = NULL,
+                    run_after = NOW() + make_interval(secs => %s),
+                    finished_at = CASE WHEN %s THEN NOW() END
+                WHERE id = %s AND status = 'running' AND attempts = %s
+            """, ('failed' if give_up else 'queued', str(error)[:2000], delay, give_up, job['id'],
+                  job['attempts']))
+            owned = cur.rowcount > 0
+            if owned and give_up:
+                cur.execute("""
+                    UPDATE support_tickets SET enrichment_status = 'failed' WHERE id = %s
+                """, (job['ticket_id'],))
+            conn.commit()
+            cur.close()
+        if not owned:
+            raise JobOwnershipLost(f"Job {job['id']} attempt {job['attempts']} was reclaimed")
+        return give_up
+
+    def depth(self):
+        with self.connection_factory() as conn:
+            cur = conn.cursor()
+            cur.execute("""
+                SELECT status, COUNT(*),
+                       EXTRACT(EPOCH FROM NOW() - MIN(created_at))
+                FROM enrichment_jobs
+                WHERE status IN ('queued', 'running', 'failed')
+                GROUP BY status
+            """)
+            rows = cur.fetchall()
+            cur.close()
+        depth = {'queued': 0, 'running': 0, 'failed': 0, 'oldest_queued_seconds': 0.0}
+        for status, count, oldest in rows:
+            depth[status] = count
+            if status == 'queued':
+                depth['oldest_queued_seconds'] = round(float(oldest or 0), 1)
+        return depth
+
+
+# Pool of worker threads draining a JobQueue
+class WorkerPool:
+    def __init__(self, queue, handler, num_workers=2, poll_interval=1.0):
+        self.queue = queue
+        self.handler = handler
+        self.num_workers = num_workers
+        self.poll_interval = poll_interval
+        self._stop = threading.Event()
+        self._threads = []
+        self._lock = threading.Lock()
+        self._active = 0
+        self._stats = {'processed': 0, 'failed': 0, 'retried': 0, 'lost': 0}
+
+    def start(self):
+        for i in range(self.num_workers):
+            thread = threading.Thread(target=self._run, name=f"enrichment-worker-{i}", daemon=True)
+            thread.start()
+            self._threads.append(thread)
+
+    def stop(self, timeout=None):
+        # Workers finish the job they are on before exiting
+        self._stop.set()
+        deadline = None if timeout is None else time.monotonic() + timeout
+        for thread in self._threads:
+            thread.join(None if deadline is None else max(0, deadline - time.monotonic()))
+        self._threads = [t for t in self._threads if t.is_alive()]
+        return not self._threads
+
+    def _run(self):
+        while not self._stop.is_set():
+            try:
+                job = self.queue.claim()
+            except Exception as e:
+                print(f"Error claiming enrichment job: {e}")
+                self._stop.wait(self.poll_interval)
+                continue
+
+            if job is None:
+                self._stop.wait(self.poll_interval)
+                continue
+
+            with self._lock:
+                self._active += 1
+            try:
+                self.handler(job)
+                self.queue.complete(job)
+                self._count('processed')
+            except JobOwnershipLost as e:
+                # The job was reclaimed; the newer claim records the outcome
+                print(f"Dropping enrichment job result: {e}")
+                self._count('lost')
+            except Exception as e:
+                print(f"Error processing enrichment job {job['id']} (ticket {job['ticket_id']}): {e}")
+                try:
+                    gave_up = self.queue.fail(job, e)
+                    self._count('failed' if gave_up else 'retried')
+                except JobOwnershipLost as lost:
+                    print(f"Dropping enrichment job failure: {lost}")
+                    self._count('lost')
+                except Exception as fail_error:
+                    print(f"Error recording job failure: {fail_error}")
+            finally:
+                with self._lock:
+                    self._active -= 1
+
+    def _count(self, name):
+        with self._lock:
+            self._stats[name] += 1
+
+    def stats(self):
+        with self._lock:
+            stats = dict(self._stats)
+            stats['workers'] = len(self._threads)
+            stats['active'] = self._active
+        return stats
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Run ticket enrichment workers.')
+    parser.add_argument('--workers', type=int, default=4)
+    parser.add_argument('--poll-interval', type=float, default=1.0)
+    args = parser.parse_args()
+
+    from app import enrichment_queue, process_enrichment_job
+
+    pool = WorkerPool(enrichment_queue, process_enrichment_job,
+                      num_workers=args.workers, poll_interval=args.poll_interval)
+    stopping = threading.Event()
+    signal.signal(signal.SIGTERM, lambda *_: stopping.set())
+    signal.signal(signal.SIGINT, lambda *_: stopping.set())
+
+    print(f"Starting {args.workers} enrichment worker(s)...")
+    pool.start()
+    stopping.wait()
+    print("Draining in-flight jobs...")
+    pool.stop()
@@ -0,0 +1,191 @@
+import argparse
+import json
+import random
+import sys
+import threading
+import time
+from collections import defaultdict
+
+import numpy as np
+import requests
+
+from fake_models import synthetic_ticket
+
+DEFAULT_MIX = 'submit=0.2,list=0.4,get=0.2,analytics=0.2'
+
+# Histogram bucket upper bounds in milliseconds
+HISTOGRAM_BUCKETS_MS = [5, 10, 25, 50, 100, 250, 500, 1000, 2500, 5000, 10000, 30000]
+
+
+def parse_mix(value):
+    mix = {}
+    for part in value.split(','):
+        name, weight = part.split('=')
+        mix[name.strip()] = float(weight)
+    unknown = set(mix) - set(OPERATIONS)
+    if unknown:
+        raise ValueError(f"Unknown operations in mix: {sorted(unknown)}")
+    return mix
+
+
+# Operations
+def op_submit(session, base_url, state, rng):
+    ticket = synthetic_ticket(rng)
+    response = session.post(f"{base_url}/tickets", json={
+        'customer_email': f"load{rng.integers(10 ** 6)}@example.com",
+        'subject': ticket['subject'],
+        'message': ticket['message'],
+    }, timeout=state['timeout'])
+    if response.ok:
+        with state['lock']:
+            state['ticket_ids'].append(response.json()['ticket_id'])
+    return response
+
+
+def op_list(session, base_url, state, rng):
+    return session.get(f"{base_url}/tickets", params={'limit': 10}, timeout=state['timeout'])
+
+
+def op_get(session, base_url, state, rng):
+    with state['lock']:
+        ticket_ids = state['ticket_ids']
+        ticket_id = ticket_ids[rng.integers(len(ticket_ids))] if ticket_ids else 1
+    return session.get(f"{base_url}/tickets/{ticket_id}", timeout=state['timeout'])
+
+
+def op_analytics(session, base_url, state, rng):
+    return session.get(f"{base_url}/analytics", timeout=state['timeout'])
+
+
+OPERATIONS = {
+    'submit': op_submit,
+    'list': op_list,
+    'get': op_get,
+    'analytics': op_analytics,
+}
+
+
+class Recorder:
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.latencies = defaultdict(list)
+        self.statuses = defaultdict(lambda: defaultdict(int))
+
+    def record(self, operation, seconds, status):
+        with self.lock:
+            self.latencies[operation].append(seconds * 1000)
+            self.statuses[operation][str(status)] += 1
+
+    def report(self, wall_seconds):
+        operations = {}
+        total = 0
+        errors = 0
+        for operation, latencies in sorted(self.latencies.items()):
+            statuses = dict(self.statuses[operation])
+            failed = sum(n for status, n in statuses.items() if not status.startswith('2'))
+            total += len(latencies)
+            errors += failed
+            counts, _ = np.histogram(latencies, bins=[0] + HISTOGRAM_BUCKETS_MS + [float('inf')])
+            operations[operation] = {
+                'requests': len(latencies),
+                'errors': failed,
+                'statuses': statuses,
+                'throughput_rps': round(len(latencies) / wall_seconds, 2),
+                'p50_ms': round(float(np.percentile(latencies, 50)), 2),
+                'p95_ms': round(float(np.percentile(latencies, 95)), 2),
+                'p99_ms': round(float(np.percentile(latencies, 99)), 2),
+                'max_ms': round(float(max(latencies)), 2),
+                'histogram_ms': {
+                    (f"le_{b}" if b != float('inf') else 'le_inf'): int(c)
+                    for b, c in zip(HISTOGRAM_BUCKETS_MS + [float('inf')], counts)
+                },
+            }
+        return {
+            'duration_seconds': round(wall_seconds, 2),
+            'requests': total,
+            'errors': errors,
+            'throughput_rps': round(total / wall_seconds, 2) if wall_seconds else 0.0,
+            'operations': operations,
+        }
+
+
+# Closed-loop workers with an optional open-loop rate cap: with --rps each
+# request is assigned a start slot on a shared schedule, so a slow server
+# shows up as queueing latency instead of silently lowering the offered load.
+def run_load(base_url, mix, concurrency, duration, rps=0.0, timeout=60.0, seed=0):
+    recorder = Recorder()
+    state = {'lock': threading.Lock(), 'ticket_ids': [], 'timeout': timeout, 'next_slot': 0}
+    names = list(mix)
+    weights = [mix[name] for name in names]
+
+    # Known ticket ids for GET /tickets/<id>
+    try:
+        response = requests.get(f"{base_url}/tickets", params={'limit': 100}, timeout=timeout)
+        state['ticket_ids'] = [t['id'] for t in response.json().get('tickets', [])]
+    except Exception as e:
+        print(f"Could not prefetch ticket ids: {e}", file=sys.stderr)
+
+    started = time.perf_counter()
+    deadline = started + duration
+
+    def worker(index):
+        rng = np.random.default_rng(seed + index)
+        chooser = random.Random(seed + index)
+        session = requests.Session()
+        while True:
+            if rps:
+                with state['lock']:
+                    slot = state['next_slot']
+                    state['next_slot'] += 1
+                scheduled = started + slot / rps
+                if scheduled >= deadline:
+                    return
+                delay = scheduled - time.perf_counter()
+                if delay > 0:
+                    time.sleep(delay)
+                request_start = scheduled
+            else:
+                if time.perf_counter() >= deadline:
+                    return
+                request_start = time.perf_counter()
+
+            operation = chooser.choices(names, weights)[0]
+            try:
+                status = OPERATIONS[operation](session, base_url, state, rng).status_code
+            except requests.RequestException as e:
+                status = type(e).__name__
+            recorder.record(operation, time.perf_counter() - request_start, status)
+
+    threads = [threading.Thread(target=worker, args=(i,), daemon=True) for i in range(concurrency)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    return recorder.report(time.perf_counter() - started)
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Generate load against the ticket API.')
+    parser.add_argument('--base-url', default='http://localhost:5001')
+    parser.add_argument('--mix', default=DEFAULT_MIX,
+                        help=f"Operation weights (default: {DEFAULT_MIX})")
+    parser.add_argument('--concurrency', type=int, default=10)
+    parser.add_argument('--rps', type=float, default=0.0, help='Target request rate (0 = as fast as possible)')
+    parser.add_argument('--duration', type=float, default=30.0, help='Seconds to run')
+    parser.add_argument('--timeout', type=float, default=60.0)
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--output', help='Write JSON results here instead of stdout')
+    args = parser.parse_args()
+
+    print(f"Running {args.concurrency} workers for {args.duration}s against {args.base_url}...", file=sys.stderr)
+    report = run_load(args.base_url, parse_mix(args.mix), args.concurrency, args.duration,
+                      rps=args.rps, timeout=args.timeout, seed=args.seed)
+    report.update({'concurrency': args.concurrency, 'target_rps': args.rps, 'mix': args.mix})
+
+    output = json.dumps(report, indent=2)
+    if args.output:
+        with open(args.output, 'w') as f:
+            f.write(output + '\n')
+    else:
+        print(output)
@@ -0,0 +1,213 @@
+import json
+import os
+import threading
+
+import numpy as np
+
+LABELS = ('category', 'priority', 'sentiment')
+
+
+def local_classifier_settings_from_env():
+    return {
+        'enabled': os.getenv('LOCAL_CLASSIFIER_ENABLED', 'false').lower() == 'true',
+        'method': os.getenv('LOCAL_CLASSIFIER_METHOD', 'knn'),
+        'k': int(os.getenv('LOCAL_CLASSIFIER_K', 15)),
+        'threshold': float(os.getenv('LOCAL_CLASSIFIER_THRESHOLD', 0.8)),
+        'min_examples': int(os.getenv('LOCAL_CLASSIFIER_MIN_EXAMPLES', 200)),
+        'max_examples': int(os.getenv('LOCAL_CLASSIFIER_MAX_EXAMPLES', 5000)),
+        'shadow_rate': float(os.getenv('LOCAL_CLASSIFIER_SHADOW_RATE', 0.05)),
+    }
+
+
+# Nearest-neighbour / centroid classifier over stored ticket embeddings
+#
+# Labeled examples live in a fixed-size float32 ring buffer (unit vectors, so
+# one matrix-vector product gives every cosine similarity) and each label keeps
+# a running embedding sum, so centroids follow the ring buffer incrementally
+# as examples are added and evicted. Only model-assigned labels are learned,
+# never the classifier's own predictions, so it cannot reinforce its mistakes.
+#
+# Confidence is per label: the similarity-weighted vote share of the winning
+# value among the k nearest examples (knn), or the softmax share of the
+# closest centroid (centroid). A prediction is usable only when the lowest of
+# the three confidences reaches the threshold.
+class LocalClassifier:
+    # Softmax temperature for centroid similarities; cosine gaps between
+    # centroids are small, so a low temperature is needed to separate them
+    CENTROID_TEMPERATURE = 0.05
+
+    def __init__(self, settings, connection_factory=None, dims=1536):
+        self.settings = settings
+        self.connection_factory = connection_factory
+        self.dims = dims
+        self._lock = threading.Lock()
+        self._vectors = np.zeros((settings['max_examples'], dims), dtype=np.float32)
+        self._labels = [None] * settings['max_examples']
+        self._size = 0
+        self._next = 0
+        self._sums = {label: {} for label in LABELS}
+        self._counts = {label: {} for label in LABELS}
+        self._loading = None
+        self._stats = {'predictions': 0, 'local': 0, 'fallbacks': 0, 'examples_added': 0}
+        # Agreement with the model, split by whether the local prediction was
+        # used (checked on a shadow sample) or fell below the threshold
+        self._agreement = {
+            bucket: {name: [0, 0] for name in LABELS + ('all',)}
+            for bucket in ('accepted', 'below_threshold')
+        }
+
+    @property
+    def enabled(self):
+        return self.settings['enabled']
+
+    # Seed from the most recent model-labeled tickets in the background (not
+    # local predictions, cluster copies or fallbacks); until it finishes every
+    # ticket falls back to the model
+    def load_async(self):
+        with self._lock:
+            if self._loading is not None or self.connection_factory is None:
+                return
+            self._loading = threading.Thread(target=self._load, name='local-classifier-load', daemon=True)
+            self._loading.start()
+
+    def _load(self):
+        try:
+            with self.connection_factory() as conn:
+                cur = conn.cursor()
+                cur.execute("""
+                    SELECT embedding::text, category, priority, sentiment
+                    FROM support_tickets
+                    WHERE classification_source = 'model' AND embedding IS NOT NULL
+                      AND category IS NOT NULL AND priority IS NOT NULL AND sentiment IS NOT NULL
+                    ORDER BY created_at DESC
+                    LIMIT %s
+                """, (self.settings['max_examples'],))
+                rows = cur.fetchall()
+                cur.close()
+                conn.rollback()
+        except Exception as e:
+            print(f"Error loading local classifier examples: {e}")
+            return
+
+        # Oldest first so the newest examples are the last to be evicted
+        for embedding, category, priority, sentiment in reversed(rows):
+            self.add(json.loads(embedding), {'category': category, 'priority': priority, 'sentiment': sentiment})
+
+    def add(self, embedding, classification):
+        vector = np.asarray(embedding, dtype=np.float32)
+        if vector.shape != (self.dims,):
+            return
+        norm = np.linalg.norm(vector)
+        if not norm:
+            return
+        vector = vector / norm
+        labels = tuple(classification.get(label) for label in LABELS)
+        if not all(labels):
+            return
+
+        with self._lock:
+            slot = self._next
+            evicted = self._labels[slot]
+            if evicted is not None:
+                self._update_centroids(self._vectors[slot], evicted, -1)
+            self._vectors[slot] = vector
+            self._labels[slot] = labels
+            self._update_centroids(vector, labels, 1)
+            self._next = (slot + 1) % len(self._labels)
+            self._size = min(self._size + 1, len(self._labels))
+            self._stats['examples_added'] += 1
+
+    def _update_centroids(self, vector, labels, sign):
+        for label, value in zip(LABELS, labels):
+            sums, counts = self._sums[label], self._counts[label]
+            sums[value] = sums.get(value, np.zeros(self.dims, dtype=np.float32)) + sign * vector
+            counts[value] = counts.get(value, 0) + sign
+            if counts[value] <= 0:
+                del sums[value]
+                del counts[value]
+
+    def _predict_knn(self, query):
+        k = min(self.settings['k'], self._size)
+        similarities = self._vectors[:self._size] @ query
+        nearest = np.argpartition(-similarities, k - 1)[:k]
+        weights = np.maximum(similarities[nearest], 0.0)
+        total = float(weights.sum()) or 1.0
+
+        prediction, confidence = {}, {}
+        for i, label in enumerate(LABELS):
+            votes = {}
+            for index, weight in zip(nearest, weights):
+                value = self._labels[index][i]
+                votes[value] = votes.get(value, 0.0) + float(weight)
+            value = max(votes, key=votes.get)
+            prediction[label] = value
+            confidence[label] = votes[value] / total
+        return prediction, confidence
+
+    def _predict_centroid(self, query):
+        prediction, confidence = {}, {}
+        for label in LABELS:
+            values = list(self._sums[label])
+            centroids = np.stack([self._sums[label][value] for value in values])
+            centroids /= np.maximum(np.linalg.norm(centroids, axis=1, keepdims=True), 1e-12)
+            scores = (centroids @ query) / self.CENTROID_TEMPERATURE
+            shares = np.exp(scores - scores.max())
+            shares /= shares.sum()
+            best = int(np.argmax(shares))
+            prediction[label] = values[best]
+            confidence[label] = float(shares[best])
+        return prediction, confidence
+
+    # Returns (classification, confidence), or None when there is too little
+    # data to say anything; the caller decides whether confidence is enough
+    def predict(self, embedding):
+        self.load_async()
+        query = np.asarray(embedding, dtype=np.float32)
+        norm = np.linalg.norm(query)
+        if query.shape != (self.dims,) or not norm:
+            return None
+        query = query / norm
+
+        with self._lock:
+            if self._size < max(1, self.settings['min_examples']):
+                return None
+            if self.settings['method'] == 'centroid':
+                prediction, confidence = self._predict_centroid(query)
+            else:
+                prediction, confidence = self._predict_knn(query)
+
+        prediction['urgency_keywords'] = []
+        return prediction, min(confidence.values())
+
+    def confident(self, confidence):
+        return confidence >= self.settings['threshold']
+
+    def record_decision(self, used_local):
+        with self._lock:
+            self._stats['predictions'] += 1
+            self._stats['local' if used_local else 'fallbacks'] += 1
+
+    # Compare a local prediction with the model's labels for the same ticket
+    def record_agreement(self, local, model, accepted):
+        matches = {label: local[label] == model.get(label) for label in LABELS}
+        matches['all'] = all(matches.values())
+        with self._lock:
+            counters = self._agreement['accepted' if accepted else 'below_threshold']
+            for name, matched in matches.items():
+                counters[name][0] += 1
+                counters[name][1] += matched
+
+    def stats(self):
+        with self._lock:
+            stats = dict(self._stats)
+            stats['examples'] = self._size
+            stats['agreement'] = {
+                bucket: dict(
+                    {name: (agreed / checks if checks else None) for name, (checks, agreed) in counters.items()},
+                    checks=counters['all'][0]
+                )
+                for bucket, counters in self._agreement.items()
+            }
+        stats['fallback_rate'] = stats['fallbacks'] / stats['predictions'] if stats['predictions'] else 0.0
+        stats.update(self.settings)
+        return stats
@@ -0,0 +1,451 @@
+import argparse
+import json
+import os
+import queue
+import sys
+import threading
+import time
+
+import numpy as np
+
+try:
+    import fcntl
+except ImportError:  # Windows: snapshot builds are not coordinated across processes
+    fcntl = None
+
+
+def memory_index_settings_from_env():
+    return {
+        'backend': os.getenv('SIMILARITY_BACKEND', 'postgres'),
+        'path': os.getenv('MEMORY_INDEX_PATH', 'vector_snapshot'),
+        'max_age': int(os.getenv('MEMORY_INDEX_MAX_AGE', 3600)),
+        'rebuild_delta': int(os.getenv('MEMORY_INDEX_REBUILD_DELTA', 5000)),
+        'reconcile_interval': int(os.getenv('MEMORY_INDEX_RECONCILE_INTERVAL', 300)),
+    }
+
+
+def parse_vector(value):
+    if isinstance(value, str):
+        return np.fromstring(value.strip('[]'), sep=',', dtype=np.float32)
+    return np.asarray(value, dtype=np.float32)
+
+
+def normalize_rows(vectors):
+    norms = np.linalg.norm(vectors, axis=1, keepdims=True)
+    norms[norms == 0] = 1.0
+    return vectors / norms
+
+
+def read_manifest(path):
+    try:
+        with open(os.path.join(path, 'manifest.json')) as f:
+            return json.load(f)
+    except FileNotFoundError:
+        return None
+
+
+# Snapshot files
+#
+# vectors-<version>.npy holds every resolved ticket's unit-length embedding as
+# one float32 matrix, sorted by category so each category is a contiguous row
+# range; tickets-<version>.json holds [id, subject, message, resolution
+# summary, resolution response id] for each row in the same order. manifest.json names the current version and the category
+# row ranges and is replaced last, so readers never see a half-written
+# snapshot. Files of older versions are unlinked, which leaves them readable
+# for processes that still have them mapped.
+def build_snapshot(conn, path, dims=1536, batch_size=2000):
+    os.makedirs(path, exist_ok=True)
+    version = f"{int(time.time() * 1000)}-{os.getpid()}"
+    vectors_path = os.path.join(path, f"vectors-{version}.npy")
+    tickets_path = os.path.join(path, f"tickets-{version}.json")
+
+    conn.rollback()
+    cur = conn.cursor()
+    # COUNT and the row scan must see the same tickets
+    cur.execute("SET TRANSACTION ISOLATION LEVEL REPEATABLE READ")
+    cur.execute("""
+        SELECT COUNT(*) FROM support_tickets
+        WHERE status = 'resolved' AND embedding IS NOT NULL AND category IS NOT NULL
+    """)
+    count = cur.fetchone()[0]
+    cur.close()
+
+    # open_memmap cannot map an empty file, so an empty snapshot is a plain array
+    if count:
+        vectors = np.lib.format.open_memmap(vectors_path + '.tmp', mode='w+', dtype=np.float32,
+                                            shape=(count, dims))
+    else:
+        vectors = np.zeros((0, dims), dtype=np.float32)
+    tickets = []
+    partitions = {}
+    row = 0
+    cur = conn.cursor(name='memory_index_snapshot')
+    cur.itersize = batch_size
+    cur.execute("""
+        SELECT id, subject, message, category, embedding::text, resolution_summary, resolution_response_id
+        FROM support_tickets
+        WHERE status = 'resolved' AND embedding IS NOT NULL AND category IS NOT NULL
+        ORDER BY category, id
+    """)
+    while True:
+        batch = cur.fetchmany(batch_size)
+        if not batch:
+            break
+        matrix = np.stack([parse_vector(r[4]) for r in batch])
+        vectors[row:row + len(batch)] = normalize_rows(matrix)
+        for ticket_id, subject, message, category, _, resolution, response_id in batch:
+            start, _end = partitions.get(category, (row, row))
+            partitions[category] = (start, row + 1)
+            tickets.append([ticket_id, subject, message, resolution, response_id])
+            row += 1
+    cur.close()
+    conn.rollback()
+
+    if count:
+        vectors.flush()
+        del vectors
+        os.replace(vectors_path + '.tmp', vectors_path)
+    with open(tickets_path + '.tmp', 'w') as f:
+        json.dump(tickets, f)
+    os.replace(tickets_path + '.tmp', tickets_path)
+
+    manifest = {
+        'version': version,
+        'built_at': time.time(),
+        'rows': row,
+        'dims': dims,
+        'partitions': partitions,
+    }
+    with open(os.path.join(path, 'manifest.json.tmp'), 'w') as f:
+        json.dump(manifest, f)
+    os.replace(os.path.join(path, 'manifest.json.tmp'), os.path.join(path, 'manifest.json'))
+
+    for name in os.listdir(path):
+        if name.startswith(('vectors-', 'tickets-')) and version not in name:
+            try:
+                os.remove(os.path.join(path, name))
+            except OSError:
+                pass
+    return manifest
+
+
+class Snapshot:
+    def __init__(self, path, manifest):
+        self.version = manifest['version']
+        self.built_at = manifest['built_at']
+        self.partitions = {category: tuple(bounds) for category, bounds in manifest['partitions'].items()}
+        if manifest['rows']:
+            self.vectors = np.load(os.path.join(path, f"vectors-{self.version}.npy"), mmap_mode='r')
+        else:
+            self.vectors = np.zeros((0, manifest['dims']), dtype=np.float32)
+        with open(os.path.join(path, f"tickets-{self.version}.json")) as f:
+            self.tickets = json.load(f)
+        self.rows_by_id = {ticket[0]: row for row, ticket in enumerate(self.tickets)}
+
+    def category_of(self, row):
+        for category, (start, end) in self.partitions.items():
+            if start <= row < end:
+                return category
+        return None
+
+
+# In-process exact similarity search
+#
+# Resolved-ticket embeddings are memory-mapped from a snapshot file, so every
+# worker on the host shares the same page-cache copy, and a query is one
+# matrix-vector product over its category's row range followed by
+# argpartition for the top k. Changes after the snapshot (new resolutions,
+# reopened or reclassified tickets) arrive through the ticket event stream:
+# affected snapshot rows are masked out and the current rows are kept in a
+# small in-memory delta. Because notifications can be missed, the live set is
+# also reconciled against the table's (id, category, resolution) list every
+# reconcile_interval seconds and after every 'resync'. Snapshots older than
+# max_age, or with more than rebuild_delta changes on top, are rebuilt by
+# whichever worker gets the lock first; the others pick up the new version.
+class MemoryVectorIndex:
+    def __init__(self, settings, connection_factory, events=None, dims=1536):
+        self.settings = settings
+        self.connection_factory = connection_factory
+        self.events = events
+        self.dims = dims
+        self._lock = threading.Lock()
+        self._thread = None
+        self._stop = threading.Event()
+        self._snapshot = None
+        self._removed = {}  # category -> snapshot rows masked out
+        self._delta = {}    # ticket id -> (category, vector, subject, message, resolution, response id)
+        self._delta_cache = {}
+        self._last_reconcile = 0.0
+        self._stats = {'searches': 0, 'refreshed': 0, 'reconciles': 0, 'rebuilds': 0, 'errors': 0}
+
+    @property
+    def enabled(self):
+        return self.settings['backend'] == 'memory'
+
+    def _count(self, name, amount=1):
+        with self._lock:
+            self._stats[name] += amount
+
+    def start(self):
+        with self._lock:
+            if self._thread is None or not self._thread.is_alive():
+                self._stop.clear()
+                self._thread = threading.Thread(target=self._run, name='memory-index', daemon=True)
+                self._thread.start()
+
+    def stop(self, timeout=None):
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join(timeout)
+
+    # Returns rows shaped like VectorSearch.search (id, subject, message,
+    # category, cosine distance, resolution summary), or None until the first
+    # snapshot is loaded
+    def search(self, embedding, category, limit=3):
+        self.start()
+        query = parse_vector(embedding)
+        norm = np.linalg.norm(query)
+        if query.shape != (self.dims,) or not norm:
+            return None
+        query = query / norm
+
+        with self._lock:
+            snapshot = self._snapshot
+            if snapshot is None:
+                return None
+            removed = list(self._removed.get(category, ()))
+            delta = self._delta_matrix(category)
+            self._stats['searches'] += 1
+
+        candidates = []
+        start, end = snapshot.partitions.get(category, (0, 0))
+        if end > start:
+            scores = snapshot.vectors[start:end] @ query
+            if removed:
+                scores[np.asarray(removed) - start] = -np.inf
+            for i in self._top(scores, limit):
+                ticket_id, subject, message, resolution, _ = snapshot.tickets[start + i]
+                candidates.append((float(scores[i]), ticket_id, subject, message, resolution))
+        if delta is not None:
+            ids, matrix, texts = delta
+            scores = matrix @ query
+            for i in self._top(scores, limit):
+                candidates.append((float(scores[i]), ids[i]) + texts[i])
+
+        candidates.sort(key=lambda c: c[0], reverse=True)
+        return [
+            (ticket_id, subject, message, category, 1.0 - score, resolution)
+            for score, ticket_id, subject, message, resolution in candidates[:limit]
+        ]
+
+    @staticmethod
+    def _top(scores, limit):
+        k = min(limit, len(scores))
+        if k == 0:
+            return []
+        top = np.argpartition(-scores, k - 1)[:k]
+        return [i for i in top[np.argsort(-scores[top])] if np.isfinite(scores[i])]
+
+    def _delta_matrix(self, category):
+        # Called with the lock held; stacked lazily and cached until the delta changes
+        if category not in self._delta_cache:
+            entries = [(ticket_id, entry) for ticket_id, entry in self._delta.items() if entry[0] == category]
+            if entries:
+                self._delta_cache[category] = (
+                    [ticket_id for ticket_id, _ in entries],
+                    np.stack([entry[1] for _, entry in entries]),
+                    [(entry[2], entry[3], entry[4]) for _, entry in entries],
+                )
+            else:
+                self._delta_cache[category] = None
+        return self._delta_cache[category]
+
+    def _remove(self, ticket_id):
+        # Called with the lock held
+        row = self._snapshot.rows_by_id.get(ticket_id)
+        if row is not None:
+            category = self._snapshot.category_of(row)
+            self._removed.setdefault(category, set()).add(row)
+            self._delta_cache.pop(category, None)
+        entry = self._delta.pop(ticket_id, None)
+        if entry is not None:
+            self._delta_cache.pop(entry[0], None)
+
+    def _refresh(self, ticket_ids):
+        with self.connection_factory() as conn:
+            cur = conn.cursor()
+            cur.execute("""
+                SELECT id, subject, message, category, status, embedding::text,
+                       resolution_summary, resolution_response_id
+                FROM support_tickets WHERE id = ANY(%s)
+            """, (list(ticket_ids),))
+            rows = cur.fetchall()
+            cur.close()
+            conn.rollback()
+
+        with self._lock:
+            for ticket_id in ticket_ids:
+                self._remove(ticket_id)
+            for ticket_id, subject, message, category, status, embedding, resolution, response_id in rows:
+                if status != 'resolved' or embedding is None or category is None:
+                    continue
+                vector = parse_vector(embedding)
+                norm = np.linalg.norm(vector)
+                if vector.shape != (self.dims,) or not norm:
+                    continue
+                self._delta[ticket_id] = (category, vector / norm, subject, message, resolution, response_id)
+                self._delta_cache.pop(category, None)
+            self._stats['refreshed'] += len(ticket_ids)
+
+    def _live(self):
+        # Called with the lock held: ticket id -> (category, resolution response
+        # id) for every searchable row
+        live = {}
+        for category, (start, end) in self._snapshot.partitions.items():
+            removed = self._removed.get(category, ())
+            for row in range(start, end):
+                if row not in removed:
+                    ticket = self._snapshot.tickets[row]
+                    live[ticket[0]] = (category, ticket[4])
+        for ticket_id, entry in self._delta.items():
+            live[ticket_id] = (entry[0], entry[5])
+        return live
+
+    def _reconcile(self):
+        with self.connection_factory() as conn:
+            cur = conn.cursor()
+            cur.execute("""
+                SELECT id, category, resolution_response_id FROM support_tickets
+                WHERE status = 'resolved' AND embedding IS NOT NULL AND category IS NOT NULL
+            """)
+            current = {row[0]: (row[1], row[2]) for row in cur.fetchall()}
+            cur.close()
+            conn.rollback()
+
+        with self._lock:
+            live = self._live()
+        stale = {ticket_id for ticket_id, key in current.items() if live.get(ticket_id) != key}
+        stale |= set(live) - set(current)
+        if stale:
+            self._refresh(stale)
+        self._last_reconcile = time.monotonic()
+        self._count('reconciles')
+
+    def _load(self, manifest):
+        snapshot = Snapshot(self.settings['path'], manifest)
+        with self._lock:
+            self._snapshot = snapshot
+            self._removed = {}
+            self._delta = {}
+            self._delta_cache = {}
+        # Catch up on everything that changed since the snapshot was built
+        self._reconcile()
+
+    def build(self, blocking=True, force=False):
+        path = self.settings['path']
+        os.makedirs(path, exist_ok=True)
+        with open(os.path.join(path, '.lock'), 'w') as lock_file:
+            if fcntl is not None:
+                try:
+                    fcntl.flock(lock_file, fcntl.LOCK_EX | (0 if blocking else fcntl.LOCK_NB))
+                except BlockingIOError:
+                    return None
+            # Another process may have finished a build while we waited
+            manifest = read_manifest(path)
+            current = self._snapshot.version if self._snapshot else None
+            if not force and manifest and manifest['version'] != current and not self._stale(manifest):
+                return manifest
+            with self.connection_factory() as conn:
+                manifest = build_snapshot(conn, path, self.dims)
+        self._count('rebuilds')
+        return manifest
+
+    def _stale(self, manifest):
+        with self._lock:
+            delta = len(self._delta) if self._snapshot and self._snapshot.version == manifest['version'] else 0
+        return (time.time() - manifest['built_at'] > self.settings['max_age']
+                or delta > self.settings['rebuild_delta'])
+
+    def _changed_ids(self, subscriber, timeout):
+        # Ticket ids from the event stream; None after a 'resync'
+        ids = set()
+        try:
+            event, data = subscriber.get(timeout=timeout)
+            while True:
+                if event == 'resync':
+                    return None
+                if event in ('ticket_created', 'ticket_updated'):
+                    ids.add(data['id'])
+                event, data = subscriber.get_nowait()
+        except queue.Empty:
+            return ids
+
+    def _run(self):
+        subscriber = self.events.subscribe() if self.events else None
+        try:
+            while not self._stop.is_set():
+                try:
+                    self._step(subscriber)
+                except Exception as e:
+                    self._count('errors')
+                    print(f"Error updating in-memory vector index: {e}")
+                    self._stop.wait(5.0)
+        finally:
+            if subscriber is not None:
+                self.events.unsubscribe(subscriber)
+
+    def _step(self, subscriber):
+        manifest = read_manifest(self.settings['path'])
+        if manifest is None:
+            manifest = self.build(blocking=True)
+        if self._snapshot is None or manifest['version'] != self._snapshot.version:
+            self._load(manifest)
+        elif self._stale(manifest):
+            rebuilt = self.build(blocking=False)
+            if rebuilt is not None:
+                self._load(rebuilt)
+                return
+
+        if subscriber is not None:
+            ids = self._changed_ids(subscriber, timeout=1.0)
+        else:
+            self._stop.wait(1.0)
+            ids = set()
+        if ids is None or time.monotonic() - self._last_reconcile > self.settings['reconcile_interval']:
+            self._reconcile()
+        elif ids:
+            self._refresh(ids)
+
+    def stats(self):
+        with self._lock:
+            stats = dict(self._stats)
+            snapshot = self._snapshot
+            stats['ready'] = snapshot is not None
+            stats['delta_rows'] = len(self._delta)
+            stats['masked_rows'] = sum(len(rows) for rows in self._removed.values())
+        if snapshot is not None:
+            stats['snapshot_version'] = snapshot.version
+            stats['snapshot_rows'] = len(snapshot.tickets)
+            stats['snapshot_age_seconds'] = round(time.time() - snapshot.built_at, 1)
+            stats['categories'] = {category: end - start for category, (start, end) in snapshot.partitions.items()}
+        stats.update(self.settings)
+        return stats
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Build the snapshot used by SIMILARITY_BACKEND=memory.')
+    parser.add_argument('--path', help='Snapshot directory (defaults to MEMORY_INDEX_PATH)')
+    args = parser.parse_args()
+
+    from app import db_connection
+
+    settings = memory_index_settings_from_env()
+    if args.path:
+        settings['path'] = args.path
+
+    try:
+        manifest = MemoryVectorIndex(settings, db_connection).build(force=True)
+    except Exception as e:
+        print(f"Snapshot build failed: {e}")
+        sys.exit(1)
+    print(f"Snapshot {manifest['version']}: {manifest['rows']} tickets in {len(manifest['partitions'])} categories.")
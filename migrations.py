@@ -0,0 +1,480 @@
+import sys
+
+# Schema migrations
+#
+# Each migration is applied once, in order, and recorded in schema_migrations.
+# Run `python migrations.py` after pulling changes that add new entries.
+MIGRATIONS = [
+    ('001_base_schema', """
+        CREATE EXTENSION IF NOT EXISTS vector;
+
+        CREATE TABLE IF NOT EXISTS support_tickets (
+            id SERIAL PRIMARY KEY,
+            customer_email VARCHAR(255) NOT NULL,
+            subject VARCHAR(500) NOT NULL,
+            message TEXT NOT NULL,
+            category VARCHAR(100),
+            priority VARCHAR(20),
+            sentiment VARCHAR(20),
+            status VARCHAR(50) DEFAULT 'open',
+            embedding vector(1536),
+            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            resolved_at TIMESTAMP,
+            resolution_time_hours INTEGER
+        );
+
+        CREATE TABLE IF NOT EXISTS ticket_responses (
+            id SERIAL PRIMARY KEY,
+            ticket_id INTEGER REFERENCES support_tickets(id),
+            response_text TEXT NOT NULL,
+            response_type VARCHAR(50),
+            confidence_score DECIMAL(3,2),
+            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+        );
+
+        CREATE INDEX IF NOT EXISTS idx_support_tickets_category_priority
+            ON support_tickets (category, priority);
+        CREATE INDEX IF NOT EXISTS idx_support_tickets_created_at
+            ON support_tickets (created_at DESC);
+    """),
+    ('002_embedding_cache', """
+        CREATE TABLE IF NOT EXISTS embedding_cache (
+            text_hash CHAR(64) NOT NULL,
+            model VARCHAR(100) NOT NULL,
+            dimensions INTEGER NOT NULL,
+            embedding BYTEA NOT NULL,
+            created_at TIMESTAMP WITH TIME ZONE DEFAULT CURRENT_TIMESTAMP,
+            last_used_at TIMESTAMP WITH TIME ZONE DEFAULT CURRENT_TIMESTAMP,
+            PRIMARY KEY (text_hash, model)
+        );
+
+        CREATE INDEX IF NOT EXISTS idx_embedding_cache_last_used
+            ON embedding_cache (last_used_at);
+    """),
+    ('003_enrichment_jobs', """
+        ALTER TABLE support_tickets
+            ADD COLUMN IF NOT EXISTS enrichment_status VARCHAR(20) DEFAULT 'complete';
+
+        CREATE TABLE IF NOT EXISTS enrichment_jobs (
+            id BIGSERIAL PRIMARY KEY,
+            ticket_id INTEGER NOT NULL REFERENCES support_tickets(id),
+            status VARCHAR(20) NOT NULL DEFAULT 'queued',
+            attempts INTEGER NOT NULL DEFAULT 0,
+            last_error TEXT,
+            run_after TIMESTAMP WITH TIME ZONE NOT NULL DEFAULT CURRENT_TIMESTAMP,
+            locked_at TIMESTAMP WITH TIME ZONE,
+            created_at TIMESTAMP WITH TIME ZONE DEFAULT CURRENT_TIMESTAMP,
+            finished_at TIMESTAMP WITH TIME ZONE
+        );
+
+        CREATE INDEX IF NOT EXISTS idx_enrichment_jobs_pending
+            ON enrichment_jobs (id) WHERE status IN ('queued', 'running');
+    """),
+    ('004_analytics_rollups', """
+        -- Per-day counts for every category/priority/sentiment/status combination
+        CREATE TABLE IF NOT EXISTS ticket_rollups (
+            day DATE NOT NULL,
+            category VARCHAR(100) NOT NULL,
+            priority VARCHAR(20) NOT NULL,
+            sentiment VARCHAR(20) NOT NULL,
+            status VARCHAR(50) NOT NULL,
+            ticket_count INTEGER NOT NULL DEFAULT 0,
+            PRIMARY KEY (day, category, priority, sentiment, status)
+        );
+
+        -- All-time counts per single dimension value, read directly by /analytics
+        CREATE TABLE IF NOT EXISTS ticket_totals (
+            dimension VARCHAR(20) NOT NULL,
+            value VARCHAR(100) NOT NULL,
+            ticket_count INTEGER NOT NULL DEFAULT 0,
+            PRIMARY KEY (dimension, value)
+        );
+
+        -- Unclassified tickets are counted under '' since key columns cannot be NULL
+        CREATE OR REPLACE FUNCTION ticket_rollups_apply(t support_tickets, delta INTEGER)
+        RETURNS void AS $$
+        BEGIN
+            INSERT INTO ticket_rollups (day, category, priority, sentiment, status, ticket_count)
+            VALUES (t.created_at::date, COALESCE(t.category, ''), COALESCE(t.priority, ''),
+                    COALESCE(t.sentiment, ''), COALESCE(t.status, ''), delta)
+            ON CONFLICT (day, category, priority, sentiment, status)
+            DO UPDATE SET ticket_count = ticket_rollups.ticket_count + EXCLUDED.ticket_count;
+
+            INSERT INTO ticket_totals (dimension, value, ticket_count)
+            VALUES ('category', COALESCE(t.category, ''), delta),
+                   ('priority', COALESCE(t.priority, ''), delta),
+                   ('sentiment', COALESCE(t.sentiment, ''), delta),
+                   ('status', COALESCE(t.status, ''), delta)
+            ON CONFLICT (dimension, value)
+            DO UPDATE SET ticket_count = ticket_totals.ticket_count + EXCLUDED.ticket_count;
+        END;
+        $$ LANGUAGE plpgsql;
+
+        CREATE OR REPLACE FUNCTION ticket_rollups_trigger() RETURNS trigger AS $$
+        BEGIN
+            IF TG_OP = 'UPDATE' AND
+               (OLD.created_at::date, OLD.category, OLD.priority, OLD.sentiment, OLD.status)
+               IS NOT DISTINCT FROM
+               (NEW.created_at::date, NEW.category, NEW.priority, NEW.sentiment, NEW.status) THEN
+                RETURN NULL;
+            END IF;
+            IF TG_OP IN ('UPDATE', 'DELETE') THEN
+                PERFORM ticket_rollups_apply(OLD, -1);
+            END IF;
+            IF TG_OP IN ('INSERT', 'UPDATE') THEN
+                PERFORM ticket_rollups_apply(NEW, 1);
+            END IF;
+            RETURN NULL;
+        END;
+        $$ LANGUAGE plpgsql;
+
+        DROP TRIGGER IF EXISTS support_tickets_rollups ON support_tickets;
+        CREATE TRIGGER support_tickets_rollups
+            AFTER INSERT OR DELETE OR UPDATE OF category, priority, sentiment, status, created_at
+            ON support_tickets
+            FOR EACH ROW EXECUTE FUNCTION ticket_rollups_trigger();
+
+        -- Backfill from existing tickets
+        LOCK TABLE support_tickets IN SHARE MODE;
+        TRUNCATE ticket_rollups, ticket_totals;
+        INSERT INTO ticket_rollups (day, category, priority, sentiment, status, ticket_count)
+        SELECT created_at::date, COALESCE(category, ''), COALESCE(priority, ''),
+               COALESCE(sentiment, ''), COALESCE(status, ''), COUNT(*)
+        FROM support_tickets
+        GROUP BY 1, 2, 3, 4, 5;
+        INSERT INTO ticket_totals (dimension, value, ticket_count)
+        SELECT 'category', COALESCE(category, ''), COUNT(*) FROM support_tickets GROUP BY 2
+        UNION ALL
+        SELECT 'priority', COALESCE(priority, ''), COUNT(*) FROM support_tickets GROUP BY 2
+        UNION ALL
+        SELECT 'sentiment', COALESCE(sentiment, ''), COUNT(*) FROM support_tickets GROUP BY 2
+        UNION ALL
+        SELECT 'status', COALESCE(status, ''), COUNT(*) FROM support_tickets GROUP BY 2;
+    """),
+    ('005_ticket_keyset_index', """
+        CREATE INDEX IF NOT EXISTS idx_support_tickets_created_at_id
+            ON support_tickets (created_at DESC, id DESC);
+    """),
+    ('006_ticket_event_notifications', """
+        -- Publish ticket changes on the ticket_events channel; delivered to
+        -- listeners when the writing transaction commits
+        CREATE OR REPLACE FUNCTION ticket_events_notify() RETURNS trigger AS $$
+        BEGIN
+            IF TG_OP = 'UPDATE' AND
+               (OLD.category, OLD.priority, OLD.sentiment, OLD.status)
+               IS NOT DISTINCT FROM
+               (NEW.category, NEW.priority, NEW.sentiment, NEW.status) THEN
+                RETURN NULL;
+            END IF;
+            PERFORM pg_notify('ticket_events', json_build_object(
+                'op', TG_OP,
+                'ticket', json_build_object(
+                    'id', NEW.id,
+                    'customer_email', NEW.customer_email,
+                    'subject', LEFT(NEW.subject, 200),
+                    'category', NEW.category,
+                    'priority', NEW.priority,
+                    'sentiment', NEW.sentiment,
+                    'status', NEW.status,
+                    'created_at', NEW.created_at
+                ),
+                'old', CASE WHEN TG_OP = 'UPDATE' THEN json_build_object(
+                    'category', OLD.category,
+                    'priority', OLD.priority,
+                    'sentiment', OLD.sentiment,
+                    'status', OLD.status
+                ) END
+            )::text);
+            RETURN NULL;
+        END;
+        $$ LANGUAGE plpgsql;
+
+        DROP TRIGGER IF EXISTS support_tickets_events ON support_tickets;
+        CREATE TRIGGER support_tickets_events
+            AFTER INSERT OR UPDATE OF category, priority, sentiment, status
+            ON support_tickets
+            FOR EACH ROW EXECUTE FUNCTION ticket_events_notify();
+    """),
+    ('007_ticket_clusters', """
+        CREATE TABLE IF NOT EXISTS ticket_clusters (
+            id SERIAL PRIMARY KEY,
+            canonical_ticket_id INTEGER REFERENCES support_tickets(id),
+            category VARCHAR(100),
+            priority VARCHAR(20),
+            sentiment VARCHAR(20),
+            response_text TEXT,
+            ticket_count INTEGER NOT NULL DEFAULT 1,
+            first_seen_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            last_seen_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+        );
+
+        CREATE INDEX IF NOT EXISTS ticket_clusters_last_seen_idx
+            ON ticket_clusters (last_seen_at DESC);
+
+        ALTER TABLE support_tickets
+            ADD COLUMN IF NOT EXISTS cluster_id INTEGER REFERENCES ticket_clusters(id);
+
+        CREATE INDEX IF NOT EXISTS support_tickets_cluster_idx
+            ON support_tickets (cluster_id) WHERE cluster_id IS NOT NULL;
+
+        -- Duplicate detection scans the open tickets of the last few hours
+        CREATE INDEX IF NOT EXISTS support_tickets_open_recent_idx
+            ON support_tickets (created_at) WHERE status = 'open';
+    """),
+    ('008_semantic_response_cache', """
+        CREATE TABLE IF NOT EXISTS semantic_response_cache (
+            id BIGSERIAL PRIMARY KEY,
+            category VARCHAR(100) NOT NULL,
+            sentiment VARCHAR(20) NOT NULL,
+            embedding vector(1536) NOT NULL,
+            response_text TEXT NOT NULL,
+            generation_tokens INTEGER NOT NULL DEFAULT 0,
+            hits INTEGER NOT NULL DEFAULT 0,
+            created_at TIMESTAMP WITH TIME ZONE DEFAULT CURRENT_TIMESTAMP,
+            last_used_at TIMESTAMP WITH TIME ZONE DEFAULT CURRENT_TIMESTAMP
+        );
+
+        CREATE INDEX IF NOT EXISTS idx_semantic_response_cache_bucket
+            ON semantic_response_cache (category, sentiment);
+
+        CREATE INDEX IF NOT EXISTS idx_semantic_response_cache_last_used
+            ON semantic_response_cache (last_used_at);
+    """),
+    ('009_ticket_fulltext', """
+        -- Full-text search for hybrid retrieval; subject matches rank above
+        -- message matches. Adding a stored generated column rewrites the table.
+        ALTER TABLE support_tickets
+            ADD COLUMN IF NOT EXISTS search_vector tsvector GENERATED ALWAYS AS (
+                setweight(to_tsvector('english', coalesce(subject, '')), 'A') ||
+                setweight(to_tsvector('english', coalesce(message, '')), 'B')
+            ) STORED;
+
+        CREATE INDEX IF NOT EXISTS idx_support_tickets_search_vector
+            ON support_tickets USING GIN (search_vector);
+    """),
+    ('010_ticket_resolutions', """
+        -- Agent responses and resolution notes are embedded like tickets
+        ALTER TABLE ticket_responses ADD COLUMN IF NOT EXISTS embedding vector(1536);
+
+        CREATE INDEX IF NOT EXISTS idx_ticket_responses_ticket
+            ON ticket_responses (ticket_id, created_at DESC);
+
+        -- Short summary of the ticket's best response, read by similarity
+        -- search in the same query that finds the ticket
+        ALTER TABLE support_tickets
+            ADD COLUMN IF NOT EXISTS resolution_summary TEXT,
+            ADD COLUMN IF NOT EXISTS resolution_response_id INTEGER REFERENCES ticket_responses(id);
+    """),
+    ('011_classification_source', """
+        -- Where a ticket's labels came from: 'model', 'local' (kNN
+        -- classifier), 'cluster' (copied from a duplicate), 'import' or
+        -- 'default' (fallback). NULL for tickets labeled before this column.
+        ALTER TABLE support_tickets ADD COLUMN IF NOT EXISTS classification_source VARCHAR(20);
+
+        -- The local classifier is seeded from the newest model-labeled tickets
+        CREATE INDEX IF NOT EXISTS idx_support_tickets_model_labeled
+            ON support_tickets (created_at DESC)
+            WHERE classification_source = 'model' AND embedding IS NOT NULL;
+    """),
+    ('012_rollup_statement_triggers', """
+        -- 004's row trigger updated the same few ticket_totals rows once per
+        -- ticket, in whatever order a statement touched its rows, so
+        -- concurrent bulk inserts queued on those rows and could deadlock.
+        -- Totals are now spread over 16 slot rows per value (a backend
+        -- writes the slot picked by its pid; readers sum the slots), and a
+        -- statement-level trigger applies each statement's summed deltas
+        -- once per key, in key order.
+        ALTER TABLE ticket_totals ADD COLUMN IF NOT EXISTS slot SMALLINT NOT NULL DEFAULT 0;
+        ALTER TABLE ticket_totals DROP CONSTRAINT IF EXISTS ticket_totals_pkey;
+        ALTER TABLE ticket_totals ADD PRIMARY KEY (dimension, value, slot);
+
+        DO $$ BEGIN
+            CREATE TYPE ticket_rollup_change AS (
+                day DATE, category VARCHAR(100), priority VARCHAR(20),
+                sentiment VARCHAR(20), status VARCHAR(50), delta INTEGER
+            );
+        EXCEPTION WHEN duplicate_object THEN NULL;
+        END $$;
+
+        CREATE OR REPLACE FUNCTION ticket_rollups_apply_changes(changes ticket_rollup_change[])
+        RETURNS void AS $$
+        BEGIN
+            INSERT INTO ticket_rollups (day, category, priority, sentiment, status, ticket_count)
+            SELECT day, category, priority, sentiment, status, SUM(delta)
+            FROM unnest(changes)
+            GROUP BY 1, 2, 3, 4, 5
+            HAVING SUM(delta) <> 0
+            ORDER BY 1, 2, 3, 4, 5
+            ON CONFLICT (day, category, priority, sentiment, status)
+            DO UPDATE SET ticket_count = ticket_rollups.ticket_count + EXCLUDED.ticket_count;
+
+            INSERT INTO ticket_totals (dimension, value, slot, ticket_count)
+            SELECT d.dimension, d.value, pg_backend_pid() % 16, SUM(c.delta)
+            FROM unnest(changes) c
+            CROSS JOIN LATERAL (VALUES ('category', c.category), ('priority', c.priority),
+                                       ('sentiment', c.sentiment), ('status', c.status)) AS d(dimension, value)
+            GROUP BY 1, 2
+            HAVING SUM(c.delta) <> 0
+            ORDER BY 1, 2
+            ON CONFLICT (dimension, value, slot)
+            DO UPDATE SET ticket_count = ticket_totals.ticket_count + EXCLUDED.ticket_count;
+        END;
+        $$ LANGUAGE plpgsql;
+
+        -- Unclassified tickets are still counted under ''. Updates only count
+        -- rows whose day or labels changed.
+        CREATE OR REPLACE FUNCTION ticket_rollups_statement_trigger() RETURNS trigger AS $$
+        BEGIN
+            IF TG_OP = 'INSERT' THEN
+                PERFORM ticket_rollups_apply_changes(ARRAY(
+                    SELECT ROW(n.created_at::date, COALESCE(n.category, ''), COALESCE(n.priority, ''),
+                               COALESCE(n.sentiment, ''), COALESCE(n.status, ''), 1)::ticket_rollup_change
+                    FROM new_rows n
+                ));
+            ELSIF TG_OP = 'DELETE' THEN
+                PERFORM ticket_rollups_apply_changes(ARRAY(
+                    SELECT ROW(o.created_at::date, COALESCE(o.category, ''), COALESCE(o.priority, ''),
+                               COALESCE(o.sentiment, ''), COALESCE(o.status, ''), -1)::ticket_rollup_change
+                    FROM old_rows o
+                ));
+            ELSE
+                PERFORM ticket_rollups_apply_changes(ARRAY(
+                    SELECT ROW(c.created_at::date, COALESCE(c.category, ''), COALESCE(c.priority, ''),
+                               COALESCE(c.sentiment, ''), COALESCE(c.status, ''), c.delta)::ticket_rollup_change
+                    FROM old_rows o
+                    JOIN new_rows n ON n.id = o.id
+                    CROSS JOIN LATERAL (VALUES
+                        (o.created_at, o.category, o.priority, o.sentiment, o.status, -1),
+                        (n.created_at, n.category, n.priority, n.sentiment, n.status, 1)
+                    ) AS c(created_at, category, priority, sentiment, status, delta)
+                    WHERE (o.created_at::date, o.category, o.priority, o.sentiment, o.status)
+                          IS DISTINCT FROM
+                          (n.created_at::date, n.category, n.priority, n.sentiment, n.status)
+                ));
+            END IF;
+            RETURN NULL;
+        END;
+        $$ LANGUAGE plpgsql;
+
+        DROP TRIGGER IF EXISTS support_tickets_rollups ON support_tickets;
+        DROP TRIGGER IF EXISTS support_tickets_rollups_insert ON support_tickets;
+        DROP TRIGGER IF EXISTS support_tickets_rollups_update ON support_tickets;
+        DROP TRIGGER IF EXISTS support_tickets_rollups_delete ON support_tickets;
+        CREATE TRIGGER support_tickets_rollups_insert
+            AFTER INSERT ON support_tickets
+            REFERENCING NEW TABLE AS new_rows
+            FOR EACH STATEMENT EXECUTE FUNCTION ticket_rollups_statement_trigger();
+        -- Transition tables rule out an UPDATE OF column list; unrelated
+        -- updates produce no changes and write nothing
+        CREATE TRIGGER support_tickets_rollups_update
+            AFTER UPDATE ON support_tickets
+            REFERENCING OLD TABLE AS old_rows NEW TABLE AS new_rows
+            FOR EACH STATEMENT EXECUTE FUNCTION ticket_rollups_statement_trigger();
+        CREATE TRIGGER support_tickets_rollups_delete
+            AFTER DELETE ON support_tickets
+            REFERENCING OLD TABLE AS old_rows
+            FOR EACH STATEMENT EXECUTE FUNCTION ticket_rollups_statement_trigger();
+
+        DROP FUNCTION IF EXISTS ticket_rollups_trigger();
+        DROP FUNCTION IF EXISTS ticket_rollups_apply(support_tickets, INTEGER);
+    """),
+    ('013_resolution_events', """
+        -- Resolution summaries (written by resolutions.refresh_resolution(s))
+        -- are served by the in-process similarity index, so a change to them
+        -- is published like a label or status change and the index refreshes
+        -- the ticket instead of waiting for its next reconcile
+        CREATE OR REPLACE FUNCTION ticket_events_notify() RETURNS trigger AS $$
+        BEGIN
+            IF TG_OP = 'UPDATE' AND
+               (OLD.category, OLD.priority, OLD.sentiment, OLD.status,
+                OLD.resolution_summary, OLD.resolution_response_id)
+               IS NOT DISTINCT FROM
+               (NEW.category, NEW.priority, NEW.sentiment, NEW.status,
+                NEW.resolution_summary, NEW.resolution_response_id) THEN
+                RETURN NULL;
+            END IF;
+            PERFORM pg_notify('ticket_events', json_build_object(
+                'op', TG_OP,
+                'ticket', json_build_object(
+                    'id', NEW.id,
+                    'customer_email', NEW.customer_email,
+                    'subject', LEFT(NEW.subject, 200),
+                    'category', NEW.category,
+                    'priority', NEW.priority,
+                    'sentiment', NEW.sentiment,
+                    'status', NEW.status,
+                    'created_at', NEW.created_at
+                ),
+                'old', CASE WHEN TG_OP = 'UPDATE' THEN json_build_object(
+                    'category', OLD.category,
+                    'priority', OLD.priority,
+                    'sentiment', OLD.sentiment,
+                    'status', OLD.status
+                ) END
+            )::text);
+            RETURN NULL;
+        END;
+        $$ LANGUAGE plpgsql;
+
+        DROP TRIGGER IF EXISTS support_tickets_events ON support_tickets;
+        CREATE TRIGGER support_tickets_events
+            AFTER INSERT OR UPDATE OF category, priority, sentiment, status,
+                                      resolution_summary, resolution_response_id
+            ON support_tickets
+            FOR EACH ROW EXECUTE FUNCTION ticket_events_notify();
+    """),
+    ('014_cluster_category_width', """
+        -- Clusters copy the ticket's category, which can be up to 100
+        -- characters; 007 created the column narrower. Widening a varchar
+        -- does not rewrite the table.
+        ALTER TABLE ticket_clusters ALTER COLUMN category TYPE VARCHAR(100);
+    """),
+    ('015_semantic_cache_category_width', """
+        -- Same as 014 for the semantic response cache's bucket key
+        ALTER TABLE semantic_response_cache ALTER COLUMN category TYPE VARCHAR(100);
+    """),
+]
+
+
+def apply_migrations(conn, verbose=True):
+    cur = conn.cursor()
+    cur.execute("""
+        CREATE TABLE IF NOT EXISTS schema_migrations (
+            name VARCHAR(200) PRIMARY KEY,
+            applied_at TIMESTAMP WITH TIME ZONE DEFAULT CURRENT_TIMESTAMP
+        )
+    """)
+    conn.commit()
+
+    cur.execute("SELECT name FROM schema_migrations")
+    applied = {row[0] for row in cur.fetchall()}
+
+    newly_applied = []
+    for name, sql in MIGRATIONS:
+        if name in applied:
+            continue
+        if verbose:
+            print(f"Applying {name}...")
+        cur.execute(sql)
+        cur.execute("INSERT INTO schema_migrations (name) VALUES (%s)", (name,))
+        conn.commit()
+        newly_applied.append(name)
+
+    cur.close()
+    return newly_applied
+
+
+if __name__ == '__main__':
+    from app import db_connection
+
+    try:
+        with db_connection() as conn:
+            applied = apply_migrations(conn)
+    except Exception as e:
+        print(f"Migration failed: {e}")
+        sys.exit(1)
+
+    if applied:
+        print(f"Applied {len(applied)} migration(s).")
+    else:
+        print("Database schema is up to date.")
@@ -0,0 +1,137 @@
+import contextvars
+import time
+from concurrent.futures import FIRST_COMPLETED, wait
+
+import tracing
+
+
+class StageTimeout(Exception):
+    pass
+
+
+# Raised by a strict run instead of using a stage's fallback
+class StageFailed(Exception):
+    def __init__(self, stage, error):
+        super().__init__(f"Stage {stage} failed: {error}")
+        self.stage = stage
+        self.error = error
+
+
+# One node of the enrichment graph. func receives the results gathered so far
+# (pipeline inputs plus the outputs of finished stages) and returns this
+# stage's output. fallback(results, error) supplies a substitute output when
+# the stage raises or runs past its timeout.
+class Stage:
+    def __init__(self, name, func, deps=(), timeout=None, fallback=None):
+        self.name = name
+        self.func = func
+        self.deps = tuple(deps)
+        self.timeout = timeout
+        self.fallback = fallback
+
+
+# How often a run re-checks stages that are still queued on a busy executor,
+# so a stage's timeout is enforced soon after it actually starts
+QUEUED_POLL_INTERVAL = 0.05
+
+
+# Dependency-graph executor
+#
+# Every stage whose dependencies are satisfied is submitted to the executor at
+# once, so independent remote calls (embedding and classification) overlap and
+# a stage starts as soon as its own inputs are ready rather than when the
+# slowest sibling finishes. A stage's timeout runs from when it starts on an
+# executor thread, not from when it was queued, so a saturated executor delays
+# stages instead of timing them out unrun. A stage that times out is
+# abandoned, not cancelled: its thread runs to completion in the background
+# while the pipeline carries on with the fallback value, so the executor needs
+# headroom beyond the stages in flight. Stages run in the caller's context (so
+# their trace spans nest under the caller's span) and each gets a span of its
+# own. A strict run (used by background jobs, which can be retried) raises
+# StageFailed on the first stage error or timeout instead of falling back;
+# stages it had queued but not started are cancelled.
+class StagePipeline:
+    def __init__(self, stages, executor, stats=None):
+        self.stages = {stage.name: stage for stage in stages}
+        self.executor = executor
+        self.stats = stats
+
+        for stage in stages:
+            for dep in stage.deps:
+                if dep not in self.stages:
+                    raise ValueError(f"Stage {stage.name} depends on unknown stage {dep}")
+
+    def _execute(self, stage, results, started):
+        started.append(time.monotonic())
+        with tracing.span(f"stage.{stage.name}"):
+            return stage.func(results)
+
+    def _finish(self, stage, results, started, value=None, error=None, strict=False):
+        elapsed = time.monotonic() - started
+        if error is not None:
+            if self.stats:
+                self.stats.mark(stage.name, 'timeouts' if isinstance(error, StageTimeout)
+                                else 'failures' if strict else 'fallbacks')
+            if strict:
+                raise StageFailed(stage.name, error) from error
+            if stage.fallback is None:
+                raise error
+            print(f"Stage {stage.name} failed, using fallback: {error}")
+            value = stage.fallback(results, error)
+        if self.stats:
+            self.stats.record(stage.name, elapsed)
+        results[stage.name] = value
+
+    # Wait until the nearest deadline of a started stage, or briefly while a
+    # timed stage is still queued
+    def _wait_time(self, running):
+        now = time.monotonic()
+        waits = []
+        for stage, started in running.values():
+            if stage.timeout is None:
+                continue
+            waits.append(max(0.0, started[0] + stage.timeout - now) if started else QUEUED_POLL_INTERVAL)
+        return min(waits) if waits else None
+
+    def run(self, strict=False, **inputs):
+        results = dict(inputs)
+        pending = dict(self.stages)
+        running = {}  # future -> (stage, [start time once the stage is running])
+
+        try:
+            while pending or running:
+                for name, stage in list(pending.items()):
+                    if all(dep in results for dep in stage.deps):
+                        del pending[name]
+                        started = []
+                        future = self.executor.submit(contextvars.copy_context().run,
+                                                      self._execute, stage, dict(results), started)
+                        running[future] = (stage, started)
+
+                if not running:
+                    raise ValueError(f"Unresolvable stage dependencies: {sorted(pending)}")
+
+                done, _ = wait(list(running), timeout=self._wait_time(running), return_when=FIRST_COMPLETED)
+
+                for future in done:
+                    stage, started = running.pop(future)
+                    try:
+                        value = future.result()
+                    except Exception as e:
+                        self._finish(stage, results, started[0], error=e, strict=strict)
+                    else:
+                        self._finish(stage, results, started[0], value=value)
+
+                now = time.monotonic()
+                for future, (stage, started) in list(running.items()):
+                    if stage.timeout is not None and started and now >= started[0] + stage.timeout:
+                        del running[future]
+                        error = StageTimeout(f"{stage.name} timed out after {stage.timeout}s")
+                        self._finish(stage, results, started[0], error=error, strict=strict)
+        finally:
+            # Only left non-empty when a run fails early; queued stages whose
+            # results nobody will read are not started
+            for future in running:
+                future.cancel()
+
+        return results
@@ -0,0 +1,209 @@
+import os
+import re
+import threading
+
+try:
+    import tiktoken
+except ImportError:  # local estimate only
+    tiktoken = None
+
+
+def prompt_settings_from_env():
+    return {
+        'classification_tokens': int(os.getenv('PROMPT_CLASSIFICATION_TOKENS', 800)),
+        'response_tokens': int(os.getenv('PROMPT_RESPONSE_TOKENS', 1500)),
+        'context_tokens': int(os.getenv('PROMPT_CONTEXT_TOKENS', 300)),
+        'context_tickets': int(os.getenv('PROMPT_CONTEXT_TICKETS', 2)),
+    }
+
+
+# Token counting
+#
+# With tiktoken installed, counts use the model's own encoding (cl100k_base
+# for models it does not know); without it, or if the encoding cannot be
+# loaded, they fall back to the four-characters-per-token estimate.
+_encodings = {}
+_encodings_lock = threading.Lock()
+
+
+# Rough token count (about four characters per token for English text)
+def estimate_tokens(text):
+    return max(1, len(text) // 4)
+
+
+def encoding_for(model):
+    if tiktoken is None:
+        return None
+    with _encodings_lock:
+        if model not in _encodings:
+            try:
+                try:
+                    _encodings[model] = tiktoken.encoding_for_model(model)
+                except KeyError:
+                    _encodings[model] = tiktoken.get_encoding('cl100k_base')
+            except Exception as e:
+                print(f"Error loading tokenizer for {model}, estimating tokens instead: {e}")
+                _encodings[model] = None
+        return _encodings[model]
+
+
+def count_tokens(text, model=None):
+    encoding = encoding_for(model) if model else None
+    if encoding is None:
+        return estimate_tokens(text or '')
+    return len(encoding.encode(text or '', disallowed_special=()))
+
+
+# Cut text to max_tokens, keeping the start (where the problem is usually
+# described) and the end (the latest question or error output). Returns the
+# text and the number of tokens removed.
+def truncate_tokens(text, max_tokens, model=None):
+    total = count_tokens(text, model)
+    if total <= max_tokens:
+        return text, 0
+
+    keep = max(max_tokens - 12, 1)  # room for the marker
+    head = keep * 2 // 3
+    tail = keep - head
+    encoding = encoding_for(model) if model else None
+    if encoding is not None:
+        tokens = encoding.encode(text, disallowed_special=())
+        start = encoding.decode(tokens[:head])
+        end = encoding.decode(tokens[-tail:]) if tail else ''
+    else:
+        start = text[:head * 4]
+        end = text[-tail * 4:] if tail else ''
+    omitted = total - keep
+    return f"{start.rstrip()}\n[... {omitted} tokens omitted ...]\n{end.lstrip()}", omitted
+
+
+QUOTED_HISTORY = re.compile(
+    r'^(-{2,}\s*original message\s*-{2,}|on .{5,200} wrote:)$',
+    re.IGNORECASE | re.MULTILINE,
+)
+
+
+# Strip what a customer's email client adds: quoted earlier messages and
+# runs of blank lines. Only the customer's own words are sent to the model.
+def condense_message(text):
+    text = text or ''
+    match = QUOTED_HISTORY.search(text)
+    if match and match.start() > 0:
+        text = text[:match.start()]
+    lines = [line.rstrip() for line in text.splitlines() if not line.lstrip().startswith('>')]
+    return re.sub(r'\n{3,}', '\n\n', '\n'.join(lines)).strip()
+
+
+# Static instructions. They go first, as the system message, and never
+# contain ticket data, so every call starts with the same bytes. At about
+# 150-200 tokens they are well below the 1024-token minimum OpenAI needs
+# before it caches a prefix, so at current sizes this buys no caching
+# discount; it only keeps the prefix stable if the instructions grow past it.
+CLASSIFICATION_INSTRUCTIONS = """Analyze the support ticket you are given and classify it. Return a JSON response with:
+- category: one of [Technical Issue, Billing, Account Access, Feature Request, General Inquiry, Bug Report, Refund Request]
+- priority: one of [Low, Medium, High, Critical]
+- sentiment: one of [Positive, Neutral, Negative, Frustrated]
+- urgency_keywords: list of words that indicate urgency
+
+Consider:
+- Keywords that indicate category
+- Tone and language that suggests priority
+- Emotional indicators for sentiment
+- Urgency indicators like "urgent", "immediately", "broken", "not working"
+
+Long messages may be shortened; a line like "[... N tokens omitted ...]" marks the cut.
+
+Return only valid JSON."""
+
+RESPONSE_INSTRUCTIONS = """Generate a professional, helpful response to the support ticket you are given.
+
+Guidelines:
+- Be professional and empathetic
+- Acknowledge the issue clearly
+- Provide specific steps or solutions when possible
+- If it's a technical issue, ask for relevant details
+- Match the tone to the customer's sentiment
+- Keep response concise but complete
+- Include next steps or timeline when appropriate
+- When similar tickets' resolutions are listed, reuse the steps that apply to this ticket
+
+Long messages may be shortened; a line like "[... N tokens omitted ...]" marks the cut."""
+
+SUBJECT_TOKENS = 64
+MIN_MESSAGE_TOKENS = 100
+
+
+# Prompt builder
+#
+# Each prompt is a (system, user) pair: the static instructions above, then
+# the ticket. The user part is kept within the configured token budget: the
+# subject is capped at SUBJECT_TOKENS, similar-ticket resolutions at
+# context_tokens, and the customer's message, after condense_message, gets
+# whatever remains (at least MIN_MESSAGE_TOKENS). Per-kind counts of builds,
+# truncations and prompt tokens are kept for /health/prompts.
+class PromptBuilder:
+    def __init__(self, settings, model):
+        self.settings = settings
+        self.model = model
+        self._lock = threading.Lock()
+        self._stats = {}
+
+    def count(self, text):
+        return count_tokens(text, self.model)
+
+    def _record(self, kind, system, user, omitted):
+        tokens = self.count(system) + self.count(user)
+        with self._lock:
+            stats = self._stats.setdefault(kind, {'builds': 0, 'truncated': 0, 'tokens_omitted': 0,
+                                                  'prompt_tokens': 0})
+            stats['builds'] += 1
+            stats['truncated'] += 1 if omitted else 0
+            stats['tokens_omitted'] += omitted
+            stats['prompt_tokens'] += tokens
+
+    def _ticket(self, subject, message, budget):
+        subject, subject_omitted = truncate_tokens(' '.join((subject or '').split()), SUBJECT_TOKENS, self.model)
+        fixed = self.count(f"Subject: {subject}\nMessage: ")
+        message, message_omitted = truncate_tokens(condense_message(message),
+                                                   max(budget - fixed, MIN_MESSAGE_TOKENS), self.model)
+        return f"Subject: {subject}\nMessage: {message}", subject_omitted + message_omitted
+
+    def _context(self, similar_tickets):
+        resolved = [ticket for ticket in similar_tickets or [] if ticket.get('resolution')]
+        lines = []
+        remaining = self.settings['context_tokens']
+        for ticket in resolved[:self.settings['context_tickets']]:
+            line = f"- {' '.join(ticket['subject'].split())}: {' '.join(ticket['resolution'].split())}"
+            if self.count(line) > remaining:
+                if lines:
+                    break
+                line, _ = truncate_tokens(line, remaining, self.model)
+            lines.append(line)
+            remaining -= self.count(line)
+        return "How similar tickets were resolved:\n" + '\n'.join(lines) if lines else ''
+
+    def classification(self, subject, message):
+        budget = self.settings['classification_tokens'] - self.count(CLASSIFICATION_INSTRUCTIONS)
+        user, omitted = self._ticket(subject, message, budget)
+        self._record('classification', CLASSIFICATION_INSTRUCTIONS, user, omitted)
+        return CLASSIFICATION_INSTRUCTIONS, user
+
+    def response(self, ticket_data, similar_tickets=None):
+        header = (f"Category: {ticket_data['category']}\n"
+                  f"Priority: {ticket_data['priority']}\n"
+                  f"Sentiment: {ticket_data['sentiment']}")
+        context = self._context(similar_tickets)
+        budget = (self.settings['response_tokens'] - self.count(RESPONSE_INSTRUCTIONS)
+                  - self.count(header) - self.count(context))
+        ticket, omitted = self._ticket(ticket_data['subject'], ticket_data['message'], budget)
+        user = '\n\n'.join(part for part in (header, context, ticket) if part)
+        self._record('response', RESPONSE_INSTRUCTIONS, user, omitted)
+        return RESPONSE_INSTRUCTIONS, user
+
+    def stats(self):
+        with self._lock:
+            kinds = {kind: dict(stats) for kind, stats in self._stats.items()}
+        for stats in kinds.values():
+            stats['avg_prompt_tokens'] = round(stats['prompt_tokens'] / stats['builds'], 1)
+        return dict(self.settings, tokenizer='tiktoken' if encoding_for(self.model) else 'estimate',
+                    prompts=kinds)
@@ -0,0 +1,470 @@
+import json
+import random
+import threading
+import time
+from concurrent.futures import Future, ThreadPoolExecutor
+
+from fake_models import FakeEmbedder, fake_classification, fake_response, ticket_text
+from prompts import count_tokens, estimate_tokens
+import tracing
+
+
+class CircuitOpenError(Exception):
+    pass
+
+
+class RateLimitTimeout(Exception):
+    pass
+
+
+# "model=rpm:tpm,model=rpm:tpm" -> {model: (rpm, tpm)}; 0 means unlimited
+def parse_rate_limits(value):
+    limits = {}
+    for part in (value or '').split(','):
+        if not part.strip():
+            continue
+        model, rates = part.split('=')
+        rpm, _, tpm = rates.partition(':')
+        limits[model.strip()] = (float(rpm or 0), float(tpm or 0))
+    return limits
+
+
+# Providers
+#
+# A provider only knows how to talk to one backend: embed(texts, model) and
+# chat(prompt, model, temperature, system) return (result, usage), stream()
+# returns (text chunks, usage) with usage filled in once the stream is
+# exhausted, and is_retryable / retry_after classify its errors. system, when
+# given, is sent as a separate first message ahead of the prompt. Rate
+# limiting, retries and circuit breaking are layered on top by ModelClient.
+class OpenAIProvider:
+    name = 'openai'
+
+    def __init__(self, api_key, timeout=60.0):
+        from openai import OpenAI
+        # Retries are handled by ModelClient so they share its backoff and breaker
+        self.client = OpenAI(api_key=api_key, timeout=timeout, max_retries=0)
+
+    def embed(self, texts, model):
+        response = self.client.embeddings.create(model=model, input=texts)
+        vectors = [None] * len(texts)
+        for item in response.data:
+            vectors[item.index] = item.embedding
+        usage = {'prompt_tokens': response.usage.prompt_tokens if response.usage else 0, 'completion_tokens': 0}
+        return vectors, usage
+
+    def messages(self, prompt, system):
+        messages = [{"role": "system", "content": system}] if system else []
+        return messages + [{"role": "user", "content": prompt}]
+
+    def chat(self, prompt, model, temperature, system=None):
+        response = self.client.chat.completions.create(
+            model=model,
+            messages=self.messages(prompt, system),
+            temperature=temperature
+        )
+        usage = {
+            'prompt_tokens': response.usage.prompt_tokens if response.usage else 0,
+            'completion_tokens': response.usage.completion_tokens if response.usage else 0,
+        }
+        return response.choices[0].message.content, usage
+
+    def stream(self, prompt, model, temperature, system=None):
+        stream = self.client.chat.completions.create(
+            model=model,
+            messages=self.messages(prompt, system),
+            temperature=temperature,
+            stream=True,
+            stream_options={"include_usage": True}
+        )
+        usage = {}
+
+        def chunks():
+            for chunk in stream:
+                if chunk.usage:
+                    usage['prompt_tokens'] = chunk.usage.prompt_tokens
+                    usage['completion_tokens'] = chunk.usage.completion_tokens
+                if chunk.choices and chunk.choices[0].delta.content:
+                    yield chunk.choices[0].delta.content
+        return chunks(), usage
+
+    def is_retryable(self, error):
+        import openai
+        if isinstance(error, (openai.APIConnectionError, openai.RateLimitError, openai.InternalServerError)):
+            return True
+        return getattr(error, 'status_code', None) in (408, 409)
+
+    def retry_after(self, error):
+        response = getattr(error, 'response', None)
+        value = response.headers.get('retry-after') if response is not None else None
+        try:
+            return float(value) if value else None
+        except ValueError:
+            return None
+
+
+# Deterministic in-process provider for tests, benchmarks and offline demos
+class LocalProvider:
+    name = 'local'
+
+    def __init__(self, dims=1536):
+        self.embedder = FakeEmbedder(dims)
+
+    def embed(self, texts, model):
+        return self.embedder.embed_many(texts), {'prompt_tokens': sum(estimate_tokens(t) for t in texts),
+                                                 'completion_tokens': 0}
+
+    def chat(self, prompt, model, temperature, system=None):
+        if 'classify' in (system or prompt).lower():
+            content = json.dumps(fake_classification(ticket_text(prompt)))
+        else:
+            content = fake_response(ticket_text(prompt))
+        return content, {'prompt_tokens': estimate_tokens((system or '') + prompt),
+                         'completion_tokens': estimate_tokens(content)}
+
+    def stream(self, prompt, model, temperature, system=None):
+        content, usage = self.chat(prompt, model, temperature, system)
+        words = content.split(' ')
+        return (word + (' ' if i < len(words) - 1 else '') for i, word in enumerate(words)), usage
+
+    def is_retryable(self, error):
+        return False
+
+    def retry_after(self, error):
+        return None
+
+
+# Token bucket refilled continuously at rate_per_minute. acquire() reserves
+# its tokens up front (the balance may go negative) and then sleeps off the
+# debt, so waiting callers are served in arrival order without polling.
+class TokenBucket:
+    def __init__(self, rate_per_minute, burst_seconds=10.0):
+        self.rate = rate_per_minute / 60.0
+        self.capacity = max(1.0, self.rate * burst_seconds)
+        self._tokens = self.capacity
+        self._updated = time.monotonic()
+        self._lock = threading.Lock()
+
+    def _refill(self):
+        now = time.monotonic()
+        self._tokens = min(self.capacity, self._tokens + (now - self._updated) * self.rate)
+        self._updated = now
+
+    def acquire(self, amount=1.0, timeout=None):
+        amount = min(amount, self.capacity)
+        with self._lock:
+            self._refill()
+            wait = max(0.0, (amount - self._tokens) / self.rate)
+            if timeout is not None and wait > timeout:
+                raise RateLimitTimeout(f"rate limit wait of {wait:.1f}s exceeds {timeout}s")
+            self._tokens -= amount
+        if wait:
+            time.sleep(wait)
+        return wait
+
+    def debit(self, amount):
+        # Charge usage discovered after the call without blocking
+        with self._lock:
+            self._refill()
+            self._tokens -= amount
+
+
+# Closed -> open after failure_threshold consecutive transient failures; open
+# rejects calls immediately for reset_timeout seconds, then lets one trial
+# call through (half open) whose outcome closes or re-opens the circuit.
+class CircuitBreaker:
+    def __init__(self, failure_threshold=5, reset_timeout=30.0):
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self._lock = threading.Lock()
+        self._state = 'closed'
+        self._failures = 0
+        self._opened_at = 0.0
+        self._trial_in_flight = False
+
+    def allow(self):
+        with self._lock:
+            if self._state == 'closed':
+                return True
+            if self._state == 'open' and time.monotonic() - self._opened_at >= self.reset_timeout:
+                self._state = 'half_open'
+                self._trial_in_flight = False
+            if self._state == 'half_open' and not self._trial_in_flight:
+                self._trial_in_flight = True
+                return True
+            return False
+
+    def record_success(self):
+        with self._lock:
+            self._state = 'closed'
+            self._failures = 0
+            self._trial_in_flight = False
+
+    def record_failure(self):
+        with self._lock:
+            self._failures += 1
+            if self._state == 'half_open' or self._failures >= self.failure_threshold:
+                self._state = 'open'
+                self._opened_at = time.monotonic()
+            self._trial_in_flight = False
+
+    @property
+    def state(self):
+        with self._lock:
+            return self._state
+
+
+# Micro-batching for single-text embedding calls
+#
+# Callers from concurrent requests are gathered for up to max_wait seconds
+# (or until max_batch texts are waiting) and sent as one embeddings call;
+# identical texts already waiting or in flight share one result.
+class EmbeddingBatcher:
+    def __init__(self, embed_many, max_batch=64, max_wait=0.005, max_in_flight=4):
+        self.embed_many = embed_many
+        self.max_batch = max_batch
+        self.max_wait = max_wait
+        self._cond = threading.Condition()
+        self._pending = []
+        self._futures = {}
+        self._executor = ThreadPoolExecutor(max_workers=max_in_flight, thread_name_prefix='embedding-batch')
+        self._thread = None
+        self._stats = {'requests': 0, 'coalesced': 0, 'batches': 0, 'batched_texts': 0}
+
+    def embed(self, text):
+        with self._cond:
+            self._stats['requests'] += 1
+            future = self._futures.get(text)
+            if future is not None:
+                self._stats['coalesced'] += 1
+            else:
+                future = Future()
+                self._futures[text] = future
+                self._pending.append(text)
+                if self._thread is None:
+                    self._thread = threading.Thread(target=self._run, name='embedding-batcher', daemon=True)
+                    self._thread.start()
+                self._cond.notify()
+        return future.result()
+
+    def _run(self):
+        while True:
+            with self._cond:
+                while not self._pending:
+                    self._cond.wait()
+                deadline = time.monotonic() + self.max_wait
+                while len(self._pending) < self.max_batch:
+                    remaining = deadline - time.monotonic()
+                    if remaining <= 0:
+                        break
+                    self._cond.wait(remaining)
+                batch = self._pending[:self.max_batch]
+                del self._pending[:self.max_batch]
+                self._stats['batches'] += 1
+                self._stats['batched_texts'] += len(batch)
+            self._executor.submit(self._dispatch, batch)
+
+    def _dispatch(self, batch):
+        try:
+            vectors = self.embed_many(batch)
+            error = None
+        except Exception as e:
+            vectors, error = None, e
+        with self._cond:
+            futures = [self._futures.pop(text) for text in batch]
+        for i, future in enumerate(futures):
+            if error is not None:
+                future.set_exception(error)
+            else:
+                future.set_result(vectors[i])
+
+    def stats(self):
+        with self._cond:
+            stats = dict(self._stats)
+        stats['avg_batch_size'] = stats['batched_texts'] / stats['batches'] if stats['batches'] else 0.0
+        return stats
+
+
+# Rate-limited, retrying, circuit-broken access to one provider
+#
+# Every model gets its own request and token buckets (from rate_limits) and
+# its own breaker, so a 429 storm on the chat model does not stop embeddings.
+# Transient errors are retried with full-jitter exponential backoff, honouring
+# Retry-After when the provider sends it; once the breaker opens, calls fail
+# immediately with CircuitOpenError so callers fall back without waiting.
+# Token usage is counted per model and, for calls made with a purpose
+# ('classification', 'response'), per purpose; a stream's usage is counted
+# when it has been read to the end.
+class ModelClient:
+    def __init__(self, provider, rate_limits=None, max_retries=3, base_delay=0.5, max_delay=20.0,
+                 rate_limit_timeout=30.0, breaker_threshold=5, breaker_reset=30.0,
+                 embed_batch_size=64, embed_batch_wait=0.005):
+        self.provider = provider
+        self.rate_limits = rate_limits or {}
+        self.max_retries = max_retries
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+        self.rate_limit_timeout = rate_limit_timeout
+        self.breaker_threshold = breaker_threshold
+        self.breaker_reset = breaker_reset
+        self.embed_batch_size = embed_batch_size
+        self.embed_batch_wait = embed_batch_wait
+        self._lock = threading.Lock()
+        self._models = {}
+        self._purposes = {}
+        self._batchers = {}
+
+    def _model(self, model):
+        with self._lock:
+            state = self._models.get(model)
+            if state is None:
+                rpm, tpm = self.rate_limits.get(model, (0, 0))
+                state = self._models[model] = {
+                    'requests': TokenBucket(rpm) if rpm else None,
+                    'tokens': TokenBucket(tpm) if tpm else None,
+                    'breaker': CircuitBreaker(self.breaker_threshold, self.breaker_reset),
+                    'stats': {
+                        'calls': 0, 'failures': 0, 'retries': 0, 'rejected': 0,
+                        'rate_limit_wait_seconds': 0.0, 'prompt_tokens': 0, 'completion_tokens': 0,
+                        'errors': {},
+                    },
+                }
+            return state
+
+    def _record(self, state, **amounts):
+        with self._lock:
+            for name, amount in amounts.items():
+                state['stats'][name] += amount
+
+    def _count_error(self, state, error):
+        with self._lock:
+            state['stats']['failures'] += 1
+            errors = state['stats']['errors']
+            errors[type(error).__name__] = errors.get(type(error).__name__, 0) + 1
+
+    def _record_usage(self, model, purpose, usage, estimated_tokens):
+        state = self._model(model)
+        prompt_tokens = usage.get('prompt_tokens', 0)
+        completion_tokens = usage.get('completion_tokens', 0)
+        if state['tokens'] and prompt_tokens + completion_tokens > estimated_tokens:
+            state['tokens'].debit(prompt_tokens + completion_tokens - estimated_tokens)
+        self._record(state, prompt_tokens=prompt_tokens, completion_tokens=completion_tokens)
+        if purpose:
+            with self._lock:
+                stats = self._purposes.setdefault(purpose, {'calls': 0, 'prompt_tokens': 0,
+                                                            'completion_tokens': 0})
+                stats['calls'] += 1
+                stats['prompt_tokens'] += prompt_tokens
+                stats['completion_tokens'] += completion_tokens
+
+    def _call(self, model, estimated_tokens, fn, purpose=None):
+        attributes = {'purpose': purpose} if purpose else {}
+        with tracing.span('model.call', model=model, provider=self.provider.name, **attributes) as span:
+            result, usage, attempts = self._call_with_retries(model, estimated_tokens, fn, purpose)
+            if span is not None:
+                span.set_attribute('attempts', attempts)
+                span.set_attribute('prompt_tokens', usage.get('prompt_tokens', 0))
+                span.set_attribute('completion_tokens', usage.get('completion_tokens', 0))
+            return result
+
+    def _call_with_retries(self, model, estimated_tokens, fn, purpose=None):
+        state = self._model(model)
+        breaker = state['breaker']
+
+        waited = 0.0
+        try:
+            if state['requests']:
+                waited += state['requests'].acquire(1, timeout=self.rate_limit_timeout)
+            if state['tokens']:
+                waited += state['tokens'].acquire(estimated_tokens, timeout=self.rate_limit_timeout)
+        except RateLimitTimeout as e:
+            self._count_error(state, e)
+            raise
+        finally:
+            self._record(state, rate_limit_wait_seconds=waited)
+
+        if not breaker.allow():
+            self._record(state, rejected=1)
+            raise CircuitOpenError(f"circuit open for {model}")
+
+        attempt = 0
+        while True:
+            try:
+                result, usage = fn()
+            except Exception as e:
+                retryable = self.provider.is_retryable(e)
+                if retryable and attempt < self.max_retries:
+                    delay = self.provider.retry_after(e)
+                    if delay is None:
+                        delay = random.uniform(0, min(self.max_delay, self.base_delay * 2 ** attempt))
+                    attempt += 1
+                    self._record(state, retries=1)
+                    time.sleep(delay)
+                    continue
+
+                # Non-transient errors mean the service answered, so they
+                # do not count towards opening the circuit
+                if retryable:
+                    breaker.record_failure()
+                else:
+                    breaker.record_success()
+                self._count_error(state, e)
+                raise
+
+            breaker.record_success()
+            self._record(state, calls=1)
+            if usage is not None:
+                self._record_usage(model, purpose, usage, estimated_tokens)
+            return result, usage or {}, attempt + 1
+
+    def embed(self, texts, model):
+        estimated = sum(count_tokens(text, model) for text in texts)
+        return self._call(model, estimated, lambda: self.provider.embed(texts, model))
+
+    def embed_one(self, text, model):
+        with self._lock:
+            batcher = self._batchers.get(model)
+            if batcher is None:
+                batcher = self._batchers[model] = EmbeddingBatcher(
+                    lambda texts: self.embed(texts, model),
+                    max_batch=self.embed_batch_size, max_wait=self.embed_batch_wait
+                )
+        # The batched request is shared by several callers, so its model.call
+        # span is a trace of its own; this span records the caller's wait
+        with tracing.span('model.embed_batched', model=model):
+            return batcher.embed(text)
+
+    def chat(self, prompt, model, temperature=0.7, system=None, purpose=None):
+        estimated = count_tokens(prompt, model) + (count_tokens(system, model) if system else 0)
+        return self._call(model, estimated,
+                          lambda: self.provider.chat(prompt, model, temperature, system), purpose)
+
+    def stream(self, prompt, model, temperature=0.7, system=None, purpose=None):
+        # Only opening the stream is retried; a stream that breaks midway
+        # surfaces to the caller. Usage is only known once it has been read.
+        estimated = count_tokens(prompt, model) + (count_tokens(system, model) if system else 0)
+        chunks, usage = self._call(model, estimated,
+                                   lambda: (self.provider.stream(prompt, model, temperature, system), None),
+                                   purpose)
+
+        def counted():
+            yield from chunks
+            self._record_usage(model, purpose, usage, estimated)
+        return counted()
+
+    def stats(self):
+        with self._lock:
+            models = {
+                model: dict(state['stats'], errors=dict(state['stats']['errors']))
+                for model, state in self._models.items()
+            }
+            breakers = {model: state['breaker'] for model, state in self._models.items()}
+            batchers = dict(self._batchers)
+        for model, breaker in breakers.items():
+            models[model]['circuit'] = breaker.state
+            models[model]['rate_limit_wait_seconds'] = round(models[model]['rate_limit_wait_seconds'], 3)
+        for model, batcher in batchers.items():
+            models[model]['embedding_batches'] = batcher.stats()
+        with self._lock:
+            purposes = {purpose: dict(stats) for purpose, stats in self._purposes.items()}
+        return {'provider': self.provider.name, 'models': models, 'purposes': purposes}
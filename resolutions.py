@@ -0,0 +1,144 @@
+import argparse
+import os
+import re
+import sys
+
+from psycopg2.extras import execute_values
+
+# Response types agents can record; bulk imports store 'human'. Generated
+# responses ('ai_suggested', 'ai_cluster', 'ai_cached', 'auto') are only a
+# fallback source for the summary, and only when use_ai_responses is set
+RESPONSE_TYPES = ('resolution', 'agent', 'human')
+AI_RESPONSE = "(r.response_type = 'auto' OR r.response_type LIKE 'ai%%')"
+
+SENTENCE_SPLIT = re.compile(r'(?<=[.!?])\s+')
+PLEASANTRY = re.compile(
+    r'^(dear|hi|hello|hey|greetings|thank you|thanks|we appreciate|i appreciate|we apologi[sz]e|'
+    r'i apologi[sz]e|sorry|i understand|we understand|i hope|we hope|please let us know|'
+    r'if you have any (other|further) questions|feel free)\b',
+    re.IGNORECASE,
+)
+SIGN_OFF = re.compile(r'^(best|kind|warm)?\s*(regards|sincerely|cheers|best wishes)\b|^\[your name\]',
+                      re.IGNORECASE)
+
+
+def resolution_settings_from_env():
+    return {
+        'summary_chars': int(os.getenv('RESOLUTION_SUMMARY_CHARS', 400)),
+        'use_ai_responses': os.getenv('RESOLUTION_USE_AI_RESPONSES', 'false').lower() == 'true',
+        'backfill_batch_size': int(os.getenv('RESOLUTION_BACKFILL_BATCH_SIZE', 500)),
+    }
+
+
+# Extractive summary of a resolution for the generation prompt: greetings,
+# apologies, offers of further help and the sign-off carry no information
+# about how the issue was fixed, so they are dropped and the remaining
+# sentences are kept in order up to max_chars
+def summarize_resolution(text, max_chars=400):
+    sentences = []
+    for line in (text or '').splitlines():
+        line = line.strip()
+        if SIGN_OFF.match(line):
+            break
+        sentences.extend(s for s in SENTENCE_SPLIT.split(line) if s)
+
+    kept = [s for s in sentences if not PLEASANTRY.match(s)] or sentences
+    summary = ''
+    for sentence in kept:
+        candidate = f"{summary} {sentence}".strip()
+        if len(candidate) > max_chars:
+            if not summary:
+                summary = sentence[:max_chars - 3].rstrip() + '...'
+            break
+        summary = candidate
+    return summary or None
+
+
+# The response a ticket's summary is built from: the newest resolution note,
+# else the human response closest to the ticket (by embedding, then newest),
+# else, if allowed, the newest generated one
+def best_response_query(use_ai_responses, where):
+    types = "" if use_ai_responses else f"AND NOT {AI_RESPONSE}"
+    return f"""
+        SELECT DISTINCT ON (r.ticket_id) r.ticket_id, r.id, r.response_text
+        FROM ticket_responses r
+        JOIN support_tickets t ON t.id = r.ticket_id
+        WHERE {where} {types}
+        ORDER BY r.ticket_id,
+                 CASE WHEN r.response_type = 'resolution' THEN 0 WHEN {AI_RESPONSE} THEN 2 ELSE 1 END,
+                 CASE WHEN r.response_type <> 'resolution' AND NOT {AI_RESPONSE}
+                      THEN r.embedding <=> t.embedding END NULLS LAST,
+                 r.created_at DESC, r.id DESC
+    """
+
+
+# Recompute the stored summary for one ticket inside the caller's transaction
+def refresh_resolution(cur, ticket_id, settings):
+    cur.execute(best_response_query(settings['use_ai_responses'], "r.ticket_id = %s"), (ticket_id,))
+    row = cur.fetchone()
+    response_id, summary = (row[1], summarize_resolution(row[2], settings['summary_chars'])) if row else (None, None)
+    cur.execute("""
+        UPDATE support_tickets SET resolution_summary = %s, resolution_response_id = %s
+        WHERE id = %s
+    """, (summary, response_id, ticket_id))
+    return summary
+
+
+# Recompute the stored summaries for many tickets inside the caller's
+# transaction; returns how many were summarized
+def refresh_resolutions(cur, ticket_ids, settings):
+    cur.execute(best_response_query(settings['use_ai_responses'], "r.ticket_id = ANY(%s)"), (list(ticket_ids),))
+    rows = [
+        (ticket_id, response_id, summarize_resolution(text, settings['summary_chars']))
+        for ticket_id, response_id, text in cur.fetchall()
+    ]
+    if rows:
+        execute_values(cur, """
+            UPDATE support_tickets t
+            SET resolution_response_id = v.response_id, resolution_summary = v.summary
+            FROM (VALUES %s) AS v(ticket_id, response_id, summary)
+            WHERE t.id = v.ticket_id
+        """, rows)
+    return len(rows)
+
+
+# Fill summaries for resolved tickets that do not have one yet, in id order,
+# one transaction per batch
+def backfill_resolutions(conn, settings, verbose=True):
+    cur = conn.cursor()
+    last_id = 0
+    updated = 0
+    while True:
+        cur.execute("""
+            SELECT id FROM support_tickets
+            WHERE id > %s AND status = 'resolved' AND resolution_summary IS NULL
+            ORDER BY id
+            LIMIT %s
+        """, (last_id, settings['backfill_batch_size']))
+        ids = [row[0] for row in cur.fetchall()]
+        if not ids:
+            break
+        last_id = ids[-1]
+
+        updated += refresh_resolutions(cur, ids, settings)
+        conn.commit()
+        if verbose:
+            print(f"  summarized {updated} tickets (up to id {last_id})")
+
+    cur.close()
+    return updated
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Build resolution summaries for resolved tickets.')
+    parser.parse_args()
+
+    from app import db_connection
+
+    try:
+        with db_connection() as conn:
+            updated = backfill_resolutions(conn, resolution_settings_from_env())
+    except Exception as e:
+        print(f"Resolution backfill failed: {e}")
+        sys.exit(1)
+    print(f"Summarized {updated} resolved ticket(s).")
@@ -0,0 +1,183 @@
+import hashlib
+import json
+import threading
+import time
+from collections import OrderedDict
+from functools import wraps
+
+from flask import Response, request
+
+
+# In-process LRU backend with per-entry TTL. Group versions expire too (see
+# ResponseCache), so per-ticket groups do not accumulate.
+class MemoryBackend:
+    def __init__(self, max_entries=1024):
+        self.max_entries = max_entries
+        self._lock = threading.Lock()
+        self._entries = OrderedDict()
+        self._counters = OrderedDict()  # name -> (version, expires_at), oldest bump first
+        self._sequence = 0
+
+    def get(self, key):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return None
+            value, expires_at = entry
+            if expires_at < time.monotonic():
+                del self._entries[key]
+                return None
+            self._entries.move_to_end(key)
+            return value
+
+    def set(self, key, value, ttl):
+        with self._lock:
+            self._entries[key] = (value, time.monotonic() + ttl)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def get_counter(self, name):
+        with self._lock:
+            counter = self._counters.get(name)
+            if counter is None or counter[1] < time.monotonic():
+                return 0
+            return counter[0]
+
+    def incr(self, name, ttl):
+        with self._lock:
+            now = time.monotonic()
+            while self._counters:
+                oldest = next(iter(self._counters.values()))
+                if oldest[1] >= now:
+                    break
+                self._counters.popitem(last=False)
+            self._sequence += 1
+            self._counters[name] = (self._sequence, now + ttl)
+            self._counters.move_to_end(name)
+            return self._sequence
+
+
+# Shared backend so every app process sees the same entries and invalidations
+class RedisBackend:
+    def __init__(self, url, prefix='ticket-api:'):
+        try:
+            import redis
+        except ImportError:
+            raise RuntimeError("RESPONSE_CACHE_BACKEND=redis requires the 'redis' package (pip install redis)")
+        self.client = redis.Redis.from_url(url)
+        self.prefix = prefix
+
+    def get(self, key):
+        value = self.client.get(self.prefix + key)
+        return json.loads(value) if value is not None else None
+
+    def set(self, key, value, ttl):
+        self.client.set(self.prefix + key, json.dumps(value), ex=max(1, int(ttl)))
+
+    def get_counter(self, name):
+        value = self.client.get(self.prefix + 'version:' + name)
+        return int(value) if value is not None else 0
+
+    def incr(self, name, ttl):
+        version = self.client.incr(self.prefix + 'version-sequence')
+        self.client.set(self.prefix + 'version:' + name, version, ex=max(1, int(ttl) + 1))
+        return version
+
+
+# Response cache for read-only JSON routes
+#
+# Entries are keyed by route path + sorted query arguments and tagged with
+# one or more invalidation groups. Invalidating a group bumps its version
+# number, which is part of every key in that group, so stale entries are never
+# read again and simply age out; no scan or delete-by-pattern is needed on
+# either backend. A version only has to outlive the entries it guards, so it
+# expires ttl after its last bump and the group reads as version 0 again:
+# entries cached under version 0 predate the first bump and have expired, and
+# versions come from one shared sequence, so a later bump never reuses a
+# version that entries may still be cached under. Every cached response carries an ETag and conditional
+# requests that match it get a 304 with no body.
+class ResponseCache:
+    def __init__(self, backend, ttl=5.0, enabled=True):
+        self.backend = backend
+        self.ttl = ttl
+        self.enabled = enabled
+        self._lock = threading.Lock()
+        self._stats = {'hits': 0, 'misses': 0, 'not_modified': 0, 'invalidations': 0, 'errors': 0}
+
+    def _count(self, name):
+        with self._lock:
+            self._stats[name] += 1
+
+    def _key(self, groups):
+        versions = ','.join(f"{group}@{self.backend.get_counter(group)}" for group in groups)
+        args = '&'.join(f"{k}={v}" for k, v in sorted(request.args.items(multi=True)))
+        return f"{versions}|{request.path}?{args}"
+
+    def invalidate(self, *groups):
+        for group in groups:
+            try:
+                self.backend.incr(group, self.ttl)
+                self._count('invalidations')
+            except Exception as e:
+                self._count('errors')
+                print(f"Error invalidating response cache group {group}: {e}")
+
+    def _respond(self, entry):
+        if entry['etag'] in request.if_none_match:
+            self._count('not_modified')
+            response = Response(status=304)
+        else:
+            response = Response(entry['body'], status=200, mimetype=entry['mimetype'])
+        response.set_etag(entry['etag'])
+        response.headers['Cache-Control'] = 'no-cache'
+        return response
+
+    def cached(self, groups):
+        # groups is a list of group names, or a function of the view kwargs
+        def decorator(view):
+            @wraps(view)
+            def wrapper(*args, **kwargs):
+                if not self.enabled:
+                    return view(*args, **kwargs)
+
+                view_groups = groups(**kwargs) if callable(groups) else groups
+                try:
+                    key = self._key(view_groups)
+                    entry = self.backend.get(key)
+                except Exception as e:
+                    self._count('errors')
+                    print(f"Error reading response cache: {e}")
+                    return view(*args, **kwargs)
+
+                if entry is not None:
+                    self._count('hits')
+                    return self._respond(entry)
+
+                self._count('misses')
+                result = view(*args, **kwargs)
+                response = result if isinstance(result, Response) else None
+                if response is None or response.status_code != 200 or response.is_streamed:
+                    return result
+
+                body = response.get_data(as_text=True)
+                entry = {
+                    'body': body,
+                    'mimetype': response.mimetype,
+                    'etag': hashlib.sha1(body.encode('utf-8')).hexdigest(),
+                }
+                try:
+                    self.backend.set(key, entry, self.ttl)
+                except Exception as e:
+                    self._count('errors')
+                    print(f"Error writing response cache: {e}")
+                return self._respond(entry)
+            return wrapper
+        return decorator
+
+    def stats(self):
+        with self._lock:
+            stats = dict(self._stats)
+        lookups = stats['hits'] + stats['misses']
+        stats['hit_rate'] = (stats['hits'] / lookups) if lookups else 0.0
+        return stats
@@ -0,0 +1,146 @@
+import os
+import threading
+
+from embedding_cache import vector_literal
+
+
+def semantic_cache_settings_from_env():
+    return {
+        'enabled': os.getenv('SEMANTIC_CACHE_ENABLED', 'false').lower() == 'true',
+        'threshold': float(os.getenv('SEMANTIC_CACHE_THRESHOLD', 0.95)),
+        'ttl': int(os.getenv('SEMANTIC_CACHE_TTL', 7 * 24 * 3600)),
+        'max_rows': int(os.getenv('SEMANTIC_CACHE_MAX_ROWS', 10000)),
+        'prune_every': int(os.getenv('SEMANTIC_CACHE_PRUNE_EVERY', 500)),
+    }
+
+
+# Cache of generated suggested responses, looked up by meaning
+#
+# Each entry is the embedding of a ticket that went to the model, its
+# category and sentiment, and the response that came back. A new ticket with
+# the same category and sentiment whose embedding is at least `threshold`
+# cosine-similar to an entry reuses that response. The table is bounded by
+# max_rows and scanned exactly within one (category, sentiment) bucket, so no
+# ANN index is needed and lookups never miss a qualifying entry. Entries
+# expire ttl seconds after they were generated, and beyond max_rows the least
+# recently used ones are evicted.
+class SemanticResponseCache:
+    def __init__(self, settings, connection_factory):
+        self.settings = settings
+        self.connection_factory = connection_factory
+        self._lock = threading.Lock()
+        self._writes_since_prune = 0
+        self._stats = {
+            'lookups': 0, 'hits': 0, 'misses': 0, 'stores': 0,
+            'evictions': 0, 'errors': 0, 'tokens_saved': 0,
+        }
+
+    @property
+    def enabled(self):
+        return self.settings['enabled']
+
+    def _count(self, name, amount=1):
+        with self._lock:
+            self._stats[name] += amount
+
+    def lookup(self, embedding, category, sentiment):
+        if not isinstance(embedding, str):
+            embedding = vector_literal(embedding)
+
+        try:
+            with self.connection_factory() as conn:
+                cur = conn.cursor()
+                cur.execute("""
+                    WITH nearest AS (
+                        SELECT id, 1 - (embedding <=> %s::vector) as similarity
+                        FROM semantic_response_cache
+                        WHERE category = %s AND sentiment = %s
+                          AND created_at >= NOW() - make_interval(secs => %s)
+                        ORDER BY embedding <=> %s::vector
+                        LIMIT 1
+                    )
+                    UPDATE semantic_response_cache c
+                    SET hits = c.hits + 1, last_used_at = NOW()
+                    FROM nearest
+                    WHERE c.id = nearest.id AND nearest.similarity >= %s
+                    RETURNING c.id, c.response_text, c.generation_tokens, nearest.similarity
+                """, (embedding, category, sentiment, self.settings['ttl'], embedding,
+                      self.settings['threshold']))
+                row = cur.fetchone()
+                conn.commit()
+                cur.close()
+        except Exception as e:
+            self._count('errors')
+            print(f"Error reading semantic response cache: {e}")
+            return None
+
+        self._count('lookups')
+        if row is None:
+            self._count('misses')
+            return None
+
+        self._count('hits')
+        self._count('tokens_saved', row[2])
+        return {'id': row[0], 'response_text': row[1], 'tokens': row[2], 'similarity': float(row[3])}
+
+    def store(self, embedding, category, sentiment, response_text, tokens):
+        if not isinstance(embedding, str):
+            embedding = vector_literal(embedding)
+
+        try:
+            with self.connection_factory() as conn:
+                cur = conn.cursor()
+                cur.execute("""
+                    INSERT INTO semantic_response_cache
+                        (category, sentiment, embedding, response_text, generation_tokens)
+                    VALUES (%s, %s, %s::vector, %s, %s)
+                """, (category, sentiment, embedding, response_text, tokens))
+                conn.commit()
+                cur.close()
+        except Exception as e:
+            self._count('errors')
+            print(f"Error writing semantic response cache: {e}")
+            return
+
+        with self._lock:
+            self._stats['stores'] += 1
+            self._writes_since_prune += 1
+            should_prune = self._writes_since_prune >= self.settings['prune_every']
+            if should_prune:
+                self._writes_since_prune = 0
+        if should_prune:
+            self.prune()
+
+    def prune(self):
+        try:
+            with self.connection_factory() as conn:
+                cur = conn.cursor()
+                cur.execute("""
+                    DELETE FROM semantic_response_cache
+                    WHERE created_at < NOW() - make_interval(secs => %s)
+                """, (self.settings['ttl'],))
+                deleted = cur.rowcount
+                cur.execute("""
+                    DELETE FROM semantic_response_cache
+                    WHERE last_used_at < (
+                        SELECT last_used_at FROM semantic_response_cache
+                        ORDER BY last_used_at DESC
+                        OFFSET %s LIMIT 1
+                    )
+                """, (self.settings['max_rows'],))
+                deleted += cur.rowcount
+                conn.commit()
+                cur.close()
+            self._count('evictions', deleted)
+            return deleted
+        except Exception as e:
+            self._count('errors')
+            print(f"Error pruning semantic response cache: {e}")
+            return 0
+
+    def stats(self):
+        with self._lock:
+            stats = dict(self._stats)
+        stats['hit_rate'] = (stats['hits'] / stats['lookups']) if stats['lookups'] else 0.0
+        stats.update(self.settings)
+        return stats
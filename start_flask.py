@@ -1,19 +1,37 @@
-# Inside start_flask.py
+import argparse
+import os
+import sys
 
-from flask import Flask, jsonify # Make sure jsonify is imported if you're returning JSON
+# Launcher for the ticket API
+#
+# By default this runs gunicorn with the settings in gunicorn.conf.py
+# (several preloaded worker processes, graceful shutdown). --dev runs the
+# single-process Flask debug server with auto-reload instead, which is also
+# the option on Windows where gunicorn is not available.
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Start the AI support ticket API.')
+    parser.add_argument('--dev', action='store_true', help='Run the Flask development server')
+    parser.add_argument('--workers', type=int, help='Worker processes (default: WEB_CONCURRENCY or 2 x CPUs + 1)')
+    parser.add_argument('--threads', type=int, help='Threads per worker (default: GUNICORN_THREADS or 8)')
+    parser.add_argument('--bind', help='Address to listen on (default: BIND or 0.0.0.0:5001)')
+    args = parser.parse_args()
 
-app = Flask(__name__)
+    here = os.path.dirname(os.path.abspath(__file__))
+    os.chdir(here)
 
-# ... other routes you might have ...
+    if args.dev:
+        os.execv(sys.executable, [sys.executable, os.path.join(here, 'app.py')])
 
-@app.route('/health', methods=['GET'])
-def health_check():
-    """
-    Health check endpoint for the API.
-    """
-    return jsonify({"status": "healthy", "message": "API is up and running!"}), 200
+    try:
+        import gunicorn  # noqa: F401
+    except ImportError:
+        sys.exit("gunicorn is not installed (pip install gunicorn); use --dev for the development server")
 
-# ... your if __name__ == '__main__': block ...
-if __name__ == '__main__':
-    # Make sure your app.run() matches the port expected by your test_support.py
-    app.run(debug=True, port=5001, host='0.0.0.0')
+    if args.workers:
+        os.environ['WEB_CONCURRENCY'] = str(args.workers)
+    if args.threads:
+        os.environ['GUNICORN_THREADS'] = str(args.threads)
+    if args.bind:
+        os.environ['BIND'] = args.bind
+
+    os.execv(sys.executable, [sys.executable, '-m', 'gunicorn', '-c', 'gunicorn.conf.py', 'wsgi:app'])
@@ -0,0 +1,12 @@
+import os
+import sys
+
+# app reads its configuration at import time: run it against the offline
+# models, with no Postgres-backed caches and the features under test enabled
+os.environ.setdefault('MODEL_PROVIDER', 'local')
+os.environ.setdefault('EMBEDDING_CACHE_PERSIST', 'false')
+os.environ.setdefault('SEMANTIC_CACHE_ENABLED', 'false')
+os.environ.setdefault('DEDUP_ENABLED', 'true')
+os.environ.setdefault('ENRICHMENT_WORKERS', '0')
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
@@ -0,0 +1,36 @@
+import pytest
+
+import app
+
+
+@pytest.fixture
+def client():
+    return app.app.test_client()
+
+
+@pytest.mark.parametrize('query', ['batch_size=abc', 'batch_size=0', 'batch_size=100000',
+                                   'concurrency=-1', 'concurrency=1000'])
+def test_bulk_import_rejects_bad_parameters(client, query):
+    response = client.post(f'/tickets/bulk?{query}', data='')
+
+    assert response.status_code == 400
+    assert 'must be' in response.get_json()['error']
+
+
+@pytest.mark.parametrize('limit', ['abc', '0', '-5'])
+def test_traces_rejects_bad_limit(client, monkeypatch, limit):
+    monkeypatch.setattr(app.tracing.tracer, 'exporter', app.MemoryExporter())
+
+    response = client.get(f'/traces?limit={limit}')
+
+    assert response.status_code == 400
+
+
+def test_traces_caps_limit(client, monkeypatch):
+    exporter = app.MemoryExporter()
+    requested = []
+    monkeypatch.setattr(exporter, 'traces', lambda limit: requested.append(limit) or [])
+    monkeypatch.setattr(app.tracing.tracer, 'exporter', exporter)
+
+    assert client.get('/traces?limit=5000').status_code == 200
+    assert requested == [200]
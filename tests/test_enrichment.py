@@ -0,0 +1,28 @@
+import app
+
+
+DUPLICATE = {
+    'ticket_id': 7,
+    'cluster_id': 3,
+    'classification': {'category': 'Technical Issue', 'priority': 'High', 'sentiment': 'Frustrated',
+                       'urgency_keywords': []},
+    'response_text': 'We are aware of the outage and are working on a fix.',
+}
+
+
+def test_duplicate_reuses_cluster_labels_without_chat_call(monkeypatch):
+    chat_calls = []
+    monkeypatch.setattr(app, 'find_duplicate_ticket', lambda embedding, exclude_id=None: DUPLICATE)
+    monkeypatch.setattr(app.model_client, 'chat', lambda *args, **kwargs: chat_calls.append(kwargs.get('purpose')))
+
+    result = app.enrich_ticket('Dashboard down', 'The dashboard will not load for anyone on our team.',
+                               ticket_id=10, strict=True)
+
+    assert chat_calls == []
+    assert result['duplicate'] is DUPLICATE
+    assert result['classification'] == dict(DUPLICATE['classification'], source='cluster')
+    assert result['ai_response'] == DUPLICATE['response_text']
+
+
+def test_classification_waits_for_duplicate_check():
+    assert 'duplicate' in app.enrichment_pipeline.stages['classification'].deps
@@ -0,0 +1,90 @@
+import time
+from contextlib import contextmanager
+
+import pytest
+
+from job_queue import JobOwnershipLost, JobQueue, WorkerPool
+
+
+class FakeCursor:
+    def __init__(self, rowcount):
+        self.rowcount = rowcount
+        self.statements = []
+
+    def execute(self, sql, params=None):
+        self.statements.append((' '.join(sql.split()), params))
+
+    def close(self):
+        pass
+
+
+class FakeConnection:
+    def __init__(self, rowcount):
+        self.cur = FakeCursor(rowcount)
+
+    def cursor(self):
+        return self.cur
+
+    def commit(self):
+        pass
+
+
+def queue_with_rowcount(rowcount):
+    conn = FakeConnection(rowcount)
+
+    @contextmanager
+    def connection_factory():
+        yield conn
+    return JobQueue(connection_factory, max_attempts=3), conn.cur
+
+
+JOB = {'id': 5, 'ticket_id': 9, 'attempts': 2}
+
+
+def test_complete_only_updates_the_claimed_attempt():
+    queue, cur = queue_with_rowcount(1)
+    queue.complete(JOB)
+
+    sql, params = cur.statements[0]
+    assert "status = 'running' AND attempts = %s" in sql
+    assert params == (5, 2)
+
+
+def test_complete_and_fail_raise_when_the_job_was_reclaimed():
+    queue, cur = queue_with_rowcount(0)
+
+    with pytest.raises(JobOwnershipLost):
+        queue.complete(JOB)
+    with pytest.raises(JobOwnershipLost):
+        queue.fail(dict(JOB, attempts=3), RuntimeError('timeout'))
+    # A lost claim must not mark the ticket failed
+    assert not any('support_tickets' in sql for sql, _ in cur.statements)
+
+
+class ReclaimedQueue:
+    def __init__(self):
+        self.jobs = [dict(JOB)]
+        self.failed = []
+
+    def claim(self):
+        return self.jobs.pop() if self.jobs else None
+
+    def complete(self, job):
+        raise JobOwnershipLost('reclaimed')
+
+    def fail(self, job, error):
+        self.failed.append(job)
+
+
+def test_worker_drops_results_of_a_reclaimed_job():
+    queue = ReclaimedQueue()
+    pool = WorkerPool(queue, lambda job: None, num_workers=1, poll_interval=0.01)
+    pool.start()
+    deadline = time.monotonic() + 2
+    while pool.stats()['lost'] == 0 and time.monotonic() < deadline:
+        time.sleep(0.01)
+    pool.stop(timeout=1)
+
+    assert pool.stats()['lost'] == 1
+    assert pool.stats()['processed'] == 0
+    assert queue.failed == []
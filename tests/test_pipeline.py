@@ -0,0 +1,52 @@
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import pytest
+
+from pipeline import Stage, StageFailed, StagePipeline
+
+
+def test_timeout_counts_from_stage_start_on_saturated_executor():
+    executor = ThreadPoolExecutor(max_workers=1)
+    release = threading.Event()
+    blocker = executor.submit(release.wait)
+    pipeline = StagePipeline([Stage('quick', lambda ctx: 'done', timeout=0.2)], executor)
+
+    # The only thread is busy for longer than the stage's timeout
+    threading.Timer(0.5, release.set).start()
+    results = pipeline.run(strict=True)
+
+    assert results['quick'] == 'done'
+    blocker.result()
+    executor.shutdown()
+
+
+def test_slow_stage_still_times_out():
+    executor = ThreadPoolExecutor(max_workers=2)
+    pipeline = StagePipeline([Stage('slow', lambda ctx: time.sleep(0.5), timeout=0.1,
+                                    fallback=lambda ctx, e: 'fallback')], executor)
+
+    started = time.monotonic()
+    results = pipeline.run()
+
+    assert results['slow'] == 'fallback'
+    assert time.monotonic() - started < 0.4
+    executor.shutdown()
+
+
+def test_timed_out_strict_run_cancels_queued_stages():
+    executor = ThreadPoolExecutor(max_workers=1)
+    ran = []
+
+    # 'hung' holds the only thread past its timeout while 'queued' waits
+    pipeline = StagePipeline([
+        Stage('hung', lambda ctx: time.sleep(0.3), timeout=0.1),
+        Stage('queued', lambda ctx: ran.append('queued'), timeout=1),
+    ], executor)
+
+    with pytest.raises(StageFailed):
+        pipeline.run(strict=True)
+    executor.shutdown(wait=True)
+
+    assert ran == []
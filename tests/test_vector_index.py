@@ -0,0 +1,49 @@
+from vector_index import HNSW_MAX_EF_SEARCH, VectorSearch, index_settings_from_env
+
+
+class RecordingCursor:
+    def __init__(self):
+        self.widths = []
+
+    def execute(self, sql, params=None):
+        if 'set_config' in sql and params:
+            self.widths.append(int(params[0]))
+
+    def fetchall(self):
+        return []
+
+    def close(self):
+        pass
+
+
+class RecordingConnection:
+    def __init__(self):
+        self.cur = RecordingCursor()
+
+    def cursor(self):
+        return self.cur
+
+    def rollback(self):
+        pass
+
+
+def settings(**overrides):
+    return dict(index_settings_from_env(), **overrides)
+
+
+def test_compact_search_width_is_clamped_to_hnsw_maximum():
+    search = VectorSearch(settings(storage='halfvec', rerank_factor=10, overfetch_factor=4))
+    conn = RecordingConnection()
+
+    search.search(conn, [0.0] * 1536, 'Billing', limit=100)
+
+    assert conn.cur.widths == [HNSW_MAX_EF_SEARCH]
+
+
+def test_caller_widths_are_clamped():
+    hnsw = VectorSearch(settings(index_type='hnsw'))
+    ivfflat = VectorSearch(settings(index_type='ivfflat', ivfflat_lists=100))
+
+    assert hnsw._initial_width(3, ef_search=5000) == HNSW_MAX_EF_SEARCH
+    assert ivfflat._initial_width(3, probes=500) == 100
+    assert ivfflat.search_width(10) <= 100
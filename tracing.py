@@ -0,0 +1,150 @@
+import contextvars
+import json
+import os
+import random
+import threading
+import time
+from collections import deque
+from contextlib import contextmanager
+
+_current_span = contextvars.ContextVar('current_span', default=None)
+
+
+class Span:
+    def __init__(self, name, trace_id, parent_id, sampled, attributes):
+        self.name = name
+        self.trace_id = trace_id
+        self.span_id = os.urandom(8).hex()
+        self.parent_id = parent_id
+        self.sampled = sampled
+        self.attributes = dict(attributes)
+        self.status = 'ok'
+        self.start_time = time.time()
+        self._started = time.perf_counter()
+        self.duration = None
+
+    def set_attribute(self, name, value):
+        self.attributes[name] = value
+
+    def to_dict(self):
+        return {
+            'trace_id': self.trace_id,
+            'span_id': self.span_id,
+            'parent_id': self.parent_id,
+            'name': self.name,
+            'start_time': self.start_time,
+            'duration_ms': round(self.duration * 1000, 3) if self.duration is not None else None,
+            'status': self.status,
+            'attributes': self.attributes,
+        }
+
+
+# Exporters receive every finished, sampled span
+class MemoryExporter:
+    def __init__(self, max_spans=5000):
+        self._spans = deque(maxlen=max_spans)
+        self._lock = threading.Lock()
+
+    def export(self, span):
+        with self._lock:
+            self._spans.append(span.to_dict())
+
+    def traces(self, limit=20):
+        # Most recent traces first, each with its spans in start order
+        with self._lock:
+            spans = list(self._spans)
+        traces = {}
+        for span in reversed(spans):
+            if span['trace_id'] not in traces:
+                if len(traces) >= limit:
+                    continue
+                traces[span['trace_id']] = []
+            traces[span['trace_id']].append(span)
+        return [
+            {'trace_id': trace_id, 'spans': sorted(trace_spans, key=lambda s: s['start_time'])}
+            for trace_id, trace_spans in traces.items()
+        ]
+
+
+class JsonlExporter(MemoryExporter):
+    # Keeps the in-memory view and also appends one JSON line per span
+    def __init__(self, path, max_spans=5000):
+        super().__init__(max_spans)
+        self.path = path
+        self._file_lock = threading.Lock()
+
+    def export(self, span):
+        super().export(span)
+        line = json.dumps(span.to_dict(), default=str) + '\n'
+        with self._file_lock:
+            with open(self.path, 'a') as f:
+                f.write(line)
+
+
+# Lightweight span tracing
+#
+# The current span lives in a context variable, so nested span() calls form
+# a tree without passing anything around; work handed to other threads keeps
+# its parent when submitted through contextvars.copy_context() (as the
+# enrichment pipeline does). Sampling is decided once per trace at the root
+# span. When tracing is not configured span() is a no-op.
+class Tracer:
+    def __init__(self, exporter=None, sample_rate=1.0):
+        self.exporter = exporter
+        self.sample_rate = sample_rate
+
+    @property
+    def enabled(self):
+        return self.exporter is not None
+
+    def start(self, name, **attributes):
+        parent = _current_span.get()
+        if parent is None:
+            trace_id = os.urandom(16).hex()
+            sampled = random.random() < self.sample_rate
+            span = Span(name, trace_id, None, sampled, attributes)
+        else:
+            span = Span(name, parent.trace_id, parent.span_id, parent.sampled, attributes)
+        return span, _current_span.set(span)
+
+    def finish(self, span, token, error=None):
+        span.duration = time.perf_counter() - span._started
+        if error is not None:
+            span.status = 'error'
+            span.attributes['error'] = f"{type(error).__name__}: {error}"
+        _current_span.reset(token)
+        if span.sampled:
+            try:
+                self.exporter.export(span)
+            except Exception as e:
+                print(f"Error exporting span {span.name}: {e}")
+
+    @contextmanager
+    def span(self, name, **attributes):
+        if not self.enabled:
+            yield None
+            return
+        span, token = self.start(name, **attributes)
+        try:
+            yield span
+        except BaseException as e:
+            self.finish(span, token, error=e)
+            raise
+        else:
+            self.finish(span, token)
+
+
+tracer = Tracer()
+
+
+def configure(exporter, sample_rate=1.0):
+    tracer.exporter = exporter
+    tracer.sample_rate = sample_rate
+
+
+def span(name, **attributes):
+    return tracer.span(name, **attributes)
+
+
+def current_span():
+    return _current_span.get()
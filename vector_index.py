@@ -0,0 +1,385 @@
+import argparse
+import os
+import re
+import sys
+
+from embedding_cache import vector_literal
+
+INDEX_PREFIX = 'idx_support_tickets_embedding'
+FULL_DIMENSIONS = 1536
+COMPACT_TRIGGER = 'support_tickets_compact_embedding'
+HNSW_MAX_EF_SEARCH = 1000
+
+# Compact copies of the embedding column used for the ANN pass: column,
+# column type, operator, operator class and the SQL expression that derives
+# the compact value from a full vector (with {dims} dimensions kept)
+COMPACT_STORAGE = {
+    'halfvec': ('embedding_half', 'halfvec({dims})', '<=>', 'halfvec_cosine_ops',
+                "l2_normalize(subvector({source}, 1, {dims}))::halfvec({dims})"),
+    'binary': ('embedding_bits', 'bit({dims})', '<~>', 'bit_hamming_ops',
+               "binary_quantize(subvector({source}, 1, {dims}))::bit({dims})"),
+}
+
+
+def index_settings_from_env():
+    categories = os.getenv('VECTOR_PARTIAL_INDEX_CATEGORIES', '')
+    return {
+        'index_type': os.getenv('VECTOR_INDEX_TYPE', 'hnsw'),
+        'hnsw_m': int(os.getenv('HNSW_M', 16)),
+        'hnsw_ef_construction': int(os.getenv('HNSW_EF_CONSTRUCTION', 64)),
+        'hnsw_ef_search': int(os.getenv('HNSW_EF_SEARCH', 40)),
+        'ivfflat_lists': int(os.getenv('IVFFLAT_LISTS', 100)),
+        'ivfflat_probes': int(os.getenv('IVFFLAT_PROBES', 10)),
+        'iterative_scan': os.getenv('VECTOR_ITERATIVE_SCAN', 'off'),
+        'overfetch_factor': int(os.getenv('VECTOR_OVERFETCH_FACTOR', 4)),
+        'max_search_rounds': int(os.getenv('VECTOR_MAX_SEARCH_ROUNDS', 3)),
+        'partial_index_categories': [c.strip() for c in categories.split(',') if c.strip()],
+        'index_all_tickets': os.getenv('VECTOR_INDEX_ALL_TICKETS', 'true').lower() == 'true',
+        'storage': os.getenv('VECTOR_STORAGE', 'full'),
+        'compact_dimensions': int(os.getenv('VECTOR_COMPACT_DIMENSIONS', FULL_DIMENSIONS)),
+        'rerank_factor': int(os.getenv('VECTOR_RERANK_FACTOR', 10)),
+        'backfill_batch_size': int(os.getenv('VECTOR_BACKFILL_BATCH_SIZE', 1000)),
+    }
+
+
+def category_slug(category):
+    return re.sub(r'[^a-z0-9]+', '_', category.lower()).strip('_')
+
+
+def compact_storage(settings):
+    storage = settings['storage']
+    if storage == 'full':
+        return None
+    if storage not in COMPACT_STORAGE:
+        raise ValueError(f"Unsupported vector storage: {storage}")
+    dims = settings['compact_dimensions']
+    if not 0 < dims <= FULL_DIMENSIONS:
+        raise ValueError(f"VECTOR_COMPACT_DIMENSIONS must be between 1 and {FULL_DIMENSIONS}")
+    column, column_type, operator, opclass, expression = COMPACT_STORAGE[storage]
+    return {
+        'column': column,
+        'type': column_type.format(dims=dims),
+        'operator': operator,
+        'opclass': opclass,
+        'expression': lambda source: expression.format(source=source, dims=dims),
+    }
+
+
+# Index definitions for the configured settings. Similarity search only ever
+# looks at resolved tickets, so its index is partial on status = 'resolved';
+# per-category indexes narrow that further for the busiest categories. /search
+# can look at tickets in any status, which none of those indexes can answer,
+# so with index_all_tickets on a further index covers every ticket (at the
+# cost of maintaining it on every insert). With
+# compact storage the index covers the compact column instead of the full
+# vectors, which is what keeps it small enough to stay in memory.
+def index_definitions(settings):
+    compact = compact_storage(settings)
+    if compact:
+        column, opclass = compact['column'], compact['opclass']
+        suffix = f"_{settings['storage']}"
+    else:
+        column, opclass, suffix = 'embedding', 'vector_cosine_ops', ''
+
+    if settings['index_type'] == 'hnsw':
+        method = 'hnsw'
+        options = f"WITH (m = {settings['hnsw_m']}, ef_construction = {settings['hnsw_ef_construction']})"
+    elif settings['index_type'] == 'ivfflat':
+        method = 'ivfflat'
+        options = f"WITH (lists = {settings['ivfflat_lists']})"
+    else:
+        raise ValueError(f"Unsupported vector index type: {settings['index_type']}")
+
+    definitions = [(
+        f"{INDEX_PREFIX}_{method}{suffix}",
+        f"USING {method} ({column} {opclass}) {options} WHERE status = 'resolved'",
+        None,
+    )]
+    for category in settings['partial_index_categories']:
+        definitions.append((
+            f"{INDEX_PREFIX}_{method}{suffix}_{category_slug(category)}",
+            f"USING {method} ({column} {opclass}) {options} "
+            f"WHERE status = 'resolved' AND category = %s",
+            category,
+        ))
+    if settings['index_all_tickets']:
+        definitions.append((f"{INDEX_PREFIX}_{method}{suffix}_any_status",
+                            f"USING {method} ({column} {opclass}) {options}", None))
+    return definitions
+
+
+def existing_indexes(cur):
+    cur.execute("""
+        SELECT indexname, indexdef FROM pg_indexes
+        WHERE tablename = 'support_tickets'
+          AND (indexdef ILIKE '%%(embedding vector_%%' OR indexname LIKE %s)
+    """, (INDEX_PREFIX + '%',))
+    return cur.fetchall()
+
+
+def column_type(cur, column):
+    cur.execute("""
+        SELECT format_type(atttypid, atttypmod) FROM pg_attribute
+        WHERE attrelid = 'support_tickets'::regclass AND attname = %s AND NOT attisdropped
+    """, (column,))
+    row = cur.fetchone()
+    return row[0] if row else None
+
+
+# Compact column migration
+#
+# Adds the compact column for the configured storage (replacing it if the
+# dimensions changed), installs a trigger that derives it from `embedding` on
+# every insert and embedding update, then fills existing rows in id order,
+# batch_size rows per transaction so the table is never locked for long.
+# Compact columns of other storage modes are dropped. Requires pgvector 0.7+.
+def apply_compact_storage(conn, settings, verbose=True):
+    compact = compact_storage(settings)
+    cur = conn.cursor()
+
+    for column, *_rest in COMPACT_STORAGE.values():
+        if compact and column == compact['column']:
+            continue
+        if column_type(cur, column):
+            if verbose:
+                print(f"Dropping compact column {column}...")
+            cur.execute(f"DROP TRIGGER IF EXISTS {COMPACT_TRIGGER} ON support_tickets")
+            cur.execute(f"ALTER TABLE support_tickets DROP COLUMN IF EXISTS {column}")
+
+    if not compact:
+        cur.close()
+        return 0
+
+    column = compact['column']
+    existing = column_type(cur, column)
+    if existing and existing != compact['type']:
+        if verbose:
+            print(f"Replacing {column} {existing} with {compact['type']}...")
+        cur.execute(f"ALTER TABLE support_tickets DROP COLUMN {column}")
+        existing = None
+    if not existing:
+        cur.execute(f"ALTER TABLE support_tickets ADD COLUMN {column} {compact['type']}")
+
+    cur.execute(f"""
+        CREATE OR REPLACE FUNCTION {COMPACT_TRIGGER}() RETURNS trigger AS $$
+        BEGIN
+            NEW.{column} := CASE WHEN NEW.embedding IS NULL THEN NULL
+                                 ELSE {compact['expression']('NEW.embedding')} END;
+            RETURN NEW;
+        END;
+        $$ LANGUAGE plpgsql;
+
+        DROP TRIGGER IF EXISTS {COMPACT_TRIGGER} ON support_tickets;
+        CREATE TRIGGER {COMPACT_TRIGGER}
+            BEFORE INSERT OR UPDATE OF embedding ON support_tickets
+            FOR EACH ROW EXECUTE FUNCTION {COMPACT_TRIGGER}();
+    """)
+
+    converted = 0
+    last_id = 0
+    while True:
+        cur.execute(f"""
+            WITH batch AS (
+                SELECT id FROM support_tickets
+                WHERE id > %s AND embedding IS NOT NULL AND {column} IS NULL
+                ORDER BY id
+                LIMIT %s
+            )
+            UPDATE support_tickets t
+            SET {column} = {compact['expression']('t.embedding')}
+            FROM batch
+            WHERE t.id = batch.id
+            RETURNING t.id
+        """, (last_id, settings['backfill_batch_size']))
+        ids = [row[0] for row in cur.fetchall()]
+        if not ids:
+            break
+        last_id = max(ids)
+        converted += len(ids)
+        if verbose:
+            print(f"  converted {converted} rows (up to id {last_id})")
+
+    cur.close()
+    return converted
+
+
+# Create the configured ANN indexes and drop any other embedding indexes
+# (including the unmanaged ivfflat index from the original setup guide).
+# Indexes are built CONCURRENTLY so tickets can still be written meanwhile.
+def apply_indexes(conn, settings, rebuild=False, verbose=True):
+    previous_autocommit = conn.autocommit
+    conn.rollback()
+    conn.autocommit = True
+    try:
+        # Fill the compact column before indexing it
+        apply_compact_storage(conn, settings, verbose=verbose)
+
+        cur = conn.cursor()
+        wanted = index_definitions(settings)
+        wanted_names = {name for name, _, _ in wanted}
+
+        for name, _ in existing_indexes(cur):
+            if name not in wanted_names or rebuild:
+                if verbose:
+                    print(f"Dropping {name}...")
+                cur.execute(f"DROP INDEX CONCURRENTLY IF EXISTS {name}")
+
+        for name, definition, category in wanted:
+            if verbose:
+                print(f"Creating {name}...")
+            sql = f"CREATE INDEX CONCURRENTLY IF NOT EXISTS {name} ON support_tickets {definition}"
+            cur.execute(sql, (category,) if category else None)
+
+        cur.execute("ANALYZE support_tickets")
+        cur.close()
+    finally:
+        conn.autocommit = previous_autocommit
+
+
+# Similarity search over the managed indexes
+#
+# ANN indexes return the ef_search / probes nearest candidates *before* the
+# category and status filters are applied, so a narrow category can come back
+# short. Each query starts with the search width raised to cover an
+# over-fetched candidate set and doubles it (up to max_search_rounds) until
+# enough filtered rows come back. With VECTOR_ITERATIVE_SCAN set (pgvector
+# 0.8+) the index keeps scanning until the filters are satisfied instead.
+#
+# With compact storage the index scan fetches rerank_factor times as many
+# candidates by their halfvec / binary distance, and only those candidates
+# have their full vectors read to compute the exact distance they are ranked
+# and returned by.
+class VectorSearch:
+    def __init__(self, settings):
+        self.settings = settings
+        self.compact = compact_storage(settings)
+
+    # ANN ordering expression; source is the query vector (a placeholder by
+    # default, or a column reference inside a LATERAL join)
+    def order_sql(self, source='%s::vector'):
+        if not self.compact:
+            return f"embedding <=> {source}"
+        return f"{self.compact['column']} {self.compact['operator']} {self.compact['expression'](source)}"
+
+    # pgvector rejects hnsw.ef_search above 1000, and probes beyond the
+    # number of lists scan nothing more
+    def max_width(self):
+        return HNSW_MAX_EF_SEARCH if self.settings['index_type'] == 'hnsw' else self.settings['ivfflat_lists']
+
+    def search_width(self, candidates):
+        if self.settings['index_type'] == 'hnsw':
+            return min(max(self.settings['hnsw_ef_search'], candidates), self.max_width())
+        return min(self.settings['ivfflat_probes'], self.max_width())
+
+    def _query(self, embedding, category, limit):
+        if not self.compact:
+            return """
+                SELECT id, subject, message, category,
+                       embedding <=> %s::vector as similarity, resolution_summary
+                FROM support_tickets
+                WHERE category = %s AND status = 'resolved'
+                ORDER BY embedding <=> %s::vector
+                LIMIT %s
+            """, (embedding, category, embedding, limit)
+
+        return f"""
+            SELECT id, subject, message, category, embedding <=> %s::vector as similarity,
+                   resolution_summary
+            FROM (
+                SELECT id, subject, message, category, embedding, resolution_summary
+                FROM support_tickets
+                WHERE category = %s AND status = 'resolved'
+                ORDER BY {self.order_sql()}
+                LIMIT %s
+            ) candidates
+            ORDER BY similarity
+            LIMIT %s
+        """, (embedding, category, embedding, limit * self.settings['rerank_factor'], limit)
+
+    def set_search_width(self, cur, width):
+        if self.settings['index_type'] == 'hnsw':
+            cur.execute("SELECT set_config('hnsw.ef_search', %s, true)", (str(width),))
+            if self.settings['iterative_scan'] != 'off':
+                cur.execute("SELECT set_config('hnsw.iterative_scan', %s, true)",
+                            (self.settings['iterative_scan'],))
+        else:
+            cur.execute("SELECT set_config('ivfflat.probes', %s, true)", (str(width),))
+            if self.settings['iterative_scan'] != 'off':
+                cur.execute("SELECT set_config('ivfflat.iterative_scan', 'relaxed_order', true)")
+
+    # Caller-supplied ef_search / probes are clamped like the computed width
+    def _initial_width(self, limit, ef_search=None, probes=None):
+        if self.settings['index_type'] == 'hnsw':
+            width = ef_search or self.settings['hnsw_ef_search']
+            if self.compact:
+                limit *= self.settings['rerank_factor']
+            width = max(width, limit * self.settings['overfetch_factor'])
+        else:
+            width = probes or self.settings['ivfflat_probes']
+        return max(1, min(width, self.max_width()))
+
+    def search(self, conn, embedding, category, limit=3, ef_search=None, probes=None):
+        if not isinstance(embedding, str):
+            embedding = vector_literal(embedding)
+
+        width = self._initial_width(limit, ef_search, probes)
+        max_width = self.max_width()
+        cur = conn.cursor()
+        try:
+            for _ in range(max(1, self.settings['max_search_rounds'])):
+                # set_config(..., true) only lasts until the end of this transaction
+                self.set_search_width(cur, width)
+                cur.execute(*self._query(embedding, category, limit))
+                rows = cur.fetchall()
+                conn.rollback()
+
+                if len(rows) >= limit or width >= max_width:
+                    break
+                width = min(width * 2, max_width)
+            return rows
+        finally:
+            cur.close()
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Create or rebuild the ticket embedding ANN indexes.')
+    parser.add_argument('--type', choices=['hnsw', 'ivfflat'],
+                        help='Index type (defaults to VECTOR_INDEX_TYPE)')
+    parser.add_argument('--storage', choices=['full', 'halfvec', 'binary'],
+                        help='Vector storage for the ANN pass (defaults to VECTOR_STORAGE)')
+    parser.add_argument('--dimensions', type=int,
+                        help='Dimensions kept in compact storage (defaults to VECTOR_COMPACT_DIMENSIONS)')
+    parser.add_argument('--partial-categories',
+                        help='Comma-separated categories that get their own partial index')
+    parser.add_argument('--rebuild', action='store_true',
+                        help='Drop and recreate indexes even if they already exist')
+    parser.add_argument('--status', action='store_true', help='List existing embedding indexes and exit')
+    args = parser.parse_args()
+
+    from app import db_connection
+
+    settings = index_settings_from_env()
+    if args.type:
+        settings['index_type'] = args.type
+    if args.storage:
+        settings['storage'] = args.storage
+    if args.dimensions:
+        settings['compact_dimensions'] = args.dimensions
+    if args.partial_categories is not None:
+        settings['partial_index_categories'] = [
+            c.strip() for c in args.partial_categories.split(',') if c.strip()
+        ]
+
+    try:
+        with db_connection() as conn:
+            if args.status:
+                cur = conn.cursor()
+                for name, definition in existing_indexes(cur):
+                    print(f"{name}: {definition}")
+                cur.close()
+            else:
+                apply_indexes(conn, settings, rebuild=args.rebuild)
+                print("Vector indexes are up to date.")
+    except Exception as e:
+        print(f"Index migration failed: {e}")
+        sys.exit(1)
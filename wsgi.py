@@ -0,0 +1,7 @@
+# WSGI entry point for production servers:
+#
+#     gunicorn -c gunicorn.conf.py wsgi:app
+#
+# Servers other than gunicorn should call app.init_worker() in each worker
+# process after it forks and app.shutdown() before it exits.
+from app import app